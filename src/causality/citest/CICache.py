@@ -0,0 +1,190 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import collections.abc
+import sys
+
+# rough per-entry overhead of the ordered dictionary (hash table slot and linked list node)
+_ENTRY_OVERHEAD = 100
+
+
+class CICache(collections.abc.MutableMapping):
+    """
+    A memory-bounded cache of CI test outcomes, keyed by (relVar1, relVar2, conditioning variables) triples as used
+    by RCD and RCDLight.
+    Keys are stored compactly as tuples of small integers: each relational variable is interned once and referred to
+    by its index afterwards.
+    If maxBytes is given, the least recently used entries are evicted whenever the estimated size of the entries
+    exceeds it. Entries the learner has retired, i.e., tests of a pair of variables whose dependency is already
+    decided (retirePair) and tests below the current conditioning set size of Phase I (retireBelowDepth), are evicted
+    first: the scanWindow least recently used entries are searched for retired ones before anything else goes.
+    Evicting an entry never changes a result; the test is simply run again if it is needed.
+    stats() reports hits, misses, evictions, and the estimated size.
+    """
+
+    def __init__(self, maxBytes=None, scanWindow=64):
+        if maxBytes is not None and maxBytes <= 0:
+            raise Exception("maxBytes must be positive or None: found {}".format(maxBytes))
+        self.maxBytes = maxBytes
+        self.scanWindow = scanWindow
+        self.variableIds = {}
+        self.variables = []
+        self.entries = collections.OrderedDict()  # packed key -> outcome, least recently used first
+        self.retiredPairs = set()
+        self.retiredDepth = 0
+        self.numBytes = 0
+        self.record = {'hits': 0, 'misses': 0, 'evictions': 0, 'retiredEvictions': 0, 'peakBytes': 0}
+
+
+    def __getitem__(self, key):
+        packedKey = self._pack(key, intern=False)
+        if packedKey is None or packedKey not in self.entries:
+            raise KeyError(key)
+        self.entries.move_to_end(packedKey)
+        return self.entries[packedKey]
+
+
+    # the learners look a test up before running it, so hits and misses are counted here
+    def __contains__(self, key):
+        packedKey = self._pack(key, intern=False)
+        if packedKey is None or packedKey not in self.entries:
+            self.record['misses'] += 1
+            return False
+        self.record['hits'] += 1
+        return True
+
+
+    def __setitem__(self, key, outcome):
+        packedKey = self._pack(key)
+        if packedKey in self.entries:
+            self.numBytes -= _entryBytes(packedKey, self.entries[packedKey])
+        self.entries[packedKey] = outcome
+        self.entries.move_to_end(packedKey)
+        self.numBytes += _entryBytes(packedKey, outcome)
+        self.record['peakBytes'] = max(self.record['peakBytes'], self.numBytes)
+        if self.maxBytes is not None:
+            self._evict()
+
+
+    def __delitem__(self, key):
+        packedKey = self._pack(key, intern=False)
+        if packedKey is None or packedKey not in self.entries:
+            raise KeyError(key)
+        self.numBytes -= _entryBytes(packedKey, self.entries.pop(packedKey))
+
+
+    def __iter__(self):
+        for packedKey in list(self.entries):
+            yield self._unpack(packedKey)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def items(self):
+        return [(self._unpack(packedKey), outcome) for packedKey, outcome in self.entries.items()]
+
+
+    def copy(self):
+        cache = CICache(self.maxBytes, self.scanWindow)
+        cache.variableIds = dict(self.variableIds)
+        cache.variables = list(self.variables)
+        cache.entries = collections.OrderedDict(self.entries)
+        cache.retiredPairs = set(self.retiredPairs)
+        cache.retiredDepth = self.retiredDepth
+        cache.numBytes = self.numBytes
+        cache.record['peakBytes'] = self.numBytes
+        return cache
+
+
+    def retirePair(self, relVar1, relVar2):
+        """
+        Marks the tests between relVar1 and relVar2 (in either direction) as the first to evict.
+        """
+        if relVar1 in self.variableIds and relVar2 in self.variableIds:
+            self.retiredPairs.add(_pairOf(self.variableIds[relVar1], self.variableIds[relVar2]))
+
+
+    def retireBelowDepth(self, depth):
+        """
+        Marks the tests with fewer than depth conditioning variables as the first to evict. 0 lifts the mark.
+        """
+        self.retiredDepth = depth
+
+
+    def stats(self):
+        stats = dict(self.record)
+        stats['entries'] = len(self.entries)
+        stats['bytes'] = self.numBytes
+        stats['variables'] = len(self.variables)
+        return stats
+
+
+    def _isRetired(self, packedKey):
+        return len(packedKey) - 2 < self.retiredDepth or _pairOf(packedKey[0], packedKey[1]) in self.retiredPairs
+
+
+    def _evict(self):
+        while self.numBytes > self.maxBytes and len(self.entries) > 1:
+            retired = [packedKey for packedKey in _head(self.entries, min(self.scanWindow, len(self.entries) - 1))
+                       if self._isRetired(packedKey)]
+            for packedKey in retired:
+                self._drop(packedKey)
+                self.record['retiredEvictions'] += 1
+                if self.numBytes <= self.maxBytes:
+                    return
+            if not retired:
+                self._drop(next(iter(self.entries)))
+
+
+    def _drop(self, packedKey):
+        self.numBytes -= _entryBytes(packedKey, self.entries.pop(packedKey))
+        self.record['evictions'] += 1
+
+
+    def _pack(self, key, intern=True):
+        relVar1, relVar2, condRelVars = key
+        ids = []
+        for relVar in (relVar1, relVar2) + tuple(condRelVars):
+            if relVar not in self.variableIds:
+                if not intern:
+                    return None
+                self.variableIds[relVar] = len(self.variables)
+                self.variables.append(relVar)
+            ids.append(self.variableIds[relVar])
+        return tuple(ids)
+
+
+    def _unpack(self, packedKey):
+        variables = [self.variables[i] for i in packedKey]
+        return variables[0], variables[1], tuple(variables[2:])
+
+
+def _pairOf(id1, id2):
+    return (id1, id2) if id1 < id2 else (id2, id1)
+
+
+def _head(entries, n):
+    iterator = iter(entries)
+    return [next(iterator) for _ in range(n)]
+
+
+def _entryBytes(packedKey, outcome):
+    outcomeBytes = sys.getsizeof(outcome)
+    if hasattr(outcome, '__dict__'):
+        outcomeBytes += sum(sys.getsizeof(value) for value in vars(outcome).values())
+    return sys.getsizeof(packedKey) + outcomeBytes + _ENTRY_OVERHEAD
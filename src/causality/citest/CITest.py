@@ -30,23 +30,99 @@
 
 import collections
 import functools
+import inspect
+import math
+import sys
+import zlib
 from causality.model.RelationalDependency import RelationalVariable
 from causality.model.Aggregator import AverageAggregator
 from causality.model.Aggregator import IdentityAggregator
 from causality.model import ParserUtil
 from causality.dseparation.DSeparation import DSeparation
-import rpy2.robjects as robjects
-r = robjects.r
 import logging
 
 logger = logging.getLogger(__name__)
 
+_robjects = None
+
+
+def loadR():
+    """
+    Imports rpy2, which starts R, on first use. Importing this module (e.g., for Oracle) thus never requires R.
+    """
+    global _robjects
+    if _robjects is None:
+        logger.info("loading R through rpy2")
+        import rpy2.robjects
+        _robjects = rpy2.robjects
+    return _robjects
+
+
+class CITestResult(object):
+    """
+    Outcome of a statistical CI test. Keeps the p-value and the effect size (None if the test has no notion of one)
+    so that a cached test can be decided again under different alpha and strength-of-effect thresholds.
+    """
+
+    def __init__(self, pval, effectSize=None):
+        self.pval = pval
+        self.effectSize = effectSize
+
+
+    def isIndependent(self, alpha, soeThreshold=None):
+        if self.pval > alpha:
+            return True
+        return soeThreshold is not None and self.effectSize is not None and self.effectSize < soeThreshold
+
+
+    def __repr__(self):
+        return "{}(pval={}, effectSize={})".format(self.__class__.__name__, self.pval, self.effectSize)
+
+
+class ScreenedCITestResult(CITestResult):
+    """
+    Outcome of a test that ScreeningCITest decided on a subsample. Keeps the decision it was accepted for along with
+    the thresholds (alpha, soeThreshold) of the tester at the time, since a screen-stage p-value must not be decided
+    like a full one. Under other thresholds, ScreeningCITest.decide checks the screen again and, if it is no longer
+    decisive, runs the full test (the test triple is kept for that) and keeps its result in fullResult.
+    """
+
+    def __init__(self, pval, effectSize, test, alpha, soeThreshold, independent):
+        super(ScreenedCITestResult, self).__init__(pval, effectSize)
+        self.test = test
+        self.alpha = alpha
+        self.soeThreshold = soeThreshold
+        self.independent = independent
+        self.fullResult = None
+
+
 class CITest(object):
 
     def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
         raise NotImplementedError
 
 
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        """
+        Returns the raw outcome of a test, which is what learners store in their CI caches. decide turns an outcome
+        into a boolean under the current settings of the tester. By default, the outcome is the boolean itself.
+        """
+        return self.isConditionallyIndependent(relVar1Str, relVar2Str, condRelVarStrs)
+
+
+    def testConditionalIndependenceBatch(self, tests):
+        """
+        tests is a sequence of (relVar1, relVar2, condRelVars) triples that do not depend on each other's outcome.
+        Returns a list of outcomes in the same order. Subclasses may evaluate a batch in parallel.
+        """
+        return [self.testConditionalIndependence(relVar1, relVar2, condRelVars)
+                for relVar1, relVar2, condRelVars in tests]
+
+
+    def decide(self, result):
+        return result
+
+
 class LinearCITest(CITest):
 
     def __init__(self, schema, dataStore, alpha=0.05, soeThreshold=0.01):
@@ -57,37 +133,20 @@ class LinearCITest(CITest):
 
 
     def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs, sampleRate=1.0, sampleSeed=0):
+        """
+        Returns a CITestResult. With sampleRate < 1, the test runs on a reproducible subsample of the base items
+        (see getAggregatedData).
+        """
         logger.debug("testing %s _||_ %s | { %s }", relVar1Str, relVar2Str, condRelVarStrs)
-        if not isinstance(relVar1Str, str) and not isinstance(relVar1Str, RelationalVariable) or not relVar1Str:
-            raise Exception("relVar1Str must be a parseable RelationalVariable string")
-        if not isinstance(relVar2Str, str) and not isinstance(relVar2Str, RelationalVariable) or not relVar2Str:
-            raise Exception("relVar2Str must be a parseable RelationalVariable string")
-        if not isinstance(condRelVarStrs, collections.Iterable) or isinstance(condRelVarStrs, str):
-            raise Exception("condRelVarStrs must be a sequence of parseable RelationalVariable strings")
-
-        relVar1 = ParserUtil.parseRelVar(relVar1Str)
-        relVar2 = ParserUtil.parseRelVar(relVar2Str)
-        if len(relVar2.path) > 1:
-            raise Exception("relVar2Str must have a singleton path")
-
-        baseItemName = relVar1.getBaseItemName()
-        relVarAggrs = [AverageAggregator(relVar1Str), IdentityAggregator(relVar2Str)]
-        relVarAggrs.extend([AverageAggregator(condRelVarStr) for condRelVarStr in condRelVarStrs])
-
-        relVar1Data = []
-        relVar2Data = []
-        condVarsData = []
-        for i in range(len(condRelVarStrs)):
-            condVarsData.append([])
-
-        for idVal, row in self.dataStore.getValuesForRelVarAggrs(self.schema, baseItemName, relVarAggrs):
-            if None in row:
-                continue
-            relVar1Data.append(float(row[0]))
-            relVar2Data.append(float(row[1]))
-            for i, value in enumerate(row[2:]):
-                condVarsData[i].append(float(value))
+        relVar1Data, relVar2Data, condVarsData = getAggregatedData(self.schema, self.dataStore, relVar1Str,
+                                                                   relVar2Str, condRelVarStrs, sampleRate, sampleSeed)
 
+        robjects = loadR()
+        r = robjects.r
         robjects.baseenv['treatment'] = robjects.FloatVector(relVar1Data)
         robjects.baseenv['outcome'] = robjects.FloatVector(relVar2Data)
         for i, condVarData in enumerate(condVarsData):
@@ -107,16 +166,170 @@ class LinearCITest(CITest):
 
         pval =  summary.rx2('coefficients').rx(2,4)[0]
         logger.debug('soe: {}, pval: {}'.format(effectSize, pval))
-        return pval > self.alpha or effectSize < self.soeThreshold
+        return CITestResult(pval, effectSize)
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+class ScreeningCITest(CITest):
+    """
+    Two-stage CI testing. Wraps a tester that supports subsampling (see LinearCITest.testConditionalIndependence).
+    Each test is first run on a reproducible subsample of the base items. The screen's outcome is accepted as a
+    dependence if its p-value is at least dependenceMargin orders of magnitude below alpha (and the effect size
+    clears the strength-of-effect threshold), and as an independence if its p-value lies in the top
+    (1 - independenceMargin) of the range from alpha to 1 on a log scale, i.e.,
+    log10(pval) >= (1 - independenceMargin) * log10(alpha); with alpha = 0.05 and the default 0.5, pval >= 0.22.
+    Otherwise, the test is run again on the full population. Outcomes decided by the screen are returned as
+    ScreenedCITestResults, so that learners reusing a cache under other thresholds (e.g., sweepRCDLight) decide them
+    with the margins again instead of as full tests.
+    screenRecord counts how many tests were decided by the screen and how many needed the full test.
+    """
+
+    def __init__(self, ciTest, sampleRate=0.1, dependenceMargin=2.0, independenceMargin=0.5, sampleSeed=0):
+        parameters = inspect.signature(ciTest.testConditionalIndependence).parameters
+        if 'sampleRate' not in parameters or 'sampleSeed' not in parameters:
+            raise Exception("ScreeningCITest needs a tester that supports subsampling (sampleRate and sampleSeed): "
+                            "found {}".format(ciTest.__class__.__name__))
+        if not 0 < sampleRate <= 1:
+            raise Exception("sampleRate must be in (0, 1]: found {}".format(sampleRate))
+        if dependenceMargin < 0:
+            raise Exception("dependenceMargin must be non-negative: found {}".format(dependenceMargin))
+        if not 0 <= independenceMargin <= 1:
+            raise Exception("independenceMargin must be in [0, 1]: found {}".format(independenceMargin))
+        self.ciTest = ciTest
+        self.sampleRate = sampleRate
+        self.dependenceMargin = dependenceMargin
+        self.independenceMargin = independenceMargin
+        self.sampleSeed = sampleSeed
+        self.screenRecord = {'screened': 0, 'full': 0}
+
+
+    # thresholds live in the wrapped tester (e.g., for sweepRCDLight)
+    @property
+    def alpha(self):
+        return self.ciTest.alpha
+
+
+    @alpha.setter
+    def alpha(self, alpha):
+        self.ciTest.alpha = alpha
+
+
+    @property
+    def soeThreshold(self):
+        return self.ciTest.soeThreshold
+
+
+    @soeThreshold.setter
+    def soeThreshold(self, soeThreshold):
+        self.ciTest.soeThreshold = soeThreshold
+
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        result = self.ciTest.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs,
+                                                         sampleRate=self.sampleRate, sampleSeed=self.sampleSeed)
+        if self._isDecisive(result):
+            self.screenRecord['screened'] += 1
+            return ScreenedCITestResult(result.pval, result.effectSize, (relVar1Str, relVar2Str, condRelVarStrs),
+                                        self.alpha, self.soeThreshold, self.ciTest.decide(result))
+        self.screenRecord['full'] += 1
+        return self.ciTest.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs)
+
+
+    def decide(self, result):
+        if not isinstance(result, ScreenedCITestResult):
+            return self.ciTest.decide(result)
+        if result.fullResult is not None:
+            return self.ciTest.decide(result.fullResult)
+        if (result.alpha, result.soeThreshold) == (self.alpha, self.soeThreshold):
+            return result.independent
+        if self._isDecisive(result):
+            return self.ciTest.decide(result)
+        self.screenRecord['full'] += 1
+        result.fullResult = self.ciTest.testConditionalIndependence(*result.test)
+        return self.ciTest.decide(result.fullResult)
+
+
+    def _isDecisive(self, result):
+        if result.pval != result.pval:  # nan, e.g., too few base items in the subsample
+            return False
+        logPval = math.log10(max(result.pval, sys.float_info.min))
+        logAlpha = math.log10(self.ciTest.alpha)
+        if result.pval <= self.ciTest.alpha:
+            return logAlpha - logPval >= self.dependenceMargin and \
+                (result.effectSize is None or result.effectSize >= self.ciTest.soeThreshold)
+        return logPval >= (1 - self.independenceMargin) * logAlpha
+
+
+def getAggregatedData(schema, dataStore, relVar1Str, relVar2Str, condRelVarStrs, sampleRate=1.0, sampleSeed=0):
+    """
+    Returns the aggregated values of relVar1 (average), relVar2 (identity), and each conditioning variable (average)
+    for the base items with no missing values, as relVar1Data, relVar2Data, condVarsData (a list per conditioning
+    variable). If sampleRate < 1, a base item is kept only if a hash of its id and sampleSeed falls below
+    sampleRate, so that every test with the same rate and seed sees the same reproducible subsample. Data stores that
+    can list the ids of the base items (getItemIds) and restrict getValuesForRelVarAggrs to given ones (itemIds), as
+    InMemoryDataStore does, have the subsample drawn first so that only its items are joined and aggregated; for
+    other data stores, the subsample is filtered from the rows of all base items.
+    """
+    if not isinstance(relVar1Str, str) and not isinstance(relVar1Str, RelationalVariable) or not relVar1Str:
+        raise Exception("relVar1Str must be a parseable RelationalVariable string")
+    if not isinstance(relVar2Str, str) and not isinstance(relVar2Str, RelationalVariable) or not relVar2Str:
+        raise Exception("relVar2Str must be a parseable RelationalVariable string")
+    if not isinstance(condRelVarStrs, collections.Iterable) or isinstance(condRelVarStrs, str):
+        raise Exception("condRelVarStrs must be a sequence of parseable RelationalVariable strings")
+
+    relVar1 = ParserUtil.parseRelVar(relVar1Str)
+    relVar2 = ParserUtil.parseRelVar(relVar2Str)
+    if len(relVar2.path) > 1:
+        raise Exception("relVar2Str must have a singleton path")
+
+    baseItemName = relVar1.getBaseItemName()
+    relVarAggrs = [AverageAggregator(relVar1Str), IdentityAggregator(relVar2Str)]
+    relVarAggrs.extend([AverageAggregator(condRelVarStr) for condRelVarStr in condRelVarStrs])
+
+    relVar1Data = []
+    relVar2Data = []
+    condVarsData = []
+    for i in range(len(condRelVarStrs)):
+        condVarsData.append([])
+
+    sampleThreshold = sampleRate * 2 ** 32
+    isSampled = lambda idVal: zlib.crc32('{}:{}'.format(sampleSeed, idVal).encode()) < sampleThreshold
+    if sampleRate < 1 and hasattr(dataStore, 'getItemIds'):
+        itemIds = [idVal for idVal in dataStore.getItemIds(baseItemName) if isSampled(idVal)]
+        rows = dataStore.getValuesForRelVarAggrs(schema, baseItemName, relVarAggrs, itemIds=itemIds)
+    else:
+        rows = dataStore.getValuesForRelVarAggrs(schema, baseItemName, relVarAggrs)
+    for idVal, row in rows:
+        if None in row:
+            continue
+        if sampleRate < 1 and not isSampled(idVal):
+            continue
+        relVar1Data.append(float(row[0]))
+        relVar2Data.append(float(row[1]))
+        for i, value in enumerate(row[2:]):
+            condVarsData[i].append(float(value))
+
+    return relVar1Data, relVar2Data, condVarsData
 
 
 class Oracle(CITest):
 
-    def __init__(self, model, hopThreshold=0):
+    def __init__(self, model, hopThreshold=0, memoryLimit=None):
         self.model = model
         self.hopThreshold = hopThreshold
-        self.dsep = DSeparation(model)
+        self.dsep = DSeparation(model, memoryLimit)
 
     @functools.lru_cache(maxsize=10000)
     def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
-        return self.dsep.dSeparated(self.hopThreshold, [relVar1Str], [relVar2Str], condRelVarStrs)
\ No newline at end of file
+        # learners pass already-validated RelationalVariable objects; skip parsing for those
+        if isinstance(relVar1Str, RelationalVariable) and isinstance(relVar2Str, RelationalVariable) and \
+                all(isinstance(condRelVar, RelationalVariable) for condRelVar in condRelVarStrs):
+            return self.dsep.dSeparatedRelVars(self.hopThreshold, [relVar1Str], [relVar2Str], condRelVarStrs)
+        return self.dsep.dSeparated(self.hopThreshold, [relVar1Str], [relVar2Str], condRelVarStrs)
@@ -0,0 +1,64 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Registry of CI testers by name. A tester is registered as a 'module:Class' string and its module is imported only
+when the tester is first requested, so that, e.g., a run with the oracle never imports numpy, scipy, or R. R itself
+is started by LinearCITest on its first test (see CITest.loadR).
+"""
+
+import importlib
+
+_registry = {
+    'oracle': 'causality.citest.CITest:Oracle',
+    'linear': 'causality.citest.CITest:LinearCITest',
+    'screening': 'causality.citest.CITest:ScreeningCITest',
+    'categorical': 'causality.citest.CategoricalCITest:CategoricalCITest',
+    'kernel': 'causality.citest.KernelCITest:KernelCITest',
+    'permutation': 'causality.citest.PermutationCITest:PermutationCITest',
+    'incremental': 'causality.citest.IncrementalLinearCITest:IncrementalLinearCITest',
+}
+
+
+def register(name, ciTestClass):
+    """
+    Registers ciTestClass, a CITest subclass or a 'module:Class' string to be imported lazily, under name.
+    """
+    if not isinstance(ciTestClass, str) and not isinstance(ciTestClass, type):
+        raise Exception("ciTestClass must be a class or a 'module:Class' string: found {}".format(ciTestClass))
+    if isinstance(ciTestClass, str) and ciTestClass.count(':') != 1:
+        raise Exception("ciTestClass must be of the form 'module:Class': found {}".format(ciTestClass))
+    _registry[name] = ciTestClass
+
+
+def getCITestClass(name):
+    """
+    Returns the CI tester class registered under name, importing its module on first use.
+    """
+    if name not in _registry:
+        raise Exception("Unknown CI tester {!r}: must be one of {}".format(name, sorted(_registry)))
+    ciTestClass = _registry[name]
+    if isinstance(ciTestClass, str):
+        moduleName, className = ciTestClass.split(':')
+        ciTestClass = _registry[name] = getattr(importlib.import_module(moduleName), className)
+    return ciTestClass
+
+
+def createCITest(name, *args, **kwargs):
+    return getCITestClass(name)(*args, **kwargs)
+
+
+def getCITestNames():
+    return sorted(_registry)
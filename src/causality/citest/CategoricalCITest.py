@@ -0,0 +1,153 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import logging
+
+import numpy as np
+from scipy.stats import chi2
+
+from causality.citest.CITest import CITest, CITestResult
+from causality.model import ParserUtil
+from causality.model.Aggregator import IdentityAggregator
+from causality.model.ModeAggregator import ModeAggregator
+
+logger = logging.getLogger(__name__)
+
+
+class CategoricalCITest(CITest):
+    """
+    G-test of conditional independence for categorical attributes.
+    Each relational variable is fetched from the data store once, aggregated with aggregatorClass (identity for
+    singleton paths), and integer-coded. The default ModeAggregator keeps aggregated values categorical (averaging
+    category codes would not). Strata of conditioning sets are coded incrementally and cached: the strata of
+    {Z1, ..., Zk} are derived from the cached strata of {Z1, ..., Zk-1}, so higher-order tests reuse lower-order work.
+    Contingency counts are built with np.bincount over observed cells only. The effect size is the estimated
+    conditional mutual information (in nats), G / 2N.
+    """
+
+    def __init__(self, schema, dataStore, alpha=0.05, soeThreshold=0.0, aggregatorClass=ModeAggregator,
+                 maxCachedStrata=10000):
+        self.schema = schema
+        self.dataStore = dataStore
+        self.alpha = alpha
+        self.soeThreshold = soeThreshold
+        self.aggregatorClass = aggregatorClass
+        self.maxCachedStrata = maxCachedStrata
+        self.baseItemIndex = {}  # base item name -> {id: position}
+        self.columns = {}  # relational variable -> (codes, number of levels); -1 codes a missing value
+        self.strata = collections.OrderedDict()  # (base item name, sorted conditioning variables) -> (codes, levels)
+
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        logger.debug("testing %s _||_ %s | { %s }", relVar1Str, relVar2Str, condRelVarStrs)
+        relVar1 = ParserUtil.parseRelVar(relVar1Str)
+        relVar2 = ParserUtil.parseRelVar(relVar2Str)
+        if len(relVar2.path) > 1:
+            raise Exception("relVar2Str must have a singleton path")
+        condRelVars = [ParserUtil.parseRelVar(condRelVarStr) for condRelVarStr in condRelVarStrs]
+
+        x, numX = self._column(relVar1)
+        y, numY = self._column(relVar2)
+        z, _ = self._strata(relVar1.getBaseItemName(), condRelVars)
+
+        observed = (x >= 0) & (y >= 0) & (z >= 0)
+        x, y = x[observed], y[observed]
+        z, numZ = _denseCodes(z[observed])
+        n = len(x)
+        if n == 0:
+            return CITestResult(1.0, 0.0)
+
+        # counts over observed cells only, and the marginal tables they need
+        cells, cellCounts = np.unique((z * numX + x) * numY + y, return_counts=True)
+        nXZ = np.bincount(z * numX + x, minlength=numZ * numX)
+        nYZ = np.bincount(z * numY + y, minlength=numZ * numY)
+        nZ = np.bincount(z, minlength=numZ)
+
+        cellY = cells % numY
+        cellXZ = cells // numY
+        cellZ = cellXZ // numX
+        g = 2.0 * np.sum(cellCounts * np.log(cellCounts * nZ[cellZ] / (nXZ[cellXZ] * nYZ[cellZ * numY + cellY])))
+        g = max(g, 0.0)
+
+        # degrees of freedom: sum over strata of (observed levels of x - 1) * (observed levels of y - 1)
+        levelsX = (nXZ.reshape(numZ, numX) > 0).sum(axis=1)
+        levelsY = (nYZ.reshape(numZ, numY) > 0).sum(axis=1)
+        dof = int(np.sum(np.maximum(levelsX - 1, 0) * np.maximum(levelsY - 1, 0)))
+
+        pval = chi2.sf(g, dof) if dof > 0 else 1.0
+        effectSize = g / (2.0 * n)
+        logger.debug('soe: {}, pval: {}'.format(effectSize, pval))
+        return CITestResult(pval, effectSize)
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+    def _column(self, relVar):
+        if relVar not in self.columns:
+            baseItemName = relVar.getBaseItemName()
+            aggregator = IdentityAggregator(relVar) if len(relVar.path) == 1 else self.aggregatorClass(relVar)
+            if baseItemName not in self.baseItemIndex:
+                rows = list(self.dataStore.getValuesForRelVarAggrs(self.schema, baseItemName, [aggregator]))
+                self.baseItemIndex[baseItemName] = {idVal: i for i, (idVal, _) in enumerate(rows)}
+            else:
+                rows = self.dataStore.getValuesForRelVarAggrs(self.schema, baseItemName, [aggregator])
+            index = self.baseItemIndex[baseItemName]
+
+            values = [None] * len(index)
+            for idVal, row in rows:
+                values[index[idVal]] = row[0]
+            present = np.array([value is not None for value in values], dtype=bool)
+            codes = np.full(len(values), -1, dtype=np.int64)
+            levels, codes[present] = np.unique(np.array([value for value in values if value is not None]),
+                                               return_inverse=True)
+            self.columns[relVar] = codes, len(levels)
+        return self.columns[relVar]
+
+
+    def _strata(self, baseItemName, condRelVars):
+        key = (baseItemName, tuple(sorted(condRelVars)))
+        if key in self.strata:
+            self.strata.move_to_end(key)
+            return self.strata[key]
+
+        if not condRelVars:
+            # a single stratum over all base items, which are indexed by the first column fetched
+            strata = np.zeros(len(self.baseItemIndex[baseItemName]), dtype=np.int64), 1
+        else:
+            prefix = list(key[1][:-1])
+            prefixCodes, _ = self._strata(baseItemName, prefix)
+            codes, numLevels = self._column(key[1][-1])
+            combined = np.where((prefixCodes >= 0) & (codes >= 0), prefixCodes * numLevels + codes, -1)
+            observed = combined >= 0
+            denseCodes = np.full(len(combined), -1, dtype=np.int64)
+            denseCodes[observed], numStrata = _denseCodes(combined[observed])
+            strata = denseCodes, numStrata
+
+        self.strata[key] = strata
+        while len(self.strata) > self.maxCachedStrata:
+            self.strata.popitem(last=False)
+        return strata
+
+
+def _denseCodes(codes):
+    levels, dense = np.unique(codes, return_inverse=True)
+    return dense.astype(np.int64), len(levels)
@@ -0,0 +1,134 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+
+import numpy as np
+from scipy.stats import t as studentT
+
+from causality.citest.CITest import CITest, CITestResult, getAggregatedData
+from causality.model import ParserUtil
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalLinearCITest(CITest):
+    """
+    A LinearCITest-compatible tester computed from sufficient statistics.
+    For every tested variable tuple (relVar1, relVar2, conditioning variables), it keeps, per perspective, the count,
+    the sums, and the cross-product matrix of the aggregated variables over the base items with no missing values.
+    The p-value of relVar1's coefficient in the regression of relVar2 on relVar1 and the conditioning variables, and
+    the squared partial correlation (the effect size), are then computed from these statistics alone, and agree with
+    the ordinary least squares fit of LinearCITest.
+    appendData adds the base items of a data store holding only newly appended base items without touching earlier
+    rows. This is exact for variables of the base items themselves (singleton paths). An aggregated variable (a
+    longer path) of an earlier base item changes if appended relationship instances reach it, so statistics of
+    aggregated variables are kept only across appends declared disjoint, i.e., appended items that form a separate
+    part of the relational skeleton. After any other append, testing an aggregated variable raises an exception.
+    """
+
+    def __init__(self, schema, dataStore, alpha=0.05, soeThreshold=0.01):
+        self.schema = schema
+        self.dataStores = [dataStore]
+        self.alpha = alpha
+        self.soeThreshold = soeThreshold
+        self.statistics = {}  # perspective -> {(relVar1, relVar2, condRelVar, ...): (count, sums, cross products)}
+        self.skeletonExtended = False  # whether appended data may have changed aggregated values of earlier items
+
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        logger.debug("testing %s _||_ %s | { %s }", relVar1Str, relVar2Str, condRelVarStrs)
+        relVar1 = ParserUtil.parseRelVar(relVar1Str)
+        variables = (relVar1, ParserUtil.parseRelVar(relVar2Str)) + \
+                    tuple(sorted(ParserUtil.parseRelVar(condRelVarStr) for condRelVarStr in condRelVarStrs))
+
+        if self.skeletonExtended and _isAggregated(variables):
+            raise Exception("Aggregated variables cannot be tested after appending data that is not disjoint from "
+                            "earlier data: found {}".format(variables))
+        statistics = self.statistics.setdefault(relVar1.getBaseItemName(), {})
+        if variables not in statistics:
+            statistics[variables] = _sumStatistics(self._statisticsOf(dataStore, variables)
+                                                   for dataStore in self.dataStores)
+        return _testFromStatistics(*statistics[variables])
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+    def appendData(self, dataStore, disjoint=False):
+        """
+        Updates every tracked statistic with the base items of dataStore, which holds only appended base items.
+        disjoint declares that no relationship instance links the appended items with earlier ones, so that the
+        aggregated values of earlier base items are unchanged. Without it, statistics of aggregated variables cannot
+        be updated: an exception is raised if any is tracked, and aggregated variables cannot be tested afterwards.
+        """
+        if not disjoint:
+            aggregated = [variables for statistics in self.statistics.values() for variables in statistics
+                          if _isAggregated(variables)]
+            if aggregated:
+                raise Exception("Statistics of aggregated variables cannot be updated with data that is not disjoint "
+                                "from earlier data: found {}".format(aggregated[0]))
+            self.skeletonExtended = True
+        self.dataStores.append(dataStore)
+        for statistics in self.statistics.values():
+            for variables, (count, sums, crossProducts) in statistics.items():
+                statistics[variables] = _sumStatistics([(count, sums, crossProducts),
+                                                        self._statisticsOf(dataStore, variables)])
+
+
+    def _statisticsOf(self, dataStore, variables):
+        relVar1Data, relVar2Data, condVarsData = getAggregatedData(self.schema, dataStore, variables[0],
+                                                                   variables[1], variables[2:])
+        data = np.array([relVar1Data, relVar2Data] + condVarsData, dtype=float).reshape(len(variables), -1)
+        return data.shape[1], data.sum(axis=1), data.dot(data.T)
+
+
+def _isAggregated(variables):
+    return any(len(relVar.path) > 1 for relVar in variables)
+
+
+def _sumStatistics(statisticsList):
+    statisticsList = list(statisticsList)
+    return sum(statistics[0] for statistics in statisticsList), \
+           sum(statistics[1] for statistics in statisticsList), \
+           sum(statistics[2] for statistics in statisticsList)
+
+
+def _testFromStatistics(count, sums, crossProducts):
+    # centered cross products, ordered as relVar1 (x), relVar2 (y), conditioning variables (z)
+    scatter = crossProducts - np.outer(sums, sums) / count
+    degreesOfFreedom = count - len(sums)
+    if degreesOfFreedom <= 0:
+        return CITestResult(1.0, 0.0)
+
+    # regress y on x and z: the coefficient of x and its standard error
+    predictors = [0] + list(range(2, len(sums)))
+    inversePredictorScatter = np.linalg.pinv(scatter[np.ix_(predictors, predictors)])
+    coefficients = inversePredictorScatter.dot(scatter[predictors, 1])
+    residualSumOfSquares = max(scatter[1, 1] - scatter[1, predictors].dot(coefficients), 0.0)
+    standardError = np.sqrt(residualSumOfSquares / degreesOfFreedom * inversePredictorScatter[0, 0])
+    if standardError == 0:
+        return CITestResult(0.0 if coefficients[0] != 0 else 1.0, 1.0 if coefficients[0] != 0 else 0.0)
+    pval = 2 * studentT.sf(abs(coefficients[0] / standardError), degreesOfFreedom)
+
+    # squared partial correlation of x and y given z
+    precision = np.linalg.pinv(scatter)
+    effectSize = precision[0, 1] ** 2 / (precision[0, 0] * precision[1, 1])
+    return CITestResult(pval, effectSize)
@@ -0,0 +1,121 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+
+import numpy as np
+from scipy.stats import gamma
+
+from causality.citest.CITest import CITest, CITestResult, getAggregatedData
+
+logger = logging.getLogger(__name__)
+
+
+class KernelCITest(CITest):
+    """
+    Approximate kernel conditional independence test with random Fourier features (in the spirit of RCIT, Strobl et
+    al. 2017). Gaussian kernels on each variable are approximated with a fixed budget of random Fourier features;
+    the features of relVar1 and relVar2 are residualized on the features of the conditioning set by ridge
+    regression, and the squared Frobenius norm of their cross-covariance is compared against a gamma approximation
+    of its null distribution. The cost is linear in the number of base items.
+    The kernel on the conditioning set is narrower than the median heuristic (condBandwidthScale times the median
+    distance): with the median bandwidth, the regression underfits nonlinear effects of the conditioning set, and its
+    residuals stay dependent, so that the test rejects far more often than alpha.
+    Data are aggregated as in LinearCITest. Randomness comes from seed only, so a test is reproducible.
+    """
+
+    def __init__(self, schema, dataStore, alpha=0.05, numFeatures=5, numCondFeatures=100, ridge=1e-10, seed=0,
+                 bandwidthSampleSize=500, soeThreshold=None, condBandwidthScale=0.5):
+        self.schema = schema
+        self.dataStore = dataStore
+        self.alpha = alpha
+        self.numFeatures = numFeatures
+        self.numCondFeatures = numCondFeatures
+        self.ridge = ridge
+        self.seed = seed
+        self.bandwidthSampleSize = bandwidthSampleSize
+        self.soeThreshold = soeThreshold  # no effect size is computed; kept for interface compatibility
+        self.condBandwidthScale = condBandwidthScale
+
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        logger.debug("testing %s _||_ %s | { %s }", relVar1Str, relVar2Str, condRelVarStrs)
+        relVar1Data, relVar2Data, condVarsData = getAggregatedData(self.schema, self.dataStore, relVar1Str,
+                                                                   relVar2Str, condRelVarStrs)
+        n = len(relVar1Data)
+        if n < 2:
+            return CITestResult(1.0)
+
+        randomState = np.random.RandomState(self.seed)
+        x = _standardize(np.array(relVar1Data, dtype=float)[:, None])
+        y = _standardize(np.array(relVar2Data, dtype=float)[:, None])
+        residualsX = _center(self._features(x, self.numFeatures, randomState))
+        residualsY = _center(self._features(y, self.numFeatures, randomState))
+
+        if condVarsData:
+            z = _standardize(np.array(condVarsData, dtype=float).T)
+            featuresZ = _center(self._features(z, self.numCondFeatures, randomState, self.condBandwidthScale))
+            gram = featuresZ.T.dot(featuresZ) + self.ridge * np.eye(featuresZ.shape[1])
+            coefficients = np.linalg.solve(gram, featuresZ.T.dot(np.hstack((residualsX, residualsY))))
+            residualsXY = np.hstack((residualsX, residualsY)) - featuresZ.dot(coefficients)
+            residualsX, residualsY = residualsXY[:, :self.numFeatures], residualsXY[:, self.numFeatures:]
+
+        crossCovariance = residualsX.T.dot(residualsY) / n
+        statistic = n * np.sum(crossCovariance ** 2)
+
+        # the statistic is asymptotically a weighted sum of chi-squares, approximated by a gamma matching its moments
+        products = (residualsX[:, :, None] * residualsY[:, None, :]).reshape(n, -1)
+        products = _center(products)
+        covariance = products.T.dot(products) / n
+        mean = np.trace(covariance)
+        variance = 2 * np.sum(covariance ** 2)
+        if mean <= 0 or variance <= 0:
+            return CITestResult(1.0)
+        pval = gamma.sf(statistic, mean ** 2 / variance, scale=variance / mean)
+        logger.debug('statistic: {}, pval: {}'.format(statistic, pval))
+        return CITestResult(pval)
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+    def _features(self, data, numFeatures, randomState, bandwidthScale=1.0):
+        bandwidth = bandwidthScale * _medianDistance(data[:self.bandwidthSampleSize])
+        weights = randomState.normal(scale=1.0 / bandwidth, size=(data.shape[1], numFeatures))
+        offsets = randomState.uniform(0, 2 * np.pi, size=numFeatures)
+        return np.sqrt(2.0 / numFeatures) * np.cos(data.dot(weights) + offsets)
+
+
+def _standardize(data):
+    std = data.std(axis=0)
+    std[std == 0] = 1.0
+    return (data - data.mean(axis=0)) / std
+
+
+def _center(data):
+    return data - data.mean(axis=0)
+
+
+def _medianDistance(data):
+    squaredNorms = np.sum(data ** 2, axis=1)
+    squaredDistances = squaredNorms[:, None] + squaredNorms[None, :] - 2 * data.dot(data.T)
+    distances = np.sqrt(np.maximum(squaredDistances[np.triu_indices(len(data), k=1)], 0))
+    distances = distances[distances > 0]
+    return np.median(distances) if len(distances) else 1.0
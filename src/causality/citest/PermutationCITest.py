@@ -0,0 +1,103 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+
+import numpy as np
+
+from causality.citest.CITest import CITest, CITestResult, getAggregatedData
+
+logger = logging.getLogger(__name__)
+
+
+class PermutationCITest(CITest):
+    """
+    Distribution-free conditional permutation test for small samples.
+    relVar1 and relVar2 are residualized on the conditioning set by least squares, and the statistic is the squared
+    correlation of the residuals (the same effect size as LinearCITest). Its null distribution is obtained by
+    permuting relVar1's residuals within strata of the conditioning set (numBins quantile bins per conditioning
+    variable). Permutations are drawn batchSize at a time as one index matrix, and all permuted statistics of a batch
+    are computed with a single matrix product. Sampling stops early once the p-value estimate is more than three
+    standard errors away from alpha, or after numPermutations permutations.
+    """
+
+    def __init__(self, schema, dataStore, alpha=0.05, soeThreshold=0.01, numPermutations=1000, batchSize=100,
+                 numBins=4, seed=0):
+        self.schema = schema
+        self.dataStore = dataStore
+        self.alpha = alpha
+        self.soeThreshold = soeThreshold
+        self.numPermutations = numPermutations
+        self.batchSize = batchSize
+        self.numBins = numBins
+        self.seed = seed
+
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return self.decide(self.testConditionalIndependence(relVar1Str, relVar2Str, condRelVarStrs))
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs):
+        logger.debug("testing %s _||_ %s | { %s }", relVar1Str, relVar2Str, condRelVarStrs)
+        relVar1Data, relVar2Data, condVarsData = getAggregatedData(self.schema, self.dataStore, relVar1Str,
+                                                                   relVar2Str, condRelVarStrs)
+        n = len(relVar1Data)
+        x = np.array(relVar1Data, dtype=float)
+        y = np.array(relVar2Data, dtype=float)
+        z = np.array(condVarsData, dtype=float).T if condVarsData else np.empty((n, 0))
+
+        design = np.hstack((np.ones((n, 1)), z))
+        coefficients = np.linalg.lstsq(design, np.vstack((x, y)).T, rcond=None)[0]
+        residuals = np.vstack((x, y)).T - design.dot(coefficients)
+        residualsX, residualsY = residuals[:, 0], residuals[:, 1]
+        norm = np.sqrt(residualsX.dot(residualsX) * residualsY.dot(residualsY))
+        if n < 3 or norm == 0:
+            return CITestResult(1.0, 0.0)
+
+        statistic = (residualsX.dot(residualsY) / norm) ** 2
+        strata = self._strata(z)
+        byStratum = np.argsort(strata, kind='mergesort')
+
+        randomState = np.random.RandomState(self.seed)
+        numPermuted = numExceeded = 0
+        while numPermuted < self.numPermutations:
+            batchSize = min(self.batchSize, self.numPermutations - numPermuted)
+            # positions ordered by stratum, shuffled within strata, one row per permutation
+            shuffled = np.argsort(strata[None, :] + randomState.uniform(size=(batchSize, n)), axis=1)
+            permutations = np.empty_like(shuffled)
+            permutations[:, byStratum] = shuffled
+
+            permutedStatistics = (residualsX[permutations].dot(residualsY) / norm) ** 2
+            numExceeded += np.count_nonzero(permutedStatistics >= statistic)
+            numPermuted += batchSize
+
+            pval = (numExceeded + 1.0) / (numPermuted + 1.0)
+            if abs(pval - self.alpha) > 3 * np.sqrt(self.alpha * (1 - self.alpha) / numPermuted):
+                break
+
+        logger.debug('soe: {}, pval: {}, permutations: {}'.format(statistic, pval, numPermuted))
+        return CITestResult(pval, statistic)
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+    def _strata(self, z):
+        strata = np.zeros(len(z), dtype=np.int64)
+        for column in z.T:
+            quantiles = np.percentile(column, np.linspace(0, 100, self.numBins + 1)[1:-1])
+            strata = strata * self.numBins + np.searchsorted(quantiles, column, side='right')
+        return np.unique(strata, return_inverse=True)[1].reshape(-1).astype(np.int64)
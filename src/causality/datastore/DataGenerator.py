@@ -0,0 +1,129 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Synthetic relational data for scale testing. A relational skeleton is sampled for a schema, and attribute values are
+drawn from a linear-Gaussian parameterization of a model, one attribute class at a time in topological order of the
+class dependency graph. Every step is vectorized over all items of a schema item: parents are aggregated with
+InMemoryDataStore.aggregate, which shares path prefixes across dependencies.
+"""
+
+import collections
+import heapq
+import logging
+
+import numpy as np
+
+from causality.datastore.InMemoryDataStore import InMemoryDataStore
+from causality.model.Schema import Schema
+from causality.model.Schema import SchemaItem
+
+logger = logging.getLogger(__name__)
+
+
+def generateData(model, skeletonSizes, coefficients=None, noiseStd=1.0, seed=0):
+    """
+    Returns an InMemoryDataStore with a skeleton sampled by sampleSkeleton and attribute values drawn as
+        item.attr = sum over dependencies [relVar1] -> [item].attr of coefficient * average(relVar1) + noise,
+    where an empty terminal set contributes 0 and noise ~ N(0, noiseStd^2).
+    coefficients maps dependencies of the model to their coefficients; missing ones are drawn uniformly from
+    [-1.5, -0.5] U [0.5, 1.5]. The result is reproducible from seed.
+    """
+    randomState = np.random.RandomState(seed)
+    dataStore = sampleSkeleton(model.schema, skeletonSizes, randomState)
+
+    coefficients = dict(coefficients or {})
+    for dependency in model.dependencies:
+        if dependency not in coefficients:
+            coefficients[dependency] = randomState.choice([-1, 1]) * randomState.uniform(0.5, 1.5)
+
+    parentDependencies = collections.defaultdict(list)
+    for dependency in model.dependencies:
+        parentDependencies[_attributeClassOf(dependency.relVar2)].append(dependency)
+
+    for itemName, attrName in getAttributeOrder(model):
+        values = randomState.normal(scale=noiseStd, size=dataStore.getNumItems(itemName))
+        for dependency in parentDependencies[itemName, attrName]:
+            parentValues = dataStore.aggregate(dependency.relVar1)
+            values += coefficients[dependency] * np.nan_to_num(parentValues)
+        dataStore.setAttribute(itemName, attrName, values)
+        logger.debug("generated %s.%s", itemName, attrName)
+    return dataStore
+
+
+def sampleSkeleton(schema, skeletonSizes, randomState):
+    """
+    Returns an InMemoryDataStore with skeletonSizes[name] instances of every entity and relationship and no
+    attribute values. Each relationship instance links entity instances drawn uniformly at random; on a side with
+    cardinality one, entity instances are drawn without replacement, so that each participates at most once.
+    """
+    dataStore = InMemoryDataStore(schema)
+    for entity in sorted(schema.getEntities(), key=lambda item: item.name):
+        dataStore.addEntities(entity.name, _sizeOf(skeletonSizes, entity.name))
+
+    for relationship in sorted(schema.getRelationships(), key=lambda item: item.name):
+        numItems = _sizeOf(skeletonSizes, relationship.name)
+        positions = []
+        for entityName, card in ((relationship.entity1Name, relationship.entity1Card),
+                                 (relationship.entity2Name, relationship.entity2Card)):
+            numEntities = dataStore.getNumItems(entityName)
+            if card == Schema.ONE:
+                if numItems > numEntities:
+                    raise Exception("{} has cardinality one for {}: at most {} instances, found {}".format(
+                        relationship.name, entityName, numEntities, numItems))
+                positions.append(randomState.permutation(numEntities)[:numItems])
+            else:
+                positions.append(randomState.randint(numEntities, size=numItems))
+        dataStore.addRelationships(relationship.name, positions[0], positions[1])
+    return dataStore
+
+
+def getAttributeOrder(model):
+    """
+    Returns every (item name, attribute name) of the schema in a topological order of the class dependency graph,
+    ties broken by name.
+    """
+    attributeClasses = {(item.name, attr.name) for item in model.schema.getSchemaItems()
+                        for attr in item.getAttributes() if attr.name != SchemaItem.EXISTS_ATTR_NAME}
+    children = collections.defaultdict(set)
+    numParents = collections.Counter()
+    for dependency in model.dependencies:
+        parent, child = _attributeClassOf(dependency.relVar1), _attributeClassOf(dependency.relVar2)
+        if child not in children[parent]:
+            children[parent].add(child)
+            numParents[child] += 1
+
+    order = []
+    ready = sorted(attributeClass for attributeClass in attributeClasses if numParents[attributeClass] == 0)
+    while ready:
+        attributeClass = heapq.heappop(ready)
+        order.append(attributeClass)
+        for child in children[attributeClass]:
+            numParents[child] -= 1
+            if numParents[child] == 0:
+                heapq.heappush(ready, child)
+    if len(order) != len(attributeClasses):
+        raise Exception("The class dependency graph of the model must be acyclic")
+    return order
+
+
+def _attributeClassOf(relVar):
+    return relVar.getTerminalItemName(), relVar.attrName
+
+
+def _sizeOf(skeletonSizes, itemName):
+    if itemName not in skeletonSizes:
+        raise Exception("skeletonSizes has no size for {}".format(itemName))
+    return skeletonSizes[itemName]
@@ -0,0 +1,259 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+
+import numpy as np
+import scipy.sparse as sp
+
+from causality.model import ParserUtil
+from causality.model.Aggregator import AverageAggregator
+from causality.model.Aggregator import IdentityAggregator
+from causality.model.ModeAggregator import ModeAggregator
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryDataStore(object):
+    """
+    An array-backed relational skeleton and its attribute values, with the getValuesForRelVarAggrs interface that
+    CI testers use.
+    Every item (entity or relationship instance) is identified by its position within its schema item; its id is
+    kept only for reporting. Each relationship is stored as the positions of its two entity instances, from which
+    sparse incidence matrices between relationship and entity instances are built.
+    The terminal sets of a relational path are computed for all base items at once as a binary sparse reach matrix
+    (base items x terminal items), one sparse product per path step with bridge burning: items reached by an earlier
+    prefix ending at the same schema item are removed. Reach matrices are cached by path prefix, so relational
+    variables sharing a prefix share its computation. Average aggregation is then a row-normalized matrix-vector
+    product that skips missing values; mode aggregation counts the values of each terminal set with a product of
+    the reach matrix and a (terminal items x distinct values) indicator matrix. When only some base items are requested (itemIds), the reach is computed
+    from their rows alone and not cached.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.relationships = {relationship.name: relationship for relationship in schema.getRelationships()}
+        self.itemNames = {item.name for item in schema.getSchemaItems()}
+        self.ids = {}  # item name -> array of ids
+        self.attributes = {}  # item name -> {attribute name: float array, nan for a missing value}
+        self.endpoints = {}  # relationship name -> (entity1 positions, entity2 positions)
+        self.adjacencies = {}
+        self.reaches = {}
+        self.positions = {}  # item name -> {id: position}
+
+
+    def addEntities(self, entityName, numItems, attributes=None, ids=None):
+        """
+        Adds numItems instances of entityName. attributes maps attribute names to sequences of values (None or nan
+        for a missing value). ids default to 0, ..., numItems-1.
+        """
+        if entityName in self.relationships or entityName not in self.itemNames:
+            raise Exception("entityName must be the name of an entity in the schema: found {}".format(entityName))
+        self._addItems(entityName, numItems, attributes, ids)
+
+
+    def addRelationships(self, relationshipName, entity1Positions, entity2Positions, attributes=None, ids=None):
+        """
+        Adds one instance of relationshipName per pair of entity1 and entity2 instances, given by their positions
+        (the order in which they were added).
+        """
+        if relationshipName not in self.relationships:
+            raise Exception("relationshipName must be the name of a relationship in the schema: found {}".format(
+                relationshipName))
+        relationship = self.relationships[relationshipName]
+        entity1Positions = np.asarray(entity1Positions, dtype=np.int64)
+        entity2Positions = np.asarray(entity2Positions, dtype=np.int64)
+        if len(entity1Positions) != len(entity2Positions):
+            raise Exception("entity1Positions and entity2Positions must have the same length")
+        for entityName, positions in ((relationship.entity1Name, entity1Positions),
+                                      (relationship.entity2Name, entity2Positions)):
+            if entityName not in self.ids:
+                raise Exception("Entities of {} must be added before the relationship".format(entityName))
+            if len(positions) and (positions.min() < 0 or positions.max() >= len(self.ids[entityName])):
+                raise Exception("Positions of {} out of range".format(entityName))
+        self._addItems(relationshipName, len(entity1Positions), attributes, ids)
+        self.endpoints[relationshipName] = entity1Positions, entity2Positions
+
+
+    def setAttribute(self, itemName, attrName, values):
+        """
+        Sets (or replaces) the values of itemName.attrName, one per item in the order added.
+        """
+        if itemName not in self.ids:
+            raise Exception("Items of {} must be added before their attributes".format(itemName))
+        if isinstance(values, np.ndarray):
+            values = values.astype(float)
+        else:
+            values = np.array([np.nan if value is None else value for value in values], dtype=float)
+        if len(values) != len(self.ids[itemName]):
+            raise Exception("Attribute {}.{} must have one value per item".format(itemName, attrName))
+        self.attributes[itemName][attrName] = values
+
+
+    def getNumItems(self, itemName):
+        return len(self.ids[itemName])
+
+
+    def getItemIds(self, itemName):
+        return self.ids[itemName].tolist()
+
+
+    def getValuesForRelVarAggrs(self, schema, baseItemName, relVarAggrs, itemIds=None):
+        """
+        Yields (id, values) for every instance of baseItemName (or only those with the given ids, in that order),
+        with one value per aggregator (None if missing).
+        """
+        if itemIds is None:
+            positions = None
+            itemIds = self.getItemIds(baseItemName)
+        else:
+            itemIds = list(itemIds)
+            positions = self._positions(baseItemName, itemIds)
+        columns = [self.aggregate(relVarAggr.relVar, type(relVarAggr), positions).tolist()
+                   for relVarAggr in relVarAggrs]
+        for i, idVal in enumerate(itemIds):
+            yield idVal, [None if column[i] != column[i] else column[i] for column in columns]
+
+
+    def aggregate(self, relVar, aggregatorClass=AverageAggregator, positions=None):
+        """
+        Returns the aggregated values of relVar for every instance of its base item (or only those at the given
+        positions) as a float array, with nan where the terminal set has no values.
+        """
+        relVar = ParserUtil.parseRelVar(relVar)
+        values = self._values(relVar.getTerminalItemName(), relVar.attrName)
+        if len(relVar.path) == 1:
+            return values if positions is None else values[positions]
+        if issubclass(aggregatorClass, IdentityAggregator):
+            raise Exception("IdentityAggregator requires a singleton path: found {}".format(relVar))
+        if not issubclass(aggregatorClass, (AverageAggregator, ModeAggregator)):
+            raise Exception("Unsupported aggregator {}".format(aggregatorClass.__name__))
+
+        reach = self.getReach(relVar.path, positions)
+        present = ~np.isnan(values)
+        if issubclass(aggregatorClass, ModeAggregator):
+            return _mode(reach, values, present)
+        sums = reach.dot(np.where(present, values, 0.0))
+        counts = reach.dot(present.astype(float))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+
+    def getReach(self, path, positions=None):
+        """
+        Returns the binary CSR matrix whose row i marks the terminal set of path for the i-th base item (or for the
+        base item at positions[i]).
+        """
+        if positions is None:
+            return self._reach(tuple(path), None, self.reaches)
+        return self._reach(tuple(path), np.asarray(positions, dtype=np.int64), {})
+
+
+    def clearCache(self):
+        self.adjacencies.clear()
+        self.reaches.clear()
+        self.positions.clear()
+
+
+    def _reach(self, path, positions, reaches):
+        if path in reaches:
+            return reaches[path]
+
+        if len(path) == 1:
+            reach = sp.identity(self.getNumItems(path[0]), dtype=np.int32, format='csr')
+            if positions is not None:
+                reach = reach[positions]
+        else:
+            reach = self._reach(path[:-1], positions, reaches).dot(self._adjacency(path[-2], path[-1])).tocsr()
+            reach.data[:] = 1
+            # bridge burning: drop items reached by an earlier prefix at the same schema item
+            for i in range(len(path) - 1):
+                if path[i] == path[-1]:
+                    reach = reach - reach.multiply(self._reach(path[:i + 1], positions, reaches))
+            reach = sp.csr_matrix(reach)
+            reach.eliminate_zeros()
+        reaches[path] = reach
+        return reach
+
+
+    def _positions(self, itemName, itemIds):
+        if itemName not in self.positions:
+            self.positions[itemName] = {idVal: i for i, idVal in enumerate(self.getItemIds(itemName))}
+        positions = self.positions[itemName]
+        missing = [idVal for idVal in itemIds if idVal not in positions]
+        if missing:
+            raise Exception("Unknown ids of {}: {}".format(itemName, missing[:10]))
+        return np.array([positions[idVal] for idVal in itemIds], dtype=np.int64)
+
+
+    def _addItems(self, itemName, numItems, attributes, ids):
+        if itemName in self.ids:
+            raise Exception("Items of {} have already been added".format(itemName))
+        self.ids[itemName] = np.arange(numItems) if ids is None else np.asarray(ids)
+        if len(self.ids[itemName]) != numItems:
+            raise Exception("ids must have one id per item")
+        self.attributes[itemName] = {}
+        for attrName, values in (attributes or {}).items():
+            self.setAttribute(itemName, attrName, values)
+
+
+    def _values(self, itemName, attrName):
+        if itemName not in self.attributes or attrName not in self.attributes[itemName]:
+            raise Exception("No values for {}.{}".format(itemName, attrName))
+        return self.attributes[itemName][attrName]
+
+
+    def _adjacency(self, fromItemName, toItemName):
+        if (fromItemName, toItemName) not in self.adjacencies:
+            if fromItemName in self.relationships:
+                adjacency = self._incidence(fromItemName, toItemName)
+            elif toItemName in self.relationships:
+                adjacency = self._incidence(toItemName, fromItemName).T.tocsr()
+            else:
+                raise Exception("Consecutive items of a relational path must be a relationship and one of its "
+                                "entities: found {} and {}".format(fromItemName, toItemName))
+            self.adjacencies[fromItemName, toItemName] = adjacency
+        return self.adjacencies[fromItemName, toItemName]
+
+
+    def _incidence(self, relationshipName, entityName):
+        relationship = self.relationships[relationshipName]
+        entity1Positions, entity2Positions = self.endpoints[relationshipName]
+        columns = [positions for name, positions in ((relationship.entity1Name, entity1Positions),
+                                                     (relationship.entity2Name, entity2Positions))
+                   if name == entityName]
+        if not columns:
+            raise Exception("{} does not participate in {}".format(entityName, relationshipName))
+        rows = np.concatenate([np.arange(len(positions)) for positions in columns])
+        incidence = sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, np.concatenate(columns))),
+                                  shape=(len(entity1Positions), self.getNumItems(entityName)))
+        incidence.sum_duplicates()
+        incidence.data[:] = 1  # a relationship between an entity instance and itself
+        return incidence
+
+
+def _mode(reach, values, present):
+    levels, codes = np.unique(values[present], return_inverse=True)
+    modes = np.full(reach.shape[0], np.nan)
+    if not len(levels):
+        return modes
+    indicator = sp.csr_matrix((np.ones(len(codes)), (np.flatnonzero(present), codes.ravel())),
+                              shape=(len(values), len(levels)))
+    counts = sp.csr_matrix(reach.dot(indicator))
+    counts.sort_indices()
+    hasValues = counts.getnnz(axis=1) > 0
+    # argmax returns the first (smallest) value among the most frequent ones
+    modes[hasValues] = levels[np.asarray(counts.argmax(axis=1)).ravel()[hasValues]]
+    return modes
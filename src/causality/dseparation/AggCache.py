@@ -0,0 +1,91 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import copy
+import logging
+
+from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+
+logger = logging.getLogger(__name__)
+
+# A process-wide, size-bounded (LRU) cache of abstract ground graphs shared by Oracle (DSeparation) and RCD.
+# Entries are keyed by the schema, the set of dependencies, the perspective, and the hop threshold.
+# Every entry is an AGG built for exactly its hop threshold: an AGG keeps indexes over its nodes (e.g.,
+# getSubsumedVariables and the intersection variables of each relational variable) that removing nodes from the
+# graph would leave stale, so AGGs for smaller hop thresholds are never derived by pruning larger ones.
+DEFAULT_MAX_SIZE = 64
+
+_maxSize = DEFAULT_MAX_SIZE
+_cache = collections.OrderedDict()
+cacheRecord = {'hit': 0, 'built': 0, 'evicted': 0}
+
+
+def setMaxSize(maxSize):
+    global _maxSize
+    if maxSize < 0:
+        raise Exception("Maximum cache size must be non-negative: found {}".format(maxSize))
+    _maxSize = maxSize
+    _evict()
+
+
+def clear():
+    _cache.clear()
+
+
+def getAgg(model, perspective, hopThreshold, copyAgg=False, store=True):
+    """
+    model is any object with schema and dependencies (a Model or a SchemaDependencyWrapper).
+    Returns the AGG for the given perspective and hop threshold. Cached AGGs are shared, so callers that modify the
+    graph (e.g., RCD removing edges) must ask for a private copy with copyAgg=True.
+    With store=False, an AGG that is not cached yet is built without being cached, and is returned as is even with
+    copyAgg=True since nothing else refers to it, e.g., for RCD, which only needs a private AGG to modify.
+    """
+    dependencyKey = frozenset(model.dependencies)
+    key = (id(model.schema), dependencyKey, perspective, hopThreshold)
+    if key in _cache:
+        cacheRecord['hit'] += 1
+        _cache.move_to_end(key)
+        agg = _cache[key][1]
+        return _copyAgg(agg, model) if copyAgg else agg
+
+    cacheRecord['built'] += 1
+    agg = AbstractGroundGraph(model, perspective, hopThreshold)
+
+    if not store:
+        return agg
+
+    # the schema is kept alive with the entry so that its id cannot be reused by another schema
+    _cache[key] = (model.schema, agg)
+    _evict()
+    return _copyAgg(agg, model) if copyAgg else agg
+
+
+def _evict():
+    while len(_cache) > _maxSize:
+        _cache.popitem(last=False)
+        cacheRecord['evicted'] += 1
+
+
+def _sharedObjectsMemo(agg, model):
+    # nodes, the model, and the schema are immutable from the point of view of the AGG and are shared with copies
+    memo = {id(node): node for node in agg.nodes()}
+    memo[id(model)] = model
+    memo[id(model.schema)] = model.schema
+    return memo
+
+
+def _copyAgg(agg, model):
+    return copy.deepcopy(agg, _sharedObjectsMemo(agg, model))
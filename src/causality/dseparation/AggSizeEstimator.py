@@ -0,0 +1,166 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Estimates the size of an abstract ground graph from the schema, the dependencies, and the hop threshold, without
+building it, so that learners and the oracle can refuse, warn, or pick the compact backend before allocating.
+Relational paths are enumerated by a RelationalPathEngine. Relational variable nodes and the pairs of them that
+intersect (as RelationalVariable.intersects decides) are counted exactly. Edges between relational variables are
+counted by extending every path of the perspective with the cause path of every dependency into its terminal item
+(AbstractGroundGraph.extendPath). Edges of intersection nodes are a heuristic upper bound: an intersection node is
+counted with the edges of both its relational variables, although the AGG merges the edges they share. The tests
+check these counts against built AGGs.
+Memory is a rough estimate from per-node and per-edge constants: those of CompactAbstractGroundGraph follow its
+arrays and tables, while those of networkx graphs were measured once on networkx 1.x and vary with the networkx
+version and the Python build, so networkxBytes may be off by tens of percent.
+"""
+
+import collections
+
+from causality.dseparation import AbstractGroundGraph
+from causality.modelspace import RelationalPathEngine
+
+# rough bytes per RelationalVariable or RelationalVariableIntersection object, shared by both backends
+NODE_OBJECT_BYTES = 220
+# rough bytes per node (node, successor, and predecessor dictionary entries) and per edge (successor and predecessor
+# entries, the edge data dictionary, and its set of underlying dependencies) of a networkx 1.x AGG
+NETWORKX_BYTES_PER_NODE = 350
+NETWORKX_BYTES_PER_EDGE = 480
+# bytes per edge of the undirected graph that DSeparation derives from the AGG (two directed edges without data)
+UNDIRECTED_BYTES_PER_EDGE = 300
+# bytes per node, edge, and underlying dependency of a CompactAbstractGroundGraph
+COMPACT_BYTES_PER_NODE = 124
+COMPACT_BYTES_PER_EDGE = 32
+COMPACT_BYTES_PER_DEPENDENCY = 116
+
+
+class AggSizeEstimate(object):
+    """
+    Estimated number of nodes (exact) and edges (an upper bound) of the AGG of a perspective, and its rough memory
+    with each backend.
+    """
+
+    def __init__(self, perspective, hopThreshold, relVarNodes, intersectionNodes, relVarEdges, intersectionEdges,
+                 numDependencies):
+        self.perspective = perspective
+        self.hopThreshold = hopThreshold
+        self.relVarNodes = relVarNodes
+        self.intersectionNodes = intersectionNodes
+        self.relVarEdges = relVarEdges
+        self.intersectionEdges = intersectionEdges
+        self.numDependencies = numDependencies
+
+
+    @property
+    def nodes(self):
+        return self.relVarNodes + self.intersectionNodes
+
+
+    @property
+    def edges(self):
+        return self.relVarEdges + self.intersectionEdges
+
+
+    def networkxBytes(self):
+        return self.nodes * (NODE_OBJECT_BYTES + NETWORKX_BYTES_PER_NODE) + self.edges * NETWORKX_BYTES_PER_EDGE
+
+
+    def compactBytes(self):
+        return self.nodes * (NODE_OBJECT_BYTES + COMPACT_BYTES_PER_NODE) + self.edges * COMPACT_BYTES_PER_EDGE + \
+            self.numDependencies * COMPACT_BYTES_PER_DEPENDENCY
+
+
+    def undirectedGraphBytes(self):
+        return self.nodes * NETWORKX_BYTES_PER_NODE + self.edges * UNDIRECTED_BYTES_PER_EDGE
+
+
+    def __repr__(self):
+        return "<{} {} hop {}: {} nodes ({} intersections), {} edges, networkx {}, compact {}>".format(
+            self.__class__.__name__, self.perspective, self.hopThreshold, self.nodes, self.intersectionNodes,
+            self.edges, formatBytes(self.networkxBytes()), formatBytes(self.compactBytes()))
+
+
+def estimateAggSize(model, perspective, hopThreshold, pathEngine=None):
+    """
+    model is any object with schema and dependencies (a Model or a SchemaDependencyWrapper). Returns the
+    AggSizeEstimate of AbstractGroundGraph(model, perspective, hopThreshold).
+    """
+    if pathEngine is None:
+        pathEngine = RelationalPathEngine.getEngine(model.schema)
+    paths = [tuple(path) for path in pathEngine.getRelationalPaths(perspective, hopThreshold)]
+
+    # dependencies grouped by effect item and cause path, with their number of attribute combinations
+    causePaths = collections.defaultdict(collections.Counter)
+    for dependency in model.dependencies:
+        causePaths[dependency.relVar2.getTerminalItemName()][tuple(dependency.relVar1.path)] += 1
+
+    # edges between relational variables, and the degree of every relational variable (by path, over attributes)
+    degrees = collections.Counter()
+    relVarEdges = 0
+    for path in paths:
+        for causePath, numDependencies in causePaths[path[-1]].items():
+            for extendedPath in AbstractGroundGraph.extendPath(model.schema, list(path), list(causePath)):
+                if len(extendedPath) - 1 <= hopThreshold:
+                    relVarEdges += numDependencies
+                    degrees[path] += numDependencies
+                    degrees[tuple(extendedPath)] += numDependencies
+
+    # pairs of paths with the same terminal item intersect unless one is a prefix of the other; there is one
+    # intersection node per attribute of the terminal item, inheriting the edges of both relational variables
+    numAttributes = {itemName: len(attrNames) for itemName, attrNames in pathEngine.attributeNames.items()}
+    pathsByTerminal = collections.defaultdict(set)
+    for path in paths:
+        pathsByTerminal[path[-1]].add(path)
+    intersectionNodes = 0
+    intersectionEdges = 0
+    for terminalItemName, terminalPaths in pathsByTerminal.items():
+        prefixRelated = collections.Counter()
+        for path in terminalPaths:
+            for prefix in (path[:i] for i in range(1, len(path)) if path[:i] in terminalPaths):
+                prefixRelated[path] += 1
+                prefixRelated[prefix] += 1
+        orderedPairs = 0
+        for path in terminalPaths:
+            partners = len(terminalPaths) - 1 - prefixRelated[path]
+            orderedPairs += partners
+            intersectionEdges += partners * degrees[path]
+        intersectionNodes += orderedPairs // 2 * numAttributes[terminalItemName]
+
+    return AggSizeEstimate(perspective, hopThreshold,
+                           relVarNodes=sum(numAttributes[path[-1]] for path in paths),
+                           intersectionNodes=intersectionNodes,
+                           relVarEdges=relVarEdges,
+                           intersectionEdges=intersectionEdges,
+                           numDependencies=len(model.dependencies))
+
+
+def estimateAggSizes(model, hopThreshold, perspectives=None, pathEngine=None):
+    """
+    Returns {perspective: AggSizeEstimate} for the given perspectives (all schema items by default).
+    """
+    if perspectives is None:
+        perspectives = [item.name for item in model.schema.getSchemaItems()]
+    if pathEngine is None:
+        pathEngine = RelationalPathEngine.getEngine(model.schema)
+    return {perspective: estimateAggSize(model, perspective, hopThreshold, pathEngine) for perspective in perspectives}
+
+
+def formatBytes(numBytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if numBytes < 1024:
+            return "{:.1f}{}".format(numBytes, unit)
+        numBytes /= 1024.0
+    return "{:.1f}TB".format(numBytes)
+
@@ -0,0 +1,387 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+
+import numpy as np
+
+from causality.dseparation import AbstractGroundGraph as AbstractGroundGraphModule
+from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.RelationalDependency import RelationalVariableIntersection
+from causality.modelspace import RelationalPathEngine
+
+
+class CompactAbstractGroundGraph(object):
+    """
+    An array-backed abstract ground graph for learners that only read the graph and remove edges by underlying
+    dependency (RCD), in place of the networkx AbstractGroundGraph with its per-edge dictionaries and sets.
+    Nodes (relational variables and intersection variables) are numbered in the order given. Edges are sorted by
+    (source, target) and stored as CSR arrays: outOffsets index edges by source, inOffsets/inEdges index them by
+    target. Removed edges are cleared in the alive array, never deleted, so all indices stay fixed. The underlying
+    dependencies of each edge are interned as integers and stored both ways: edgeDepOffsets/edgeDeps per edge, and
+    depEdgeOffsets/depEdges per dependency, so removeEdgesForDependency touches only the edges of the dependency.
+    The read-only part of the networkx 1.x DiGraph interface is supported (nodes, edges, predecessors, successors,
+    has_edge, agg[node1][node2] with its UNDERLYING_DEPENDENCIES); agg[node] is a view over the CSR slice of node,
+    and edge data dictionaries are built on demand.
+    """
+
+    def __init__(self, nodes, edges, perspective=None, hopThreshold=None):
+        """
+        nodes is a sequence of AGG nodes, edges an iterable of (node1, node2, underlying dependencies) triples.
+        """
+        self._setNodes(nodes, perspective, hopThreshold)
+        sources, targets, edgeDepCounts, edgeDeps = [], [], [], []
+        for node1, node2, underlyingDependencies in edges:
+            if not underlyingDependencies:
+                raise Exception("Edge {} -> {} has no underlying dependencies".format(node1, node2))
+            sources.append(self.nodeIds[node1])
+            targets.append(self.nodeIds[node2])
+            edgeDepCounts.append(len(underlyingDependencies))
+            for dependency in underlyingDependencies:
+                if dependency not in self.dependencyIds:
+                    self.dependencyIds[dependency] = len(self.dependencyList)
+                    self.dependencyList.append(dependency)
+                edgeDeps.append(self.dependencyIds[dependency])
+        sources = np.array(sources, dtype=np.int32)
+        targets = np.array(targets, dtype=np.int32)
+        if len(np.unique(sources.astype(np.int64) * len(self.nodeList) + targets)) != len(sources):
+            raise Exception("edges must not contain duplicates")
+        edgeDepCounts = np.array(edgeDepCounts, dtype=np.int64)
+        self._pack(np.repeat(sources, edgeDepCounts), np.repeat(targets, edgeDepCounts),
+                   np.array(edgeDeps, dtype=np.int32))
+
+
+    @classmethod
+    def fromAgg(cls, agg):
+        """
+        Returns a compact copy of agg, an AbstractGroundGraph. Nodes and dependencies are shared, not copied.
+        """
+        return cls(agg.nodes(), ((node1, node2, data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES])
+                                 for node1, node2, data in agg.edges(data=True)),
+                   getattr(agg, 'perspective', None), getattr(agg, 'hopThreshold', None))
+
+
+    @classmethod
+    def build(cls, model, perspective, hopThreshold, pathEngine=None):
+        """
+        Returns the AGG of model (a Model or a SchemaDependencyWrapper) for perspective and hopThreshold, built
+        directly into arrays, without a networkx AbstractGroundGraph. The construction is that of
+        AbstractGroundGraph: a node per relational variable of the perspective within the hop threshold; an edge
+        from the extension of every such variable's path with a dependency's cause path (extendPath) to the
+        variable, for the dependencies whose effect is the variable's terminal item and attribute; and a node per
+        pair of intersecting relational variables, which inherits the edges of both.
+        """
+        if pathEngine is None:
+            pathEngine = RelationalPathEngine.getEngine(model.schema)
+        relVars = [RelationalVariable(path, attrName)
+                   for path in pathEngine.getRelationalPaths(perspective, hopThreshold)
+                   for attrName in pathEngine.attributeNames[path[-1]]]
+        relVarIds = {relVar: i for i, relVar in enumerate(relVars)}
+
+        dependencyList = list(collections.OrderedDict.fromkeys(model.dependencies))
+        causes = collections.defaultdict(list)
+        for dependencyId, dependency in enumerate(dependencyList):
+            causes[dependency.relVar2.getTerminalItemName(), dependency.relVar2.attrName].append(
+                (dependency.relVar1.path, dependency.relVar1.attrName, dependencyId))
+
+        # one row per (edge, underlying dependency) between relational variables
+        sources, targets, edgeDeps = [], [], []
+        for relVar in relVars:
+            for causePath, causeAttrName, dependencyId in causes[relVar.getTerminalItemName(), relVar.attrName]:
+                for extendedPath in AbstractGroundGraphModule.extendPath(model.schema, relVar.path, causePath):
+                    if len(extendedPath) - 1 <= hopThreshold:
+                        sources.append(relVarIds[RelationalVariable(extendedPath, causeAttrName)])
+                        targets.append(relVarIds[relVar])
+                        edgeDeps.append(dependencyId)
+        sources = np.array(sources, dtype=np.int32)
+        targets = np.array(targets, dtype=np.int32)
+        edgeDeps = np.array(edgeDeps, dtype=np.int32)
+
+        # intersection variables (numbered after the relational variables) and the rows they inherit
+        relVarsByTerminal = collections.defaultdict(list)
+        for relVar in relVars:
+            relVarsByTerminal[relVar.getTerminalItemName(), relVar.attrName].append(relVar)
+        intersections, members = [], []
+        for terminalRelVars in relVarsByTerminal.values():
+            for i, relVar1 in enumerate(terminalRelVars):
+                for relVar2 in terminalRelVars[i + 1:]:
+                    if relVar1.intersects(relVar2):
+                        intersections.append(RelationalVariableIntersection(relVar1, relVar2))
+                        members.append((relVarIds[relVar1], relVarIds[relVar2]))
+        if intersections:
+            members = np.array(members, dtype=np.int32)
+            memberNodes = np.concatenate([members[:, 0], members[:, 1]])
+            intersectionNodes = np.tile(np.arange(len(relVars), len(relVars) + len(intersections),
+                                                  dtype=np.int32), 2)
+            rowSources, rowTargets, rowDeps = [sources], [targets], [edgeDeps]
+            for byEndpoint, isTarget in ((targets, True), (sources, False)):
+                order = np.argsort(byEndpoint, kind='stable')
+                offsets = _offsets(np.bincount(byEndpoint, minlength=len(relVars)))
+                counts = offsets[memberNodes + 1] - offsets[memberNodes]
+                rows = order[_ranges(offsets[memberNodes], counts)]
+                inherited = np.repeat(intersectionNodes, counts)
+                rowSources.append(sources[rows] if isTarget else inherited)
+                rowTargets.append(inherited if isTarget else targets[rows])
+                rowDeps.append(edgeDeps[rows])
+            sources, targets, edgeDeps = (np.concatenate(arrays) for arrays in (rowSources, rowTargets, rowDeps))
+
+        agg = cls.__new__(cls)
+        agg._setNodes(relVars + intersections, perspective, hopThreshold)
+        agg.dependencyList = dependencyList
+        agg.dependencyIds = {dependency: i for i, dependency in enumerate(dependencyList)}
+        agg._pack(sources, targets, edgeDeps)
+        return agg
+
+
+    def nodes(self):
+        return list(self.nodeList)
+
+
+    def nodes_iter(self):
+        return iter(self.nodeList)
+
+
+    def __iter__(self):
+        return iter(self.nodeList)
+
+
+    def __len__(self):
+        return len(self.nodeList)
+
+
+    def __contains__(self, node):
+        return node in self.nodeIds
+
+
+    def has_node(self, node):
+        return node in self.nodeIds
+
+
+    def number_of_nodes(self):
+        return len(self.nodeList)
+
+
+    def number_of_edges(self):
+        return int(self.alive.sum())
+
+
+    def edges(self, data=False):
+        return list(self.edges_iter(data))
+
+
+    def edges_iter(self, data=False):
+        for edge in np.flatnonzero(self.alive).tolist():
+            node1, node2 = self.nodeList[self.edgeSources[edge]], self.nodeList[self.edgeTargets[edge]]
+            if data:
+                yield node1, node2, self._edgeData(edge)
+            else:
+                yield node1, node2
+
+
+    def successors(self, node):
+        edges = self._aliveEdges(self.outOffsets, None, node)
+        return [self.nodeList[i] for i in self.edgeTargets[edges].tolist()]
+
+
+    def predecessors(self, node):
+        edges = self._aliveEdges(self.inOffsets, self.inEdges, node)
+        return [self.nodeList[i] for i in self.edgeSources[edges].tolist()]
+
+
+    def successors_iter(self, node):
+        return iter(self.successors(node))
+
+
+    def predecessors_iter(self, node):
+        return iter(self.predecessors(node))
+
+
+    def neighbors(self, node):
+        return self.successors(node)
+
+
+    def has_edge(self, node1, node2):
+        return self._findEdge(node1, node2) is not None
+
+
+    def __getitem__(self, node):
+        """
+        Returns a read-only {successor: edge data} view of node, as agg[node] does for a networkx graph.
+        """
+        if node not in self.nodeIds:
+            raise KeyError(node)
+        return _SuccessorView(self, node)
+
+
+    def removeEdgesForDependency(self, dependency):
+        """
+        Removes every edge that dependency underlies. Returns the other dependencies underlying the removed edges.
+        """
+        if dependency not in self.dependencyIds:
+            return set()
+        dependencyId = self.dependencyIds[dependency]
+        edges = self.depEdges[self.depEdgeOffsets[dependencyId]:self.depEdgeOffsets[dependencyId + 1]]
+        edges = edges[self.alive[edges]]
+        self.alive[edges] = False
+        counts = self.edgeDepOffsets[edges + 1] - self.edgeDepOffsets[edges]
+        otherIds = np.unique(self.edgeDeps[_ranges(self.edgeDepOffsets[edges], counts)])
+        return {self.dependencyList[i] for i in otherIds.tolist() if i != dependencyId}
+
+
+    def getDependencyEdges(self, dependency, default=()):
+        """
+        Returns the (node1, node2) edges that dependency underlies, including removed ones.
+        """
+        if dependency not in self.dependencyIds:
+            return default
+        dependencyId = self.dependencyIds[dependency]
+        edges = self.depEdges[self.depEdgeOffsets[dependencyId]:self.depEdgeOffsets[dependencyId + 1]]
+        return [(self.nodeList[self.edgeSources[edge]], self.nodeList[self.edgeTargets[edge]])
+                for edge in edges.tolist()]
+
+
+    def numBytes(self):
+        """
+        Returns the size of the arrays and of the node and dependency tables (excluding the nodes and dependencies
+        themselves, which are shared with the AbstractGroundGraph).
+        """
+        arrays = (self.edgeSources, self.edgeTargets, self.outOffsets, self.inEdges, self.inOffsets, self.alive,
+                  self.edgeDepOffsets, self.edgeDeps, self.depEdges, self.depEdgeOffsets)
+        return sum(array.nbytes for array in arrays) + (len(self.nodeList) + len(self.dependencyList)) * \
+            _TABLE_BYTES_PER_ENTRY
+
+
+    def _setNodes(self, nodes, perspective, hopThreshold):
+        self.perspective = perspective
+        self.hopThreshold = hopThreshold
+        self.nodeList = list(nodes)
+        self.nodeIds = {node: i for i, node in enumerate(self.nodeList)}
+        if len(self.nodeIds) != len(self.nodeList):
+            raise Exception("nodes must not contain duplicates")
+        self.dependencyList = []
+        self.dependencyIds = {}
+
+
+    def _pack(self, sources, targets, edgeDeps):
+        """
+        Builds the arrays from one (source, target, dependency id) row per edge and underlying dependency. Repeated
+        rows are dropped, and the rows of an edge are merged.
+        """
+        order = np.lexsort((edgeDeps, targets, sources))
+        sources, targets, edgeDeps = sources[order], targets[order], edgeDeps[order]
+        newRow = np.ones(len(order), dtype=bool)
+        newRow[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1]) | (edgeDeps[1:] != edgeDeps[:-1])
+        sources, targets, edgeDeps = sources[newRow], targets[newRow], edgeDeps[newRow]
+        newEdge = np.ones(len(sources), dtype=bool)
+        newEdge[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+
+        self.edgeSources = sources[newEdge].astype(np.int32)
+        self.edgeTargets = targets[newEdge].astype(np.int32)
+        self.outOffsets = _offsets(np.bincount(self.edgeSources, minlength=len(self.nodeList)))
+        self.inEdges = np.lexsort((self.edgeSources, self.edgeTargets)).astype(np.int32)
+        self.inOffsets = _offsets(np.bincount(self.edgeTargets, minlength=len(self.nodeList)))
+        self.alive = np.ones(len(self.edgeSources), dtype=bool)
+
+        self.edgeDepOffsets = np.append(np.flatnonzero(newEdge), len(edgeDeps)).astype(np.int64)
+        self.edgeDeps = edgeDeps.astype(np.int32)
+        edgeOfDep = np.repeat(np.arange(len(self.edgeSources), dtype=np.int32), np.diff(self.edgeDepOffsets))
+        self.depEdges = edgeOfDep[np.argsort(self.edgeDeps, kind='stable')]
+        self.depEdgeOffsets = _offsets(np.bincount(self.edgeDeps, minlength=len(self.dependencyList)))
+
+
+    def _aliveEdges(self, offsets, edgeIndex, node):
+        i = self.nodeIds[node]
+        edges = np.arange(offsets[i], offsets[i + 1]) if edgeIndex is None else edgeIndex[offsets[i]:offsets[i + 1]]
+        return edges[self.alive[edges]]
+
+
+    def _findEdge(self, node1, node2):
+        if node1 not in self.nodeIds or node2 not in self.nodeIds:
+            return None
+        i, j = self.nodeIds[node1], self.nodeIds[node2]
+        start, end = self.outOffsets[i], self.outOffsets[i + 1]
+        edge = start + np.searchsorted(self.edgeTargets[start:end], j)
+        if edge < end and self.edgeTargets[edge] == j and self.alive[edge]:
+            return edge
+        return None
+
+
+    def _edgeData(self, edge):
+        dependencyIds = self.edgeDeps[self.edgeDepOffsets[edge]:self.edgeDepOffsets[edge + 1]]
+        return {AbstractGroundGraph.UNDERLYING_DEPENDENCIES: {self.dependencyList[i] for i in dependencyIds.tolist()}}
+
+
+class _SuccessorView(object):
+    """
+    agg[node]: the alive out-edges of node, read from the CSR arrays on each access.
+    """
+
+    def __init__(self, agg, node):
+        self.agg = agg
+        self.node = node
+
+
+    def __contains__(self, successor):
+        return self.agg._findEdge(self.node, successor) is not None
+
+
+    def __getitem__(self, successor):
+        edge = self.agg._findEdge(self.node, successor)
+        if edge is None:
+            raise KeyError(successor)
+        return self.agg._edgeData(edge)
+
+
+    def get(self, successor, default=None):
+        edge = self.agg._findEdge(self.node, successor)
+        return default if edge is None else self.agg._edgeData(edge)
+
+
+    def __iter__(self):
+        return iter(self.agg.successors(self.node))
+
+
+    def __len__(self):
+        return len(self.agg._aliveEdges(self.agg.outOffsets, None, self.node))
+
+
+    def keys(self):
+        return self.agg.successors(self.node)
+
+
+    def items(self):
+        edges = self.agg._aliveEdges(self.agg.outOffsets, None, self.node)
+        return [(self.agg.nodeList[self.agg.edgeTargets[edge]], self.agg._edgeData(edge)) for edge in edges.tolist()]
+
+
+# a list slot and a dictionary entry per node and per dependency
+_TABLE_BYTES_PER_ENTRY = 8 + 100
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _ranges(starts, counts):
+    """
+    Returns the concatenation of range(start, start + count) for all starts and counts, as an index array.
+    """
+    if not len(counts):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1])
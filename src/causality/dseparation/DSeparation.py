@@ -32,15 +32,24 @@ import random
 
 import networkx as nx
 from causality.model import RelationalValidity
-from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.dseparation import AggCache
+from causality.dseparation import AggSizeEstimator
 from causality.model import ParserUtil
 
 class DSeparation(object):
 
-    def __init__(self, model):
+    def __init__(self, model, memoryLimit=None):
+        """
+        If memoryLimit (bytes) is given, each AGG and its undirected graph are estimated before construction, and
+        an AGG that would not fit is refused with an exception instead of being built.
+        """
         self.model = model
+        self.memoryLimit = memoryLimit
+        self.aggSizeEstimates = {}
         self.perspectiveHopThresholdToAgg = {}
         self.ugs = {}
+        self.subsumedVariables = {}
+        self.validatedRelVars = set()
 
     def dSeparated(self, hopThreshold, relVar1Strs, relVar2Strs, condRelVarStrs,
                    relationalVariableSetChecker=RelationalValidity.checkValidityOfRelationalVariableSet):
@@ -65,22 +74,83 @@ class DSeparation(object):
         relationalVariableSetChecker(self.model.schema, hopThreshold, relVars1 | relVars2 | condRelVars)
 
         perspective = list(relVars1)[0].getBaseItemName()
+        agg, ug = self.getAggAndUg(perspective, hopThreshold)
+
+        # expand relVars1, relVars2, condRelVars with all intersection variables they subsume
+        relVars1 = {relVar for relVar1 in relVars1 for relVar in agg.getSubsumedVariables(relVar1)}
+        relVars2 = {relVar for relVar2 in relVars2 for relVar in agg.getSubsumedVariables(relVar2)}
+        condRelVars = {relVar for condRelVar in condRelVars for relVar in agg.getSubsumedVariables(condRelVar)}
+
+        return self._dSeparatedExpanded(relVars1, relVars2, condRelVars, agg, ug)
+
+
+    def dSeparatedRelVars(self, hopThreshold, relVars1, relVars2, condRelVars,
+                          relationalVariableSetChecker=RelationalValidity.checkValidityOfRelationalVariableSet):
+        """
+        Trusted-input variant of dSeparated. relVars1, relVars2, and condRelVars are sequences of RelationalVariable
+        objects (no string parsing). Each distinct relational variable is checked against the schema only the first
+        time it is seen for a given hop threshold, and subsumed-variable expansions are memoized per AGG.
+        """
+        relVars1 = set(relVars1)
+        relVars2 = set(relVars2)
+        condRelVars = set(condRelVars)
+        if not relVars1 or not relVars2:
+            raise Exception("relVars1 and relVars2 must be non-empty sequences of RelationalVariable objects")
+
+        allRelVars = relVars1 | relVars2 | condRelVars
+        for relVar in allRelVars:
+            if (hopThreshold, relVar) not in self.validatedRelVars:
+                relationalVariableSetChecker(self.model.schema, hopThreshold, {relVar})
+                self.validatedRelVars.add((hopThreshold, relVar))
+
+        perspective = next(iter(relVars1)).getBaseItemName()
+        for relVar in allRelVars:
+            if relVar.getBaseItemName() != perspective:
+                raise Exception("Perspective is not consistent across all relational variables")
+
+        agg, ug = self.getAggAndUg(perspective, hopThreshold)
+        subsumed = self.subsumedVariables[(perspective, hopThreshold)]
+
+        def expand(relVars):
+            expanded = set()
+            for relVar in relVars:
+                if relVar not in subsumed:
+                    subsumed[relVar] = frozenset(agg.getSubsumedVariables(relVar))
+                expanded |= subsumed[relVar]
+            return expanded
+
+        return self._dSeparatedExpanded(expand(relVars1), expand(relVars2), expand(condRelVars), agg, ug)
+
+
+    def getAggAndUg(self, perspective, hopThreshold):
         if (perspective, hopThreshold) not in self.perspectiveHopThresholdToAgg:
-            agg = AbstractGroundGraph(self.model, perspective, hopThreshold)
+            if self.memoryLimit is not None:
+                self.checkAggSize(perspective, hopThreshold)
+            agg = AggCache.getAgg(self.model, perspective, hopThreshold)
             ug = agg2ug(agg)
             self.perspectiveHopThresholdToAgg[(perspective, hopThreshold)] = agg
             self.ugs[(perspective, hopThreshold)] = ug
+            self.subsumedVariables[(perspective, hopThreshold)] = {}
         else:
             agg = self.perspectiveHopThresholdToAgg[(perspective, hopThreshold)]
             ug = self.ugs[(perspective, hopThreshold)]
+        return agg, ug
+
+
+    def checkAggSize(self, perspective, hopThreshold):
+        estimate = AggSizeEstimator.estimateAggSize(self.model, perspective, hopThreshold)
+        self.aggSizeEstimates[(perspective, hopThreshold)] = estimate
+        requiredBytes = estimate.networkxBytes() + estimate.undirectedGraphBytes()
+        if requiredBytes > self.memoryLimit:
+            raise Exception("The AGG for perspective {} at hop threshold {} needs an estimated {}, more than the "
+                            "memory limit ({}): {}".format(perspective, hopThreshold,
+                                                           AggSizeEstimator.formatBytes(requiredBytes),
+                                                           AggSizeEstimator.formatBytes(self.memoryLimit), estimate))
 
-        # expand relVars1, relVars2, condRelVars with all intersection variables they subsume
-        relVars1 = {relVar for relVar1 in relVars1 for relVar in agg.getSubsumedVariables(relVar1)}
-        relVars2 = {relVar for relVar2 in relVars2 for relVar in agg.getSubsumedVariables(relVar2)}
-        condRelVars = {relVar for condRelVar in condRelVars for relVar in agg.getSubsumedVariables(condRelVar)}
 
-        relVars1 -= condRelVars
-        relVars2 -= condRelVars
+    def _dSeparatedExpanded(self, relVars1, relVars2, condRelVars, agg, ug):
+        relVars1 = relVars1 - condRelVars
+        relVars2 = relVars2 - condRelVars
 
         if relVars1 & relVars2 != set():
             return False
@@ -0,0 +1,231 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import copy
+import logging
+
+from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.dseparation.CompactAbstractGroundGraph import CompactAbstractGroundGraph
+from causality.learning import EdgeOrientation
+from causality.model.RelationalDependency import RelationalVariable
+
+logger = logging.getLogger(__name__)
+
+RULES = ('KNC', 'CA', 'MR3')
+
+
+class IncrementalEdgeOrientation(object):
+    """
+    Worklist-driven application of the sepset-free orientation rules (known non-colliders, cycle avoidance, and
+    Meek rule 3) to the AGGs of an RCD run, in place of rescanning every AGG after each orientation.
+    Every rule pattern lies within the neighborhood of one AGG node (its center: the middle node for KNC, the node
+    whose undirected edge gets oriented for CA and MR3), so a rule is evaluated only at centers whose neighborhood may
+    have changed. Initially, every node is queued for every rule. Rules are applied as in the rescan loop of
+    RCD.applySepsetFreeOrientationRules: one AGG at a time, running the finder of EdgeOrientation on a view of the
+    AGG that enumerates only its queued centers and propagating each removal as soon as it is found. The endpoints
+    of every edge removed by RCD.propagateEdgeRemoval (found through an index from underlying dependencies to AGG
+    edges) and their neighbors are queued again after each AGG, so later AGGs see the centers changed by earlier
+    ones. KNC takes precedence over CA, and CA over MR3: a rule is applied only when the preceding ones find
+    nothing. The only difference from the rescan loop is that a center whose neighborhood changes while its AGG is
+    being scanned is evaluated on the next pass rather than on the current one; both end at the same orientations
+    (see compareWithFullRescan).
+    """
+
+    def __init__(self, rcd):
+        self.rcd = rcd
+        self.dependencyEdges = rcd.getDependencyEdges()
+        self.queues = {rule: {perspective: collections.OrderedDict.fromkeys(agg.nodes())
+                              for perspective, agg in rcd.perspectiveToAgg.items()}
+                       for rule in RULES}
+
+
+    def applyRules(self):
+        """
+        Applies KNC, CA, and MR3 until none of them orients an edge. Returns True if any edge was oriented.
+        """
+        newOrientationsFound = False
+        while any(self._applyRule(rule) for rule in RULES):
+            newOrientationsFound = True
+        return newOrientationsFound
+
+
+    def _applyRule(self, rule):
+        findRemovals = _REMOVAL_FINDERS[rule]
+        newOrientationsFound = False
+        for perspective, agg in self.rcd.perspectiveToAgg.items():
+            centers = self.queues[rule][perspective]
+            if not centers:
+                continue
+            self.queues[rule][perspective] = collections.OrderedDict()
+            removedRelDeps = set()
+            for relVar1, relVar2 in findRemovals(_CenterView(agg, centers)):
+                if not isinstance(relVar1, RelationalVariable) or not isinstance(relVar2, RelationalVariable) or \
+                        not agg.has_edge(relVar1, relVar2):
+                    continue
+                removedRelDeps |= self.rcd.propagateEdgeRemoval(agg[relVar1][relVar2]
+                    [AbstractGroundGraph.UNDERLYING_DEPENDENCIES], recurse=True)
+                self.rcd.recordEdgeOrientationUsage(rule)
+                if rule == 'KNC':
+                    logger.info("KNC Oriented edge: {node2}->{node3}".format(node2=relVar2, node3=relVar1))
+                newOrientationsFound = True
+            self._enqueueAround(removedRelDeps)
+        return newOrientationsFound
+
+
+    def _enqueueAround(self, removedRelDeps):
+        for perspective, agg in self.rcd.perspectiveToAgg.items():
+            dependencyEdges = self.dependencyEdges[perspective]
+            for node1, node2 in (edge for relDep in removedRelDeps for edge in dependencyEdges.get(relDep, ())):
+                touched = {node1, node2}
+                for node in (node1, node2):
+                    if node in agg:
+                        touched.update(agg.predecessors(node))
+                        touched.update(agg.successors(node))
+                for queue in self.queues.values():
+                    queue[perspective].update((node, None) for node in touched)
+
+
+class _CenterView(object):
+    """
+    A read-through view of an AGG for the finders of EdgeOrientation that enumerates only the given centers (as
+    nodes) and the edges incident to them. Everything else (adjacency, edge data) is read from the AGG itself, so
+    every center is evaluated on its whole, current neighborhood and removals made during a scan are seen by it.
+    """
+
+    def __init__(self, agg, centers):
+        self.agg = agg
+        self.centers = centers
+
+
+    def nodes(self):
+        return [node for node in self.centers if node in self.agg]
+
+
+    def nodes_iter(self):
+        return iter(self.nodes())
+
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+
+    def __len__(self):
+        return len(self.nodes())
+
+
+    def __contains__(self, node):
+        return node in self.agg
+
+
+    def has_node(self, node):
+        return node in self.agg
+
+
+    def has_edge(self, node1, node2):
+        return self.agg.has_edge(node1, node2)
+
+
+    def predecessors(self, node):
+        return self.agg.predecessors(node)
+
+
+    def successors(self, node):
+        return self.agg.successors(node)
+
+
+    def predecessors_iter(self, node):
+        return iter(self.agg.predecessors(node))
+
+
+    def successors_iter(self, node):
+        return iter(self.agg.successors(node))
+
+
+    def neighbors(self, node):
+        return self.agg.neighbors(node)
+
+
+    def __getitem__(self, node):
+        return self.agg[node]
+
+
+    def edges(self, data=False):
+        return list(self.edges_iter(data))
+
+
+    def edges_iter(self, data=False):
+        edges = collections.OrderedDict()
+        for center in self.nodes():
+            edges.update(((center, successor), None) for successor in self.agg.successors(center))
+            edges.update(((predecessor, center), None) for predecessor in self.agg.predecessors(center))
+        for node1, node2 in edges:
+            yield (node1, node2, self.agg[node1][node2]) if data else (node1, node2)
+
+
+def compareWithFullRescan(rcd):
+    """
+    Applies KNC, CA, and MR3 to copies of the AGGs of rcd twice, once incrementally and once with the rescan loop
+    of RCD.applySepsetFreeOrientationRules. Returns the resulting edges of both, as two
+    {perspective: set of (node1, node2)} dictionaries. rcd itself is left unchanged.
+    """
+    perspectiveToAgg = rcd.perspectiveToAgg
+    incrementalOrientationRules = rcd.incrementalOrientationRules
+    edgeOrientationRuleFrequency = dict(rcd.edgeOrientationRuleFrequency)
+    results = []
+    try:
+        for incremental in (True, False):
+            rcd.perspectiveToAgg = {perspective: copy.deepcopy(agg) for perspective, agg in perspectiveToAgg.items()}
+            rcd.incrementalOrientationRules = incremental
+            rcd.applySepsetFreeOrientationRules()
+            results.append({perspective: set(agg.edges()) for perspective, agg in rcd.perspectiveToAgg.items()})
+    finally:
+        rcd.perspectiveToAgg = perspectiveToAgg
+        rcd.incrementalOrientationRules = incrementalOrientationRules
+        rcd.edgeOrientationRuleFrequency = edgeOrientationRuleFrequency
+    return tuple(results)
+
+
+def indexDependencyEdges(perspectiveToAgg):
+    """
+    Returns {perspective: {dependency: [(node1, node2), ...]}}, the AGG edges that each underlying dependency
+    supports. Edges are only ever removed during learning, so the index stays valid as a superset. A
+    CompactAbstractGroundGraph already indexes its edges by dependency and is consulted directly.
+    """
+    index = {}
+    for perspective, agg in perspectiveToAgg.items():
+        if isinstance(agg, CompactAbstractGroundGraph):
+            index[perspective] = _CompactDependencyEdges(agg)
+            continue
+        dependencyEdges = index[perspective] = collections.defaultdict(list)
+        for node1, node2, data in agg.edges(data=True):
+            for relDep in data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES]:
+                dependencyEdges[relDep].append((node1, node2))
+    return index
+
+
+class _CompactDependencyEdges(object):
+
+    def __init__(self, agg):
+        self.agg = agg
+
+
+    def get(self, relDep, default=None):
+        return self.agg.getDependencyEdges(relDep, default)
+
+
+_REMOVAL_FINDERS = {'KNC': EdgeOrientation._findKnownNonCollidersRemovals,
+                    'CA': EdgeOrientation._findCycleAvoidanceRemovals,
+                    'MR3': EdgeOrientation._findMR3Removals}
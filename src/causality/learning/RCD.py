@@ -30,9 +30,15 @@
 import collections
 from causality.model.RelationalDependency import RelationalVariable
 from causality.learning import EdgeOrientation
+from causality.learning.IncrementalEdgeOrientation import IncrementalEdgeOrientation
+from causality.learning.IncrementalEdgeOrientation import indexDependencyEdges
 from causality.model import ParserUtil
 from causality.model import RelationalValidity
 from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.dseparation import AggCache
+from causality.dseparation.CompactAbstractGroundGraph import CompactAbstractGroundGraph
+from causality.dseparation import AggSizeEstimator
+from causality.citest.CICache import CICache
 from causality.modelspace import RelationalSpace
 import itertools
 import numbers
@@ -40,6 +46,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+AGG_BACKENDS = ('networkx', 'compact')
+
 class SchemaDependencyWrapper:
 
     def __init__(self, schema, dependencies):
@@ -60,11 +68,21 @@ class RCD(object):
         self.hopThreshold = hopThreshold
         self.depth = depth
         self.perspectiveToAgg = None
+        self.indexedAggs = None # the perspectiveToAgg that dependencyEdges and neighborCache refer to
+        self.dependencyEdges = None
+        self.neighborCache = None
         self.potentialDependencySorter = lambda l: l # no sorting by default
+        self.dependencySpace = None # optionally, a RelationalPathEngine that caches the dependency space
         self.generateSepsetCombinations = itertools.combinations
+        # re-evaluate KNC, CA, and MR3 only around changed AGG nodes (checked against the rescan loop by
+        # IncrementalEdgeOrientation.compareWithFullRescan)
+        self.incrementalOrientationRules = False
+        self.aggBackend = 'networkx' # or 'compact' for CompactAbstractGroundGraphs, e.g., at large hop thresholds
+        self.aggMemoryLimit = None # bytes; if set, AGGs are estimated before construction (see planAggBackend)
+        self.aggSizeEstimates = None
         self.undirectedDependencies = None
         self.orientedDependencies = None
-        self.ciTestCache = {}
+        self.ciTestCache = CICache() # replace with a CICache(maxBytes=...) to bound its memory
         self.ciRecord = {'Phase I': 0, 'Phase II': 0, 'total': 0}
         self.resetEdgeOrientationUsage()
         self.utRecord ={'searched':0,'found':0}
@@ -73,8 +91,7 @@ class RCD(object):
     def identifyUndirectedDependencies(self, orderIndependentSkeleton=False,times=2):
         logger.info('Phase I: identifying undirected dependencies')
         # Create fully connected undirected AGG
-        potentialDeps = RelationalSpace.getRelationalDependencies(self.schema, self.hopThreshold, includeExistence=False)
-        potentialDeps = self.potentialDependencySorter(potentialDeps)
+        potentialDeps = self.potentialDependencySorter(self.getPotentialDependencies())
         self.constructAggsFromDependencies(potentialDeps, times)
 
         self.full_num_agg_nodes = sum(len(agg.nodes()) for agg in self.perspectiveToAgg.values())
@@ -107,6 +124,7 @@ class RCD(object):
                     logger.debug("removing edge %s -- %s", relVar1, relVar2)
                     self.sepsets[relVar1, relVar2] = set(sepset)
                     self.sepsets[relVar2, relVar1] = set(sepset)
+                    self.retireCachedTests(relVar1, relVar2)
                     remainingDeps.remove(potentialDep)
                     potentialDepReverse = potentialDep.reverse()
                     remainingDeps.remove(potentialDepReverse)
@@ -118,13 +136,18 @@ class RCD(object):
                 for potentialDep in currentDepthDependenciesToRemove:
                     self.removeDependency(potentialDep)
                 currentDepthDependenciesToRemove = []
+            if isinstance(self.ciTestCache, CICache):
+                self.ciTestCache.retireBelowDepth(conditioningSetSize+1)
             if not testedAtCurrentSize: # exit early, no possible sepsets of a larger size
                 break
             potentialDeps = remainingDeps[:]
+        if isinstance(self.ciTestCache, CICache): # Phase II searches from size 0
+            self.ciTestCache.retireBelowDepth(0)
 
         self.undirectedDependencies = remainingDeps
         logger.info("Undirected dependencies: %s", self.undirectedDependencies)
         logger.info(self.ciRecord)
+        logger.info(self.cacheRecord)
         # logger.info("EDGES")
         # for edge in self.perspectiveToAgg['B'].edges():
         #     # if not isinstance(edge[0], RelationalVariableIntersection) and not isinstance(edge[1], RelationalVariableIntersection):
@@ -132,7 +155,52 @@ class RCD(object):
 
 
     def findSepset(self, relVar1, relVar2, conditioningSetSize, phaseI=True, phaseForRecording='Phase I'):
-        agg = self.perspectiveToAgg[relVar2.getBaseItemName()]
+        neighbors2 = set(self.getNeighbors(relVar2, phaseI))
+        if relVar1 in neighbors2:
+            neighbors2.remove(relVar1)
+        testedAtCurrentSize = False
+        if conditioningSetSize <= len(neighbors2):
+            for candidateSepSet in self.generateSepsetCombinations(neighbors2, conditioningSetSize):
+                logger.debug("checking %s _||_ %s | { %s }", relVar1, relVar2, candidateSepSet)
+                testedAtCurrentSize = True
+                ciTestKey = (relVar1, relVar2, tuple(sorted(list(candidateSepSet))))
+                if ciTestKey in self.ciTestCache:
+                    logger.debug("found result in CI cache")
+                    ciTestResult = self.ciTestCache[ciTestKey]
+                else:
+                    self.ciRecord[phaseForRecording] += 1
+                    depthStr = 'depth {}'.format(len(candidateSepSet))
+                    if phaseI:
+                        self.ciRecord.setdefault(depthStr, 0)
+                        self.ciRecord[depthStr] += 1
+                    self.ciRecord['total'] += 1
+                    # the raw outcome is cached, so that it can be decided again under other thresholds
+                    ciTestResult = self.citest.testConditionalIndependence(relVar1, relVar2, candidateSepSet)
+                    self.ciTestCache[ciTestKey] = ciTestResult
+                if self.citest.decide(ciTestResult):
+                    return set(candidateSepSet), testedAtCurrentSize
+        return None, testedAtCurrentSize
+
+
+    def getPotentialDependencies(self):
+        if self.dependencySpace is None:
+            return RelationalSpace.getRelationalDependencies(self.schema, self.hopThreshold, includeExistence=False)
+        return self.dependencySpace.getRelationalDependencies(self.hopThreshold)
+
+
+    def getNeighbors(self, relVar2, phaseI=True):
+        """
+        Returns the relational variables adjacent to relVar2 in its AGG, with intersection variables expanded into
+        their two sources, and, in Phase I, only those within the hop threshold. Results are cached per perspective
+        until propagateEdgeRemoval removes an edge incident to relVar2.
+        """
+        self.getDependencyEdges()
+        perspective = relVar2.getBaseItemName()
+        cache = self.neighborCache[perspective]
+        if (relVar2, phaseI) in cache:
+            return cache[relVar2, phaseI]
+
+        agg = self.perspectiveToAgg[perspective]
         neighborsMix2 = set(agg.predecessors(relVar2) + agg.successors(relVar2))
         neighbors2 = set()
         for neighbor in neighborsMix2:
@@ -154,28 +222,42 @@ class RCD(object):
                 else:
                     continue
         logger.debug("neighbors2 %s", neighbors2)
-        if relVar1 in neighbors2:
-            neighbors2.remove(relVar1)
-        testedAtCurrentSize = False
-        if conditioningSetSize <= len(neighbors2):
-            for candidateSepSet in self.generateSepsetCombinations(neighbors2, conditioningSetSize):
-                logger.debug("checking %s _||_ %s | { %s }", relVar1, relVar2, candidateSepSet)
-                testedAtCurrentSize = True
-                ciTestKey = (relVar1, relVar2, tuple(sorted(list(candidateSepSet))))
-                if ciTestKey not in self.ciTestCache:
-                    self.ciRecord[phaseForRecording] += 1
-                    depthStr = 'depth {}'.format(len(candidateSepSet))
-                    if phaseI:
-                        self.ciRecord.setdefault(depthStr, 0)
-                        self.ciRecord[depthStr] += 1
-                    self.ciRecord['total'] += 1
-                    isCondInd = self.citest.isConditionallyIndependent(relVar1, relVar2, candidateSepSet)
-                    self.ciTestCache[ciTestKey] = isCondInd
-                else:
-                    logger.debug("found result in CI cache")
-                if self.ciTestCache[ciTestKey]:
-                    return set(candidateSepSet), testedAtCurrentSize
-        return None, testedAtCurrentSize
+        cache[relVar2, phaseI] = frozenset(neighbors2)
+        return cache[relVar2, phaseI]
+
+
+    def getDependencyEdges(self):
+        """
+        Returns the index from underlying dependencies to AGG edges (see indexDependencyEdges), rebuilt along with
+        the neighbor cache whenever perspectiveToAgg is replaced.
+        """
+        if self.indexedAggs is not self.perspectiveToAgg:
+            self.indexedAggs = self.perspectiveToAgg
+            self.dependencyEdges = indexDependencyEdges(self.perspectiveToAgg)
+            self.neighborCache = {perspective: {} for perspective in self.perspectiveToAgg}
+        return self.dependencyEdges
+
+
+    def invalidateNeighbors(self, perspective, relVar):
+        cache = self.neighborCache[perspective]
+        cache.pop((relVar, True), None)
+        cache.pop((relVar, False), None)
+
+
+    @property
+    def cacheRecord(self):
+        """
+        Statistics of the CI test cache, reported alongside ciRecord.
+        """
+        if isinstance(self.ciTestCache, CICache):
+            return self.ciTestCache.stats()
+        return {'entries': len(self.ciTestCache)}
+
+
+    def retireCachedTests(self, relVar1, relVar2):
+        # once the pair has a sepset, its tests are only consulted through it
+        if isinstance(self.ciTestCache, CICache):
+            self.ciTestCache.retirePair(relVar1, relVar2)
 
 
     def removeDependency(self, dependency):
@@ -213,6 +295,7 @@ class RCD(object):
         logger.info("Separating sets: %s", self.sepsets)
         logger.info("Oriented dependencies: %s", self.orientedDependencies)
         logger.info(self.ciRecord)
+        logger.info(self.cacheRecord)
         logger.info(self.edgeOrientationRuleFrequency)
 
 
@@ -235,6 +318,9 @@ class RCD(object):
 
 
     def applySepsetFreeOrientationRules(self):
+        if self.incrementalOrientationRules:
+            IncrementalEdgeOrientation(self).applyRules()
+            return
         newOrientationsFound = True
         while newOrientationsFound:
             newOrientationsFound = self.applyKnownNonColliders() or \
@@ -357,6 +443,7 @@ class RCD(object):
                     logger.debug("recording sepset %s", sepset)
                     self.sepsets[(relVar1, relVar2)] = sepset
                     self.sepsets[(relVar2, relVar1)] = sepset
+                    self.retireCachedTests(relVar1, relVar2)
                     break
                 if not testedAtCurrentSize: # exit early, no other candidate sepsets to check
                     break
@@ -392,10 +479,68 @@ class RCD(object):
 
 
     def constructAggsFromDependencies(self, dependencies, times=2):
+        if self.aggBackend not in AGG_BACKENDS:
+            raise Exception("aggBackend must be one of {}: found {!r}".format(AGG_BACKENDS, self.aggBackend))
         schemaDepWrapper = SchemaDependencyWrapper(self.schema, dependencies)
         perspectives = [si.name for si in self.schema.getSchemaItems()]
-        self.perspectiveToAgg = {perspective: AbstractGroundGraph(schemaDepWrapper, perspective, times*self.hopThreshold)
-                                      for perspective in perspectives}
+        aggBackend = self.aggBackend if self.aggMemoryLimit is None else self.planAggBackend(dependencies, times)
+        if aggBackend == 'compact':
+            # built directly into arrays, so no networkx AGG is materialised
+            self.perspectiveToAgg = {perspective: CompactAbstractGroundGraph.build(
+                                         schemaDepWrapper, perspective, times*self.hopThreshold,
+                                         pathEngine=self.dependencySpace)
+                                     for perspective in perspectives}
+        else:
+            # AGGs are modified during learning, so each RCD run takes a private AGG, built without being cached
+            # unless a shared one is already cached (e.g., by an Oracle), which is then copied
+            self.perspectiveToAgg = {perspective: AggCache.getAgg(schemaDepWrapper, perspective,
+                                                                  times*self.hopThreshold, copyAgg=True,
+                                                                  store=False)
+                                     for perspective in perspectives}
+
+
+    def estimateAggSizes(self, dependencies=None, times=2):
+        """
+        Returns {perspective: AggSizeEstimate} for the AGGs built from dependencies (by default, the potential
+        dependencies of Phase I) at times*hopThreshold, without building them.
+        """
+        if dependencies is None:
+            dependencies = self.getPotentialDependencies()
+        return AggSizeEstimator.estimateAggSizes(SchemaDependencyWrapper(self.schema, dependencies),
+                                                 times*self.hopThreshold, pathEngine=self.dependencySpace)
+
+
+    def planAggBackend(self, dependencies, times=2):
+        """
+        Returns the backend to build the AGGs with under aggMemoryLimit: aggBackend if its estimated peak memory
+        fits, otherwise 'compact' (with a warning) if that fits. Raises an exception if neither does.
+        The peak is the sum of the AGGs of all perspectives, each built privately and once (see
+        constructAggsFromDependencies), at their estimated sizes: a rough figure that overcounts intersection edges
+        (see AggSizeEstimator).
+        """
+        self.aggSizeEstimates = self.estimateAggSizes(dependencies, times)
+        estimates = self.aggSizeEstimates.values()
+        peakBytes = {
+            # the private AGG of every perspective
+            'networkx': sum(estimate.networkxBytes() for estimate in estimates),
+            # the compact AGGs only
+            'compact': sum(estimate.compactBytes() for estimate in estimates)}
+        logger.info("Estimated AGG memory: networkx %s, compact %s (limit %s)",
+                    AggSizeEstimator.formatBytes(peakBytes['networkx']),
+                    AggSizeEstimator.formatBytes(peakBytes['compact']),
+                    AggSizeEstimator.formatBytes(self.aggMemoryLimit))
+        if peakBytes[self.aggBackend] <= self.aggMemoryLimit:
+            return self.aggBackend
+        if peakBytes['compact'] <= self.aggMemoryLimit:
+            logger.warning("AGGs at hop threshold %d need an estimated %s with the %s backend, more than the limit "
+                           "of %s: using the compact backend", times*self.hopThreshold,
+                           AggSizeEstimator.formatBytes(peakBytes[self.aggBackend]), self.aggBackend,
+                           AggSizeEstimator.formatBytes(self.aggMemoryLimit))
+            return 'compact'
+        raise Exception("AGGs at hop threshold {} need an estimated {} even with the compact backend, more than "
+                        "aggMemoryLimit ({})".format(times*self.hopThreshold,
+                                                     AggSizeEstimator.formatBytes(peakBytes['compact']),
+                                                     AggSizeEstimator.formatBytes(self.aggMemoryLimit)))
 
 
     def recordEdgeOrientationUsage(self, edgeOrientationName):
@@ -407,12 +552,23 @@ class RCD(object):
 
 
     def propagateEdgeRemoval(self, underlyingRelDeps, recurse=False):
+        """
+        Removes the AGG edges of the given dependencies in every perspective. Returns the dependencies whose edges
+        were removed.
+        """
         underlyingRelDeps = set(underlyingRelDeps)
-        for agg in self.perspectiveToAgg.values():
+        removedRelDeps = set(underlyingRelDeps)
+        dependencyEdges = self.getDependencyEdges()
+        for perspective, agg in self.perspectiveToAgg.items():
             for underlyingRelDep in underlyingRelDeps:
+                for node1, node2 in dependencyEdges[perspective].get(underlyingRelDep, ()):
+                    if agg.has_edge(node1, node2):
+                        self.invalidateNeighbors(perspective, node1)
+                        self.invalidateNeighbors(perspective, node2)
                 otherUnderlyingRelDeps = agg.removeEdgesForDependency(underlyingRelDep)
                 if recurse:
-                    self.propagateEdgeRemoval(otherUnderlyingRelDeps - underlyingRelDeps)
+                    removedRelDeps |= self.propagateEdgeRemoval(otherUnderlyingRelDeps - underlyingRelDeps)
+        return removedRelDeps
 
 
     def report(self):
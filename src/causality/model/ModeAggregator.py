@@ -0,0 +1,25 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from causality.model.Aggregator import Aggregator
+
+
+class ModeAggregator(Aggregator):
+    """
+    Aggregates the terminal set of a relational variable to its most frequent value (the smallest one on ties), so
+    that aggregated categorical attributes stay categories. Missing values are ignored; an empty terminal set has
+    no value.
+    """
+    pass
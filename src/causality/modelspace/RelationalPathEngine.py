@@ -0,0 +1,166 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import logging
+import os
+import pickle
+
+from causality.dseparation import AbstractGroundGraph
+from causality.model.RelationalDependency import RelationalVariable, RelationalDependency
+from causality.model.Schema import SchemaItem
+
+logger = logging.getLogger(__name__)
+
+# version of the cached path format and of the path extension semantics; bump it whenever either changes, so that
+# stale cache files are ignored
+CACHE_FORMAT_VERSION = 1
+
+_engines = {}
+
+
+def getEngine(schema, cacheDir=None):
+    """
+    Returns the path engine shared by all learners working on the same schema (compared by fingerprint).
+    """
+    fingerprint = schemaFingerprint(schema)
+    if fingerprint not in _engines:
+        _engines[fingerprint] = RelationalPathEngine(schema, cacheDir)
+    engine = _engines[fingerprint]
+    if cacheDir is not None:
+        engine.cacheDir = cacheDir
+    return engine
+
+
+def schemaFingerprint(schema):
+    description = []
+    for relationship in sorted(schema.getRelationships(), key=lambda item: item.name):
+        description.append(('R', relationship.name, relationship.entity1Name, relationship.entity1Card,
+                            relationship.entity2Name, relationship.entity2Card, _attributeNames(relationship)))
+    for entity in sorted(schema.getEntities(), key=lambda item: item.name):
+        description.append(('E', entity.name, _attributeNames(entity)))
+    return hashlib.sha1(repr(description).encode()).hexdigest()
+
+
+def _attributeNames(schemaItem):
+    return sorted(attr.name for attr in schemaItem.getAttributes() if attr.name != SchemaItem.EXISTS_ATTR_NAME)
+
+
+class RelationalPathEngine(object):
+    """
+    Enumerates the space of relational paths and dependencies of a schema.
+    Paths are extended one hop at a time and memoized per base schema item, so that enumerating a larger hop
+    threshold only extends the frontier of the largest enumerated hop. The validity of each one-hop extension is
+    decided by AbstractGroundGraph.extendPath, i.e., with the same (bridge burning) semantics as RelationalSpace.
+    If cacheDir is given, enumerated paths are persisted per (schema fingerprint, cache format version, hop
+    threshold) and reloaded by later runs on the same schema. A cache file is used only if the fingerprint, version,
+    and hop threshold stored in it match; otherwise the paths are enumerated again and the file is overwritten.
+    """
+
+    def __init__(self, schema, cacheDir=None):
+        self.schema = schema
+        self.cacheDir = cacheDir
+        self.fingerprint = schemaFingerprint(schema)
+        self.attributeNames = {item.name: _attributeNames(item) for item in schema.getSchemaItems()}
+        self.neighbors = {entity.name: [] for entity in schema.getEntities()}
+        for relationship in sorted(schema.getRelationships(), key=lambda item: item.name):
+            self.neighbors[relationship.name] = sorted({relationship.entity1Name, relationship.entity2Name})
+            for entityName in self.neighbors[relationship.name]:
+                self.neighbors[entityName].append(relationship.name)
+        self.pathsByHop = {}  # base item name -> list (indexed by hop) of lists of paths
+
+
+    def getRelationalPaths(self, baseItemName, hopThreshold):
+        self._ensurePaths(hopThreshold)
+        return [path for paths in self.pathsByHop[baseItemName][:hopThreshold + 1] for path in paths]
+
+
+    def iterDependenciesByEffect(self, hopThreshold):
+        """
+        Lazily yields (effect, causes) for each canonical effect relational variable, where causes is the list of
+        relational variables that are potential causes of the effect within the hop threshold. As in RelationalSpace,
+        an attribute class is never a potential cause of itself, whatever the path.
+        """
+        self._ensurePaths(hopThreshold)
+        for baseItemName in sorted(self.pathsByHop):
+            paths = self.getRelationalPaths(baseItemName, hopThreshold)
+            for effectAttrName in self.attributeNames[baseItemName]:
+                causes = [RelationalVariable(path, attrName)
+                          for path in paths for attrName in self.attributeNames[path[-1]]
+                          if path[-1] != baseItemName or attrName != effectAttrName]
+                yield RelationalVariable([baseItemName], effectAttrName), causes
+
+
+    def getRelationalDependencies(self, hopThreshold):
+        return [RelationalDependency(cause, effect)
+                for effect, causes in self.iterDependenciesByEffect(hopThreshold) for cause in causes]
+
+
+    def _ensurePaths(self, hopThreshold):
+        if self.pathsByHop and all(len(paths) > hopThreshold for paths in self.pathsByHop.values()):
+            return
+        if self._load(hopThreshold):
+            return
+
+        for baseItemName in self.neighbors:
+            paths = self.pathsByHop.setdefault(baseItemName, [[[baseItemName]]])
+            while len(paths) <= hopThreshold:
+                paths.append([extended for path in paths[-1] for extended in self._extensions(path)])
+        self._save(hopThreshold)
+
+
+    def _extensions(self, path):
+        for nextItemName in self.neighbors[path[-1]]:
+            extended = path + [nextItemName]
+            if any(list(candidate) == extended
+                   for candidate in AbstractGroundGraph.extendPath(self.schema, path, [path[-1], nextItemName])):
+                yield extended
+
+
+    def _cacheFile(self, hopThreshold):
+        return os.path.join(self.cacheDir, '{}-v{}-{}.pickle'.format(self.fingerprint, CACHE_FORMAT_VERSION,
+                                                                    hopThreshold))
+
+
+    def _load(self, hopThreshold):
+        if self.cacheDir is None or not os.path.exists(self._cacheFile(hopThreshold)):
+            return False
+        try:
+            with open(self._cacheFile(hopThreshold), 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            logger.warning("ignoring unreadable relational path cache %s: %s", self._cacheFile(hopThreshold), e)
+            return False
+        if not isinstance(cached, dict) or \
+                (cached.get('formatVersion'), cached.get('fingerprint'), cached.get('hopThreshold')) != \
+                (CACHE_FORMAT_VERSION, self.fingerprint, hopThreshold) or \
+                set(cached.get('pathsByHop', ())) != set(self.neighbors):
+            logger.warning("ignoring stale relational path cache %s", self._cacheFile(hopThreshold))
+            return False
+        self.pathsByHop = cached['pathsByHop']
+        logger.info("loaded relational paths up to hop %d from %s", hopThreshold, self._cacheFile(hopThreshold))
+        return True
+
+
+    def _save(self, hopThreshold):
+        if self.cacheDir is None:
+            return
+        os.makedirs(self.cacheDir, exist_ok=True)
+        with open(self._cacheFile(hopThreshold), 'wb') as f:
+            pickle.dump({'formatVersion': CACHE_FORMAT_VERSION,
+                         'fingerprint': self.fingerprint,
+                         'hopThreshold': hopThreshold,
+                         'pathsByHop': {baseItemName: paths[:hopThreshold + 1]
+                                        for baseItemName, paths in self.pathsByHop.items()}}, f)
@@ -15,9 +15,12 @@
 
 import collections
 import itertools
+import multiprocessing
 import numbers
 import random
+import time
 
+from causality.citest.CICache import CICache
 from causality.dseparation import AbstractGroundGraph
 from causality.model.Model import Model
 from causality.model.RelationalDependency import RelationalVariable, RelationalDependency
@@ -25,6 +28,84 @@ from causality.model.Schema import Schema
 from causality.modelspace import RelationalSpace
 
 
+class Budget(object):
+    '''
+    Limits on an RCD-Light run: wall time in seconds (counted from the start of Phase I), number of CI tests issued,
+    and maximum conditioning set size. None means unlimited.
+    '''
+
+    def __init__(self, max_time=None, max_tests=None, max_depth=None):
+        self.max_time = max_time
+        self.max_tests = max_tests
+        self.max_depth = max_depth
+        self._started = None
+
+    def start(self):
+        if self._started is None:
+            self._started = time.time()
+
+    def remaining_tests(self, num_tests):
+        if self.max_time is not None and self._started is not None and time.time() - self._started >= self.max_time:
+            return 0
+        if self.max_tests is not None:
+            return max(self.max_tests - num_tests, 0)
+        return None
+
+    def allows_depth(self, depth):
+        return self.max_depth is None or depth <= self.max_depth
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+# a sepset search cut short by the depth limit of a budget
+_UNDETERMINED = object()
+
+
+class BackgroundKnowledge(object):
+    '''
+    Prior knowledge on attribute classes, given by attribute names.
+     forbidden: (x, y) pairs such that x cannot be a direct cause of y.
+     required: (x, y) pairs such that x is known to be a direct cause of y (hence y cannot cause x).
+     tiers: a sequence of collections of attribute names in temporal order. An attribute cannot cause an attribute
+     in an earlier tier. Attributes in no tier are unconstrained.
+    '''
+
+    def __init__(self, forbidden=(), required=(), tiers=()):
+        self.forbidden = set(forbidden)
+        self.required = set(required)
+        self.tiers = dict()
+        for i, tier in enumerate(tiers):
+            for attr in tier:
+                if attr in self.tiers:
+                    raise Exception("Attribute {} appears in more than one tier".format(attr))
+                self.tiers[attr] = i
+        for x, y in self.required:
+            if not self.can_cause(x, y):
+                raise Exception("Required edge {} --> {} contradicts the other background knowledge".format(x, y))
+
+    def can_cause(self, x, y):
+        if (x, y) in self.forbidden or (y, x) in self.required:
+            return False
+        return x not in self.tiers or y not in self.tiers or self.tiers[x] <= self.tiers[y]
+
+    def can_be_adjacent(self, x, y):
+        return self.can_cause(x, y) or self.can_cause(y, x)
+
+    def orientations(self, cdg):
+        '''
+        Orientations of the undirected edges of a class dependency graph that the knowledge implies.
+        '''
+        orientations = []
+        for x, y in sorted(tuple(sorted(xy)) for xy in cdg.unoriented()):
+            if not self.can_cause(y, x):
+                orientations.append((x, y))
+            elif not self.can_cause(x, y):
+                orientations.append((y, x))
+        return orientations
+
+
 # An Improved RCD-Light algorithm
 # based on "On Learning Causal Models from Relational Data (In Proc. of AAAI-2016)"
 # Sanghack Lee & Vasant Honavar
@@ -33,39 +114,87 @@ from causality.modelspace import RelationalSpace
 # "A Sound and Complete Algorithm for Learning Causal Models from Relational Data" (In Proc. of UAI-2013)
 #
 class RCDLight(object):
-    def __init__(self, schema, ci_tester, hop_threshold):
+    def __init__(self, schema, ci_tester, hop_threshold, rng=None, ci_cache=None, dependency_space=None,
+                 budget=None, progress_callback=None, background_knowledge=None):
+        '''
+        rng is either a random.Random instance or a seed for a new one. It is the only source of randomness in
+        RCD-Light: dependencies, conditioning sets, and rule inputs are iterated in a canonical (sorted) order, so
+        that two runs with the same seed issue the same CI tests, also across processes with different hash seeds.
+        ci_cache may be shared among runs with the same CI tester. It stores raw test outcomes, which the tester
+        decides under its current thresholds.
+        dependency_space is an optional RelationalPathEngine which enumerates (and caches) potential dependencies
+        grouped by effect, in place of RelationalSpace.getRelationalDependencies.
+        budget is an optional Budget. Once it runs out, the run stops issuing CI tests and returns what it has
+        (anytime): the current skeleton, which is a superset of the complete one, and the orientations found so far.
+        budgetExhausted then tells whether the result is incomplete.
+        ci_cache defaults to an unbounded CICache; pass a CICache with maxBytes to bound its memory.
+        background_knowledge is an optional BackgroundKnowledge. Phase I then drops the dependencies between
+        attribute classes that cannot cause each other in either direction before any test, and conditions an
+        effect only on neighbors that can cause it (a superset of its parents, which suffice for a sepset). Phase II
+        starts from the orientations it implies.
+        progress_callback, if given, is called as progress_callback(phase, step, rcdl) after each depth of Phase I
+        and after each orientation step of Phase II, when undirectedDependencies and orientedDependencies reflect
+        the current state.
+        '''
         if not isinstance(hop_threshold, numbers.Integral) or hop_threshold < 0:
             raise Exception("Hop threshold must be a non-negative integer: found {}".format(hop_threshold))
 
         self._schema = schema
         self._ci_tester = ci_tester
         self._hop_threshold = hop_threshold
-        self._ci_cache = dict()
+        self._rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+        self._ci_cache = CICache() if ci_cache is None else ci_cache
+        self._dependency_space = dependency_space
         self._sepsets = dict()
         self._causes = None
+        self._order_independent = False
+        self._budget = budget if budget is not None else Budget()
+        self._progress_callback = progress_callback
+        self._background_knowledge = background_knowledge
+        self._previous_state = None  # set by warm_start
+        self._tested_candidates = dict()
+        self._tested_depth = None
+        self.budgetExhausted = False
         self.undirectedDependencies = None
         self.orientedDependencies = None
         self.ciRecord = collections.defaultdict(lambda: 0)
 
-    def identifyUndirectedDependencies(self):
+    def identifyUndirectedDependencies(self, order_independent=False):
         '''
         This is for the Phase I of RCD-Light.
+         If order_independent is set, the skeleton is learned level-synchronously (as in PC-stable): neighbor sets are
+         frozen at each depth, the tests of a depth are issued in batches, and removals are applied at the end of the
+         depth. The result then does not depend on the iteration order of dependencies.
         '''
-        potential_deps = RelationalSpace.getRelationalDependencies(self._schema, self._hop_threshold)
+        self._budget.start()
+        potential_deps = self._initialize_causes()
+        if self._previous_state is not None:
+            potential_deps = self._seed_from_previous(potential_deps)
+
+        self._order_independent = order_independent
+        try:
+            if order_independent:
+                self._identify_level_synchronously(potential_deps)
+            else:
+                self._identify_sequentially(potential_deps)
+        except _BudgetExhausted:
+            self.budgetExhausted = True
+        self._retire_below_depth(0)  # Phase II searches from depth 0
 
-        keyfunc = lambda dep: dep.relVar2
-        self._causes = {effect: set(cause.relVar1 for cause in causes)
-                        for effect, causes in
-                        itertools.groupby(sorted(potential_deps, key=keyfunc), key=keyfunc)}
+        self._update_undirected_dependencies()
+        return set(self.undirectedDependencies)
 
+    def _identify_sequentially(self, potential_deps):
         to_be_tested = set(potential_deps)
         for d in itertools.count():
-            for dep in list(to_be_tested):  # remove-safe loop
+            if not self._budget.allows_depth(d):
+                break
+            for dep in sorted(to_be_tested):  # remove-safe loop, in a canonical order
                 if dep not in to_be_tested:
                     continue
 
                 cause, effect = dep.relVar1, dep.relVar2
-                sepset, tested = self._find_sepset_with_size(cause, effect, d, 'Phase I')
+                sepset, tested = self._find_sepset_with_size(cause, effect, d, 'Phase I', phase_one=True)
                 if not tested:
                     to_be_tested.remove(dep)
                 if sepset is not None:
@@ -73,11 +202,219 @@ class RCDLight(object):
                     to_be_tested -= {dep, dep_reversed}
                     self._causes[dep.relVar2].remove(dep.relVar1)
                     self._causes[dep_reversed.relVar2].remove(dep_reversed.relVar1)
+                    self._retire_pair(cause, effect)
+            self._retire_below_depth(d + 1)
+            self._report_progress('Phase I', d)
             if not to_be_tested:
                 break
 
+    @property
+    def cacheRecord(self):
+        '''
+        Statistics of the CI cache, to be read alongside ciRecord.
+        '''
+        if isinstance(self._ci_cache, CICache):
+            return self._ci_cache.stats()
+        return {'entries': len(self._ci_cache)}
+
+    def _retire_pair(self, rv1, rv2):
+        # the tests of a decided pair are consulted again only through the sepset
+        if isinstance(self._ci_cache, CICache):
+            self._ci_cache.retirePair(rv1, rv2)
+
+    def _retire_below_depth(self, depth):
+        if isinstance(self._ci_cache, CICache):
+            self._ci_cache.retireBelowDepth(depth)
+
+    def _update_undirected_dependencies(self):
         self.undirectedDependencies = {RelationalDependency(c, e) for e, cs in self._causes.items() for c in cs}
-        return set(self.undirectedDependencies)
+
+    def _report_progress(self, phase, step, cdg=None):
+        if self._progress_callback is None:
+            return
+        if cdg is None:
+            self._update_undirected_dependencies()
+        else:
+            self.orientedDependencies = self._oriented_dependencies(cdg)
+        self._progress_callback(phase, step, self)
+
+    def get_state(self):
+        '''
+        Returns a picklable summary of this run, from which a run at a larger hop threshold can be warm-started.
+        '''
+        return {'hop_threshold': self._hop_threshold,
+                'order_independent': self._order_independent,
+                'ci_cache': self._ci_cache,
+                'background_knowledge': self._background_knowledge,
+                'causes': self._causes,
+                'sepsets': self._sepsets,
+                'max_depth': self._budget.max_depth,
+                'budget_exhausted': self.budgetExhausted}
+
+    @classmethod
+    def warm_start(cls, schema, ci_tester, previous, hop_threshold, rng=None, dependency_space=None, budget=None,
+                   progress_callback=None):
+        '''
+        Runs Phase I at a hop threshold no smaller than that of a finished run, given as an RCDLight or its
+        get_state(), with the same CI tester, and returns the new RCDLight.
+         Phase I starts from the previous skeleton: dependencies separated before stay separated, with their sepsets
+         (a CI result does not depend on the hop threshold). A dependency that survived the previous run was tested
+         against every conditioning set drawn from its previous candidates (up to the previous depth limit), so it
+         is tested only against conditioning sets with at least one new candidate; newly introduced dependencies are
+         tested in full. Every cached CI result of the previous run is reused. The result is a valid Phase I result
+         at the new hop threshold (with an oracle, the same skeleton as a cold run), though sepsets may differ from
+         those a cold run would find first. If the previous run ran out of budget, its surviving dependencies are
+         tested in full. budget and progress_callback are as in the constructor.
+        '''
+        state = previous.get_state() if isinstance(previous, RCDLight) else previous
+        if hop_threshold < state['hop_threshold']:
+            raise Exception("Hop threshold must not be smaller than the previous one: found {} < {}".format(
+                hop_threshold, state['hop_threshold']))
+
+        rcdl = cls(schema, ci_tester, hop_threshold, rng, ci_cache=state['ci_cache'].copy(),
+                   dependency_space=dependency_space, budget=budget, progress_callback=progress_callback,
+                   background_knowledge=state.get('background_knowledge'))
+        rcdl._previous_state = state
+        rcdl.identifyUndirectedDependencies(order_independent=state['order_independent'])
+        return rcdl
+
+    def _seed_from_previous(self, potential_deps):
+        '''
+        Removes the dependencies separated in the previous run (see warm_start) and records, for each dependency
+        that survived it, the candidates whose conditioning sets were already tested. Returns the dependencies left
+        to test.
+        '''
+        state = self._previous_state
+        self._sepsets.update((key, set(sepset)) for key, sepset in state['sepsets'].items())
+        separated = [dep for dep in potential_deps if frozenset({dep.relVar1, dep.relVar2}) in self._sepsets or
+                     frozenset({dep.reverse().relVar1, dep.reverse().relVar2}) in self._sepsets]
+        for dep in separated:
+            self._causes[dep.relVar2].discard(dep.relVar1)
+
+        if not state['budget_exhausted']:
+            previous_causes = state['causes']
+            self._tested_depth = state['max_depth']
+            self._tested_candidates = {
+                (dep.relVar1, dep.relVar2): frozenset(self._conditioning_candidates(dep.relVar1, dep.relVar2,
+                                                                                    previous_causes[dep.relVar2]))
+                for dep in potential_deps if dep.relVar1 in previous_causes.get(dep.relVar2, ())}
+        separated = set(separated)
+        return [dep for dep in potential_deps if dep not in separated]
+
+    def _phase_one_conditions(self, rv1, rv2, neighbors, size):
+        '''
+        Conditioning sets of the given size drawn from neighbors, except those a warm-started run already tested.
+        '''
+        conditions = itertools.combinations(neighbors, size)
+        tested = self._tested_candidates.get((rv1, rv2))
+        if tested is None or (self._tested_depth is not None and size > self._tested_depth):
+            return conditions
+        return (condition for condition in conditions if not tested.issuperset(condition))
+
+    def _initialize_causes(self):
+        '''
+        Sets every potential cause of each effect as its neighbor, and returns all potential dependencies.
+        '''
+        if self._dependency_space is not None:
+            self._causes = {effect: set(causes)
+                            for effect, causes in self._dependency_space.iterDependenciesByEffect(self._hop_threshold)}
+            potential_deps = [RelationalDependency(c, e) for e, cs in self._causes.items() for c in cs]
+        else:
+            potential_deps = RelationalSpace.getRelationalDependencies(self._schema, self._hop_threshold)
+
+            keyfunc = lambda dep: dep.relVar2
+            self._causes = {effect: set(cause.relVar1 for cause in causes)
+                            for effect, causes in
+                            itertools.groupby(sorted(potential_deps, key=keyfunc), key=keyfunc)}
+
+        if self._background_knowledge is not None:
+            # symmetric in cause and effect, so that a dependency and its reverse go together
+            can_be_adjacent = self._background_knowledge.can_be_adjacent
+            for effect, causes in self._causes.items():
+                causes -= {cause for cause in causes if not can_be_adjacent(cause.attrName, effect.attrName)}
+            potential_deps = [dep for dep in potential_deps
+                              if can_be_adjacent(dep.relVar1.attrName, dep.relVar2.attrName)]
+        return potential_deps
+
+    def _conditioning_candidates(self, rv1, rv2, causes=None):
+        '''
+        Neighbors of rv2 (by default, its current ones) other than rv1 that may be in its sepset in Phase I.
+        '''
+        causes = self._causes[rv2] if causes is None else causes
+        if self._background_knowledge is None:
+            return [c for c in causes if c != rv1]
+        can_cause = self._background_knowledge.can_cause
+        return [c for c in causes if c != rv1 and can_cause(c.attrName, rv2.attrName)]
+
+    def _identify_level_synchronously(self, potential_deps):
+        to_be_tested = set(potential_deps)
+        for d in itertools.count():
+            if not self._budget.allows_depth(d):
+                break
+            frozen_causes = {effect: sorted(causes) for effect, causes in self._causes.items()}
+
+            # each dependency searches its candidate conditioning sets of size d in a canonical order
+            searches = collections.OrderedDict()
+            for dep in sorted(to_be_tested):
+                neighbors = self._conditioning_candidates(dep.relVar1, dep.relVar2, frozen_causes[dep.relVar2])
+                if d <= len(neighbors):
+                    searches[dep] = self._phase_one_conditions(dep.relVar1, dep.relVar2, neighbors, d)
+            to_be_tested = set(searches)
+
+            # in each round, the next candidate of every unresolved search is tested in one batch
+            to_be_removed = set()
+            try:
+                while searches:
+                    batch = []
+                    for dep, candidates in list(searches.items()):
+                        condition = next(candidates, None)
+                        if condition is None:
+                            del searches[dep]
+                        else:
+                            batch.append((dep, condition))
+
+                    results = self._test_batch([(dep.relVar1, dep.relVar2, condition) for dep, condition in batch],
+                                               'Phase I')
+                    for (dep, condition), is_ci in zip(batch, results):
+                        if is_ci:
+                            self._sepsets[frozenset({dep.relVar1, dep.relVar2})] = set(condition)
+                            to_be_removed |= {dep, dep.reverse()}
+                            searches.pop(dep, None)
+                            searches.pop(dep.reverse(), None)
+            finally:
+                # independencies found before running out of budget still hold
+                for dep in to_be_removed:
+                    self._causes[dep.relVar2].remove(dep.relVar1)
+                    self._retire_pair(dep.relVar1, dep.relVar2)
+            to_be_tested -= to_be_removed
+            self._retire_below_depth(d + 1)
+            self._report_progress('Phase I', d)
+            if not to_be_tested:
+                break
+
+    def _test_batch(self, tests, record='unknown'):
+        '''
+        Returns the (cached) CI test results for (rv1, rv2, condition) triples.
+         Tests not in the cache are handed to the CI tester in a single batch.
+        '''
+        ci_keys = [(rv1, rv2, tuple(sorted(list(condition)))) for rv1, rv2, condition in tests]
+        # outcomes are read before the new ones are cached, which may evict entries from a bounded cache
+        outcomes = [self._ci_cache[ci_key] if ci_key in self._ci_cache else None for ci_key in ci_keys]
+        untested = [i for i, outcome in enumerate(outcomes) if outcome is None]
+        remaining = self._budget.remaining_tests(self.ciRecord['total'])
+        exhausted = remaining is not None and remaining < len(untested)
+        if exhausted:
+            untested = untested[:remaining]
+        if untested:
+            results = self._ci_tester.testConditionalIndependenceBatch([tests[i] for i in untested])
+            for i, result in zip(untested, results):
+                self.ciRecord[record] += 1
+                self.ciRecord['total'] += 1
+                self._ci_cache[ci_keys[i]] = outcomes[i] = result
+        if exhausted:
+            raise _BudgetExhausted()
+
+        return [self._ci_tester.decide(outcome) for outcome in outcomes]
 
     def _enumerate_RUTs(self):
         '''
@@ -98,12 +435,19 @@ class RCDLight(object):
                 if QRz != Vx and QRz not in self._causes[Vx]:
                     yield QRz, Qy, Vx
 
-    def orientDependencies(self, background_knowledge=None):
+    def orientDependencies(self, background_knowledge=None, processes=None):
         '''
         This is Phase II of RCD-Light.
          This orients dependencies based on both
          (i) CI-based orientation and;
          (ii) constraints-based orientation.
+         background_knowledge is either orientations as (x, y) attribute pairs or a BackgroundKnowledge; it defaults
+         to the one given to the constructor.
+         With processes > 1, the connected components of the class dependency graph, whose orientations cannot
+         interact, are oriented concurrently by forked worker processes, each with its own PDAG, ancestral
+         relationships, and non-colliders. The result is the same as that of a sequential run. Runs fall back to
+         sequential processing without fork, with a limit on the number of tests, or with fewer than two
+         components to orient.
         '''
         assert self.undirectedDependencies is not None
 
@@ -112,31 +456,121 @@ class RCDLight(object):
         # initialize class dependency graph
         cdg = PDAG((c.attrName, e.attrName) for e, cs in self._causes.items() for c in cs)
         ancestrals = Ancestral(cdg.vertices())
+        if background_knowledge is None:
+            background_knowledge = self._background_knowledge
+        if isinstance(background_knowledge, BackgroundKnowledge):
+            background_knowledge = background_knowledge.orientations(cdg)
         if background_knowledge is not None:
             cdg.orients(background_knowledge)
             RCDLight._apply_rules(cdg, non_colliders, ancestrals)
 
-        # enumerate all representative unshielded triples
-        ruts = list(set(self._enumerate_RUTs()))
-        random.shuffle(ruts)
-        # take advantage of cached CIs
-        ruts.sort(key=lambda ut: frozenset({ut[0], ut[2]}) in self._sepsets,
-                  reverse=True)
+        # enumerate all representative unshielded triples (in a canonical order, then shuffled reproducibly)
+        ruts = sorted(set(self._enumerate_RUTs()))
+        self._rng.shuffle(ruts)
+        # take advantage of cached CIs, and of RUTs likely to propagate more orientations (a static ordering, ranked
+        # once against the initial class dependency graph)
+        ruts.sort(key=lambda ut: self._rut_priority(cdg, ut), reverse=True)
+
+        # RUTs sharing an attribute class triple are processed together, in priority order (cached sepsets first),
+        # until the orientation of the triple is implied (see _is_resolved).
+        groups = collections.OrderedDict()
+        for rut in ruts:
+            groups.setdefault(tuple(rv.attrName for rv in rut), []).append(rut)
+
+        components = self._partition_groups(cdg, groups) if processes is not None and processes > 1 else []
+        if len(components) > 1 and self._budget.max_tests is None and \
+                'fork' in multiprocessing.get_all_start_methods():
+            self._orient_components_in_parallel(cdg, components, processes)
+        else:
+            try:
+                for step, ((z, y, x), group) in enumerate(groups.items()):
+                    self._orient_group(cdg, non_colliders, ancestrals, z, y, x, group)
+                    self._report_progress('Phase II', step, cdg)
+            except _BudgetExhausted:
+                self.budgetExhausted = True
 
-        for rv1, rv2, crv3 in ruts:
-            z, y, x = rv1.attrName, rv2.attrName, crv3.attrName
+        #
+        self._reflect_orientations(cdg)
+        self._update_oriented_dependencies()
+        return set(self.orientedDependencies)
 
-            # Check skippable tests
-            if cdg.is_oriented(z, y) and cdg.is_oriented(x, y):  # already oriented
-                continue
-            if (y, frozenset({x, z})) in non_colliders:  # already non-collider
-                continue
-            if z in cdg.de(x):  # delegate to its complement UT.
-                continue
-            if cdg.is_oriented_as(y, x) or cdg.is_oriented_as(y, z):  # an inactive non-collider
+    @staticmethod
+    def _partition_groups(cdg, groups):
+        '''
+        Splits RUT groups by the connected component of the class dependency graph they lie in. Returns a list of
+        (vertices, groups) in the order of the first group of each component.
+        '''
+        component_of = dict()
+        for v in sorted(cdg.vertices()):
+            if v in component_of:
                 continue
+            component_of[v] = v
+            stack = [v]
+            while stack:
+                for w in cdg.adj(stack.pop()):
+                    if w not in component_of:
+                        component_of[w] = v
+                        stack.append(w)
+
+        components = collections.OrderedDict()
+        for (z, y, x), group in groups.items():
+            components.setdefault(component_of[y], collections.OrderedDict())[z, y, x] = group
+        return [({v for v, c in component_of.items() if c == root}, component_groups)
+                for root, component_groups in components.items()]
+
+    def _orient_components_in_parallel(self, cdg, components, processes):
+        global _PHASE_II_CONTEXT
+        _PHASE_II_CONTEXT = self, cdg, components
+        try:
+            with multiprocessing.get_context('fork').Pool(min(processes, len(components))) as pool:
+                results = pool.map(_orient_component_in_worker, range(len(components)))
+        finally:
+            _PHASE_II_CONTEXT = None
+
+        # merge in component order, which is also the order a sequential run would have found them
+        for step, (oriented, sepsets, ci_entries, ci_record, budget_exhausted) in enumerate(results):
+            cdg.orients(oriented)
+            self._sepsets.update(sepsets)
+            for ci_key, outcome in ci_entries:
+                self._ci_cache[ci_key] = outcome
+            for record, count in ci_record.items():
+                self.ciRecord[record] += count
+            self.budgetExhausted |= budget_exhausted
+            self._report_progress('Phase II', step, cdg)
+
+    def _orient_component(self, cdg, vertices, groups):
+        '''
+        Orients one connected component of the class dependency graph (in a worker process). Returns its
+        orientations and everything the run learned along the way: new sepsets, new CI cache entries, and the
+        counts of CI tests issued.
+        '''
+        component_cdg = PDAG((x, y) for x, y in cdg.E if x in vertices)
+        non_colliders = set()
+        ancestrals = Ancestral(vertices)
+        known_sepsets = set(self._sepsets)
+        ci_record = dict(self.ciRecord)
+        self._ci_cache = _RecordingCache(self._ci_cache)
+        try:
+            for (z, y, x), group in groups.items():
+                self._orient_group(component_cdg, non_colliders, ancestrals, z, y, x, group)
+        except _BudgetExhausted:
+            self.budgetExhausted = True
+
+        return (component_cdg.oriented(),
+                {key: sepset for key, sepset in self._sepsets.items() if key not in known_sepsets},
+                self._ci_cache.added,
+                {record: count - ci_record.get(record, 0) for record, count in self.ciRecord.items()},
+                self.budgetExhausted)
+
+    def _orient_group(self, cdg, non_colliders, ancestrals, z, y, x, group):
+        for rv1, rv2, crv3 in group:
+            # abandon the group once its orientation is fixed
+            if RCDLight._is_resolved(cdg, non_colliders, x, y, z):
+                break
 
             sepset = self._find_sepset(rv1, crv3, 'Phase II')
+            if sepset is _UNDETERMINED:  # cut short by the depth limit
+                continue
             if sepset is not None:
                 if rv2 not in sepset:  # collider
                     cdg.orients(((z, y), (x, y)))
@@ -153,10 +587,29 @@ class RCDLight(object):
 
             RCDLight._apply_rules(cdg, non_colliders, ancestrals)
 
-        #
-        self._reflect_orientations(cdg)
-        self._update_oriented_dependencies()
-        return set(self.orientedDependencies)
+    @staticmethod
+    def _is_resolved(cdg, non_colliders, x, y, z):
+        '''
+        Whether the outcome of testing a RUT of the attribute class triple z -- y -- x is already implied.
+        '''
+        if cdg.is_oriented(z, y) and cdg.is_oriented(x, y):  # already oriented
+            return True
+        if (y, frozenset({x, z})) in non_colliders:  # already non-collider
+            return True
+        if z in cdg.de(x):  # delegate to its complement UT.
+            return True
+        if cdg.is_oriented_as(y, x) or cdg.is_oriented_as(y, z):  # an inactive non-collider
+            return True
+        return False
+
+    def _rut_priority(self, cdg, rut):
+        '''
+        A RUT with a cached sepset costs no CI test. Among the others, a RUT whose middle attribute class has more
+        undirected edges is likely to trigger more Meek-rule propagation once it is resolved. RUTs are ranked once,
+        before any of them is resolved; the ranking does not follow later orientations.
+        '''
+        rv1, rv2, crv3 = rut
+        return frozenset({rv1, crv3}) in self._sepsets, len(cdg.ne(rv2.attrName))
 
     def _reflect_orientations(self, cdg):
         for effect, causes in self._causes.items():
@@ -164,14 +617,26 @@ class RCDLight(object):
                 if cdg.is_oriented_as(effect.attrName, cause.attrName):
                     causes.remove(cause)
 
-    def _update_oriented_dependencies(self):
-        self.orientedDependencies = set()
-        for effect, causes in self._causes.items():
-            for cause in causes:
+    def _oriented_dependencies(self, cdg=None):
+        '''
+        The oriented dependencies, additionally under the orientations of cdg if given, without modifying the
+        neighbor sets.
+        '''
+        causes = self._causes
+        if cdg is not None:
+            causes = {effect: {cause for cause in cs if not cdg.is_oriented_as(effect.attrName, cause.attrName)}
+                      for effect, cs in causes.items()}
+        oriented = set()
+        for effect, cs in causes.items():
+            for cause in cs:
                 dep = RelationalDependency(cause, effect)
                 rev = dep.reverse()
-                if rev.relVar1 not in self._causes[rev.relVar2]:
-                    self.orientedDependencies.add(dep)
+                if rev.relVar1 not in causes[rev.relVar2]:
+                    oriented.add(dep)
+        return oriented
+
+    def _update_oriented_dependencies(self):
+        self.orientedDependencies = self._oriented_dependencies()
 
     @staticmethod
     def _apply_rules(pdag, non_colliders, ancestral):
@@ -187,7 +652,7 @@ class RCDLight(object):
             changed = False
 
             changed |= MeekRules.rule_2(pdag)
-            for y, (x, z) in non_colliders:
+            for y, x, z in sorted((y, min(xz), max(xz)) for y, xz in non_colliders):
                 changed |= MeekRules.rule_1(pdag, x, y, z)
                 changed |= MeekRules.rule_3(pdag, x, y, z)
                 changed |= MeekRules.rule_4(pdag, x, y, z)
@@ -197,23 +662,33 @@ class RCDLight(object):
                 elif (z, x) in ancestral:
                     changed |= pdag.orient(y, x)
 
-    def _find_sepset_with_size(self, rv1, rv2, size, record='unknown'):
+    def _find_sepset_with_size(self, rv1, rv2, size, record='unknown', phase_one=False):
         assert len(rv2.path) == 1
-        is_ci = self._ci_tester.isConditionallyIndependent
+        ci_test = self._ci_tester.testConditionalIndependence
 
-        neighbors = set(self._causes[rv2]) - {rv1}
+        # candidates in a canonical order, so that the tests issued and the sepset found do not depend on hashing
+        if phase_one:
+            neighbors = sorted(set(self._conditioning_candidates(rv1, rv2)))
+        else:
+            neighbors = sorted(set(self._causes[rv2]) - {rv1})
         if size > len(neighbors):
             return None, False
 
-        for condition in itertools.combinations(neighbors, size):
+        conditions = self._phase_one_conditions(rv1, rv2, neighbors, size) if phase_one else \
+            itertools.combinations(neighbors, size)
+        for condition in conditions:
             ci_key = (rv1, rv2, tuple(sorted(list(condition))))
 
-            if ci_key not in self._ci_cache:
+            if ci_key in self._ci_cache:
+                outcome = self._ci_cache[ci_key]
+            else:
+                if self._budget.remaining_tests(self.ciRecord['total']) == 0:
+                    raise _BudgetExhausted()
                 self.ciRecord[record] += 1
                 self.ciRecord['total'] += 1
-                self._ci_cache[ci_key] = is_ci(rv1, rv2, condition)
+                self._ci_cache[ci_key] = outcome = ci_test(rv1, rv2, condition)
 
-            if self._ci_cache[ci_key]:
+            if self._ci_tester.decide(outcome):
                 self._sepsets[frozenset({rv1, rv2})] = set(condition)
                 return set(condition), True
 
@@ -226,14 +701,47 @@ class RCDLight(object):
             return self._sepsets[key]
 
         for d in itertools.count():
+            if not self._budget.allows_depth(d):
+                return _UNDETERMINED
             sepset, tested = self._find_sepset_with_size(rv1, rv2, d, record)
             if sepset is not None:
                 self._sepsets[key] = sepset
+                self._retire_pair(rv1, rv2)
                 return sepset
             if not tested:
                 return None
 
 
+# (RCDLight, class dependency graph, components) shared with forked Phase II workers
+_PHASE_II_CONTEXT = None
+
+
+def _orient_component_in_worker(i):
+    rcdl, cdg, components = _PHASE_II_CONTEXT
+    vertices, groups = components[i]
+    return rcdl._orient_component(cdg, vertices, groups)
+
+
+class _RecordingCache(object):
+    '''
+    A CI cache view that remembers the entries added through it.
+    '''
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.added = []
+
+    def __contains__(self, ci_key):
+        return ci_key in self.cache
+
+    def __getitem__(self, ci_key):
+        return self.cache[ci_key]
+
+    def __setitem__(self, ci_key, outcome):
+        self.cache[ci_key] = outcome
+        self.added.append((ci_key, outcome))
+
+
 class Ancestral:
     '''
     Record ancestral relationships (or equivalently, partially ordered)
@@ -442,7 +950,7 @@ class MeekRules:
     @staticmethod
     def rule_2(pdag: PDAG):
         changed = False
-        for x, y in list(pdag.E):
+        for x, y in sorted(pdag.E):
             if pdag.is_unoriented(x, y):  # will check y,x, too
                 if pdag.ch(x) & pdag.pa(y):  # x-->w-->y
                     changed |= pdag.orient(x, y)
@@ -468,13 +976,58 @@ class MeekRules:
         return False
 
 
-def runRCDLight(schema, citest, hopThreshold):
-    rcdl = RCDLight(schema, citest, hopThreshold)
+def runRCDLight(schema, citest, hopThreshold, rng=None):
+    rcdl = RCDLight(schema, citest, hopThreshold, rng)
     rcdl.identifyUndirectedDependencies()
     rcdl.orientDependencies()
     return rcdl.orientedDependencies
 
 
+def relearnRCDLight(rcdl, rng=None):
+    '''
+    Re-learns a finished RCD-Light run after its CI tester has been updated with new data (e.g., an
+    IncrementalLinearCITest after appendData). Every cached CI outcome is re-evaluated, which costs no pass over the
+    data for a sufficient-statistics tester. If no decision flips, the run is still valid and is returned as is.
+    Otherwise, a new run is made with the refreshed cache, so that CI tests are issued only where the search now
+    explores conditioning sets it has not visited before.
+    '''
+    ci_tester = rcdl._ci_tester
+    flipped = False
+    for (rv1, rv2, condition), outcome in list(rcdl._ci_cache.items()):
+        updated = ci_tester.testConditionalIndependence(rv1, rv2, condition)
+        flipped |= ci_tester.decide(outcome) != ci_tester.decide(updated)
+        rcdl._ci_cache[(rv1, rv2, condition)] = updated
+    if not flipped:
+        return rcdl
+
+    relearned = RCDLight(rcdl._schema, ci_tester, rcdl._hop_threshold, rng, ci_cache=rcdl._ci_cache,
+                         dependency_space=rcdl._dependency_space)
+    relearned.identifyUndirectedDependencies(order_independent=rcdl._order_independent)
+    relearned.orientDependencies()
+    return relearned
+
+
+def sweepRCDLight(schema, citest, hopThreshold, thresholds, rng=None):
+    '''
+    Runs RCD-Light for each (alpha, soeThreshold) pair in thresholds with a single CI cache. Since the cache keeps
+    p-values and effect sizes, a CI test is issued only when a run explores a conditioning set not seen before.
+    Returns a dictionary from each pair to the oriented dependencies found.
+    '''
+    original_thresholds = citest.alpha, citest.soeThreshold
+    ci_cache = CICache()
+    results = dict()
+    try:
+        for alpha, soe_threshold in thresholds:
+            citest.alpha, citest.soeThreshold = alpha, soe_threshold
+            rcdl = RCDLight(schema, citest, hopThreshold, rng, ci_cache=ci_cache)
+            rcdl.identifyUndirectedDependencies()
+            rcdl.orientDependencies()
+            results[(alpha, soe_threshold)] = rcdl.orientedDependencies
+    finally:
+        citest.alpha, citest.soeThreshold = original_thresholds
+    return results
+
+
 
 # This example is given in the AAAI paper
 def incompleteness_example():
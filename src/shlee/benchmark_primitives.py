@@ -0,0 +1,257 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+'''
+Micro-benchmarks for the primitives that dominate RCD-Light's time outside CI tests: PDAG queries and orientation,
+Meek rules, RCDLight._apply_rules, Ancestral.add, and RelationalDependency hashing and reversal.
+Graphs are generated from a random DAG over attribute classes, the vertices of the class dependency graph in RCD-Light
+(attribute names), with a given number of vertices and edge density (seeded, so runs are comparable). For each
+benchmark, operations per second (best of several repeats) are reported, along with the peak and retained bytes that
+tracemalloc traces per operation and the number of memory blocks each operation leaves allocated. Results can be saved as a JSON baseline
+and later runs compared against it; the exit status is 1 if any benchmark is slower than the baseline by more than
+the tolerance.
+
+    python -m shlee.benchmark_primitives --save baseline.json
+    python -m shlee.benchmark_primitives --compare baseline.json --tolerance 0.2
+'''
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from causality.model.RelationalDependency import RelationalDependency
+from causality.model.RelationalDependency import RelationalVariable
+from shlee.RCDLight import PDAG, MeekRules, Ancestral, RCDLight
+
+
+class Graphs:
+    '''
+    A random DAG and the structures derived from it: its skeleton as a PDAG with unshielded colliders oriented, the
+    non-colliders of the DAG, and ancestral relationships among its vertices.
+    '''
+
+    def __init__(self, num_vertices, density, seed):
+        rng = random.Random(seed)
+        self.vertices = ['X{}'.format(i) for i in range(num_vertices)]
+        self.edges = [(x, y) for x, y in itertools.combinations(self.vertices, 2) if rng.random() < density]
+        self.dag = PDAG(self.edges)
+
+        self.pdag = PDAG()
+        for x, y in self.edges:
+            self.pdag.add_undirected_edge(x, y)
+        self.non_colliders = []
+        for y in self.vertices:
+            for x, z in itertools.combinations(sorted(self.dag.adj(y)), 2):
+                if x in self.dag.pa(y) and z in self.dag.pa(y):
+                    if not self.dag.is_adj(x, z):
+                        self.pdag.orient(x, y)
+                        self.pdag.orient(z, y)
+                else:
+                    self.non_colliders.append((y, (x, z)))
+
+        self.ancestral_pairs = [(x, y) for x in self.vertices for y in self.dag.de(x)]
+        rng.shuffle(self.ancestral_pairs)
+        self.ancestral = Ancestral(self.vertices)
+        self.ancestral.adds(self.ancestral_pairs[:len(self.ancestral_pairs) // 10])
+
+        self.dependencies = [RelationalDependency(RelationalVariable(['I0', 'R{}'.format(i), 'I{}'.format(i)], 'a'),
+                                                  RelationalVariable(['I0'], 'b')) for i in range(num_vertices)]
+
+
+def _pdag_queries(query):
+    def benchmark(graphs):
+        pdag = graphs.pdag
+        vertices = graphs.vertices
+        return lambda: pdag, lambda p: [query(p, v) for v in vertices], len(vertices)
+    return benchmark
+
+
+def _orient(graphs):
+    edges = list(graphs.pdag.unoriented())
+    return graphs.pdag.copy, lambda p: [p.orient(*sorted(edge)) for edge in edges], max(len(edges), 1)
+
+
+def _de(graphs):
+    dag = graphs.dag
+    vertices = graphs.vertices
+    return lambda: dag, lambda p: [p.de(v) for v in vertices], len(vertices)
+
+
+def _meek_rule(rule):
+    def benchmark(graphs):
+        triples = [(x, y, z) for y, (x, z) in graphs.non_colliders]
+        return graphs.pdag.copy, lambda p: [rule(p, x, y, z) for x, y, z in triples], max(len(triples), 1)
+    return benchmark
+
+
+def _meek_rule_2(graphs):
+    return graphs.pdag.copy, MeekRules.rule_2, 1
+
+
+def _apply_rules(graphs):
+    return graphs.pdag.copy, lambda p: RCDLight._apply_rules(p, graphs.non_colliders, graphs.ancestral), 1
+
+
+def _ancestral_add(graphs):
+    pairs = graphs.ancestral_pairs
+    return lambda: Ancestral(graphs.vertices), lambda a: [a.add(x, y) for x, y in pairs], max(len(pairs), 1)
+
+
+def _dependency_hash(graphs):
+    # fresh objects, as made by reverse() and by the learners, have not cached anything yet
+    def setup():
+        return [RelationalDependency(RelationalVariable(list(dep.relVar1.path), dep.relVar1.attrName),
+                                     RelationalVariable(list(dep.relVar2.path), dep.relVar2.attrName))
+                for dep in graphs.dependencies]
+    return setup, lambda deps: [hash(dep) for dep in deps], len(graphs.dependencies)
+
+
+def _dependency_reverse(graphs):
+    dependencies = graphs.dependencies
+    return lambda: dependencies, lambda deps: [dep.reverse() for dep in deps], len(dependencies)
+
+
+BENCHMARKS = [
+    ('PDAG.orient', _orient),
+    ('PDAG.pa', _pdag_queries(PDAG.pa)),
+    ('PDAG.ch', _pdag_queries(PDAG.ch)),
+    ('PDAG.ne', _pdag_queries(PDAG.ne)),
+    ('PDAG.de', _de),
+    ('MeekRules.rule_1', _meek_rule(MeekRules.rule_1)),
+    ('MeekRules.rule_2', _meek_rule_2),
+    ('MeekRules.rule_3', _meek_rule(MeekRules.rule_3)),
+    ('MeekRules.rule_4', _meek_rule(MeekRules.rule_4)),
+    ('RCDLight._apply_rules', _apply_rules),
+    ('Ancestral.add', _ancestral_add),
+    ('RelationalDependency.__hash__', _dependency_hash),
+    ('RelationalDependency.reverse', _dependency_reverse),
+]
+
+
+def measure(setup, run, num_ops, repeat=5, min_time=0.1):
+    '''
+    Returns (ops/sec, peak traced bytes/op, retained traced bytes/op, retained blocks/op). Each timed call of run
+    gets a fresh state from setup, made outside the timing; calls are batched until a batch takes at least min_time,
+    and the best of repeat batches is taken. Memory is traced on separate calls, since tracing slows them down.
+    '''
+    number = 1
+    while True:
+        elapsed = _time_batch(setup, run, number)
+        if elapsed >= min_time or number >= 2 ** 20:
+            break
+        number *= 2
+    best = min([elapsed] + [_time_batch(setup, run, number) for _ in range(repeat - 1)])
+
+    state = setup()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    run(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return num_ops * number / best, (peak - start) / num_ops, (current - start) / num_ops, \
+        _retained_blocks(setup, run) / num_ops
+
+
+def _retained_blocks(setup, run):
+    # blocks allocated by run and still alive afterwards, leaving out those of the snapshots themselves
+    state = setup()
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(filters)
+    run(state)
+    after = tracemalloc.take_snapshot().filter_traces(filters)
+    tracemalloc.stop()
+    return sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+
+def _time_batch(setup, run, number):
+    states = [setup() for _ in range(number)]
+    start = time.perf_counter()
+    for state in states:
+        run(state)
+    return time.perf_counter() - start
+
+
+def run_benchmarks(sizes, density, seed=0, repeat=5, min_time=0.1, selected=None):
+    '''
+    Returns {'<benchmark> n=<size>': {'ops_per_sec', 'peak_traced_bytes_per_op', 'retained_traced_bytes_per_op',
+    'retained_blocks_per_op'}}.
+    '''
+    results = {}
+    for size in sizes:
+        graphs = Graphs(size, density, seed)
+        for name, benchmark in BENCHMARKS:
+            if selected and not any(s in name for s in selected):
+                continue
+            ops_per_sec, peak_bytes, retained_bytes, retained_blocks = measure(*benchmark(graphs), repeat=repeat,
+                                                                               min_time=min_time)
+            key = '{} n={}'.format(name, size)
+            results[key] = {'ops_per_sec': ops_per_sec, 'peak_traced_bytes_per_op': peak_bytes,
+                            'retained_traced_bytes_per_op': retained_bytes, 'retained_blocks_per_op': retained_blocks}
+            print('{:<40} {:>14,.0f} ops/s {:>10.1f} peak B/op {:>10.1f} retained B/op {:>8.2f} blocks/op'.format(
+                key, ops_per_sec, peak_bytes, retained_bytes, retained_blocks))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints the speed of each benchmark relative to the baseline. Returns the names of the regressions, i.e.,
+    benchmarks slower than the baseline by more than tolerance (a fraction).
+    '''
+    regressions = []
+    for key in sorted(set(results) & set(baseline)):
+        ratio = results[key]['ops_per_sec'] / baseline[key]['ops_per_sec']
+        regressed = ratio < 1 - tolerance
+        if regressed:
+            regressions.append(key)
+        print('{:<40} {:>6.2f}x{}'.format(key, ratio, '  REGRESSION' if regressed else ''))
+    for key in sorted(set(baseline) - set(results)):
+        print('{:<40} not run'.format(key))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the orientation and model primitives.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200], help='numbers of vertices')
+    parser.add_argument('--density', type=float, default=0.1, help='probability of an edge between two vertices')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help='minimum seconds per timed batch')
+    parser.add_argument('--only', nargs='+', help='run the benchmarks whose names contain any of these')
+    parser.add_argument('--save', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.density, args.seed, args.repeat, args.min_time, args.only)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'density': args.density, 'seed': args.seed, 'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline['density'], baseline['seed']) != (args.density, args.seed):
+            print('baseline was run with density {} and seed {}'.format(baseline['density'], baseline['seed']))
+        if compare(results, baseline['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.dseparation import AggCache
+from causality.learning.RCD import RCD
+from causality.model.Model import Model
+from causality.model.Schema import Schema
+
+
+@pytest.fixture(autouse=True)
+def emptyCache():
+    AggCache.clear()
+    AggCache.setMaxSize(AggCache.DEFAULT_MAX_SIZE)
+    yield
+    AggCache.clear()
+    AggCache.setMaxSize(AggCache.DEFAULT_MAX_SIZE)
+
+
+def twoEntityModel():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.ONE))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    return Model(schema, ['[B, AB, A].X -> [B].Y'])
+
+
+def edgeSet(agg):
+    return set(agg.edges())
+
+
+def testSharedAggIsCachedAndCopiesArePrivate():
+    model = twoEntityModel()
+    agg = AggCache.getAgg(model, 'B', 4)
+    assert AggCache.getAgg(model, 'B', 4) is agg
+
+    privateAgg = AggCache.getAgg(model, 'B', 4, copyAgg=True)
+    assert privateAgg is not agg
+    assert edgeSet(privateAgg) == edgeSet(agg)
+    privateAgg.remove_edges_from(list(privateAgg.edges()))
+    assert edgeSet(agg)
+
+
+def testUnstoredAggIsNotCachedNorCopied():
+    model = twoEntityModel()
+    built = AggCache.cacheRecord['built']
+    agg = AggCache.getAgg(model, 'B', 4, copyAgg=True, store=False)
+    assert AggCache.cacheRecord['built'] == built + 1
+    assert len(AggCache._cache) == 0
+
+    # an AGG that is already cached is shared, so it is still copied
+    cachedAgg = AggCache.getAgg(model, 'B', 4)
+    privateAgg = AggCache.getAgg(model, 'B', 4, copyAgg=True, store=False)
+    assert privateAgg is not cachedAgg
+    assert edgeSet(privateAgg) == edgeSet(cachedAgg) == edgeSet(agg)
+
+
+def testHopThresholdsAreCachedSeparately():
+    model = twoEntityModel()
+    smallAgg = AggCache.getAgg(model, 'B', 2)
+    largeAgg = AggCache.getAgg(model, 'B', 4)
+    assert smallAgg is not largeAgg
+    assert set(smallAgg.nodes()) < set(largeAgg.nodes())
+    assert set(smallAgg.nodes()) == set(AggCache.getAgg(model, 'B', 2, store=False).nodes())
+
+
+def testLruEviction():
+    model = twoEntityModel()
+    AggCache.setMaxSize(2)
+    evicted = AggCache.cacheRecord['evicted']
+    aggA = AggCache.getAgg(model, 'A', 2)
+    AggCache.getAgg(model, 'B', 2)
+    assert AggCache.getAgg(model, 'A', 2) is aggA
+    AggCache.getAgg(model, 'AB', 2)
+    assert AggCache.cacheRecord['evicted'] == evicted + 1
+    assert AggCache.getAgg(model, 'A', 2) is aggA
+    with pytest.raises(Exception):
+        AggCache.setMaxSize(-1)
+
+
+def testRcdDoesNotCacheItsAggs():
+    model = twoEntityModel()
+    rcd = RCD(model.schema, Oracle(model, 4), 2)
+    rcd.identifyUndirectedDependencies()
+    rcd.orientDependencies()
+    # the Oracle's AGGs are cached, but none of the AGGs that RCD built and modified
+    cachedAggs = [agg for _, agg in AggCache._cache.values()]
+    assert cachedAggs
+    assert not any(agg is cachedAgg for agg in rcd.perspectiveToAgg.values() for cachedAgg in cachedAggs)
+    assert all(dependencyKey != frozenset(rcd.undirectedDependencies) for _, dependencyKey, _, _ in AggCache._cache)
@@ -0,0 +1,81 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.dseparation import AggSizeEstimator
+from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.dseparation.CompactAbstractGroundGraph import CompactAbstractGroundGraph
+from causality.learning.RCD import RCD
+from causality.model.Distribution import ConstantDistribution
+from causality.model.RelationalDependency import RelationalVariable
+from causality.modelspace import ModelGenerator
+from causality.modelspace import SchemaGenerator
+
+
+def randomModel(seed):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, 2, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+@pytest.mark.parametrize('seed', range(10))
+def testEstimateAgainstBuiltAggs(seed):
+    model = randomModel(seed)
+    for perspective in (item.name for item in model.schema.getSchemaItems()):
+        estimate = AggSizeEstimator.estimateAggSize(model, perspective, 4)
+        agg = AbstractGroundGraph(model, perspective, 4)
+        relVars = {node for node in agg.nodes() if isinstance(node, RelationalVariable)}
+        relVarEdges = sum(1 for node1, node2 in agg.edges() if node1 in relVars and node2 in relVars)
+
+        assert estimate.relVarNodes == len(relVars)
+        assert estimate.intersectionNodes == agg.number_of_nodes() - len(relVars)
+        assert estimate.relVarEdges == relVarEdges
+        # shared edges of the two relational variables of an intersection are counted twice
+        assert estimate.intersectionEdges >= agg.number_of_edges() - relVarEdges
+
+        compact = CompactAbstractGroundGraph.build(model, perspective, 4)
+        compactBytes = compact.numBytes() + compact.number_of_nodes() * AggSizeEstimator.NODE_OBJECT_BYTES
+        # a rough estimate of the arrays and tables actually allocated
+        assert estimate.compactBytes() == pytest.approx(compactBytes, rel=0.25)
+
+
+def testPlannerFallsBackToCompact():
+    model = randomModel(4)
+    rcd = RCD(model.schema, Oracle(model, 4), 2)
+    rcd.identifyUndirectedDependencies()
+    estimates = rcd.estimateAggSizes(rcd.undirectedDependencies)
+    networkxPeak = sum(estimate.networkxBytes() for estimate in estimates.values())
+    compactPeak = sum(estimate.compactBytes() for estimate in estimates.values())
+    assert compactPeak < networkxPeak
+
+    rcd.aggMemoryLimit = networkxPeak
+    assert rcd.planAggBackend(rcd.undirectedDependencies) == 'networkx'
+    rcd.aggMemoryLimit = (networkxPeak + compactPeak) // 2
+    assert rcd.planAggBackend(rcd.undirectedDependencies) == 'compact'
+    rcd.aggMemoryLimit = compactPeak - 1
+    with pytest.raises(Exception):
+        rcd.planAggBackend(rcd.undirectedDependencies)
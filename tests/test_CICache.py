@@ -0,0 +1,120 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from causality.citest.CICache import CICache
+from causality.citest.CICache import _entryBytes
+from causality.citest.CITest import CITestResult
+from causality.citest.CITest import Oracle
+from causality.model.Model import Model
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+from shlee.RCDLight import RCDLight
+
+
+def relVar(path, attrName):
+    return RelationalVariable(path.split(), attrName)
+
+
+X, Y, Z, W = relVar('A', 'X'), relVar('A AB B', 'Y'), relVar('A AB B', 'Z'), relVar('A', 'W')
+
+
+def entrySizes(cache):
+    return sum(_entryBytes(packedKey, outcome) for packedKey, outcome in cache.entries.items())
+
+
+def testMapping():
+    cache = CICache()
+    cache[X, Y, ()] = True
+    cache[X, Y, (Z,)] = CITestResult(0.2, 0.01)
+    assert (X, Y, ()) in cache and (Y, X, ()) not in cache and (X, W, ()) not in cache
+    assert cache[X, Y, (Z,)].pval == 0.2
+    assert set(cache) == {(X, Y, ()), (X, Y, (Z,))}
+    assert dict(cache.items())[X, Y, ()] is True
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+    # variables are interned once
+    assert cache.stats()['variables'] == 3
+
+    del cache[X, Y, ()]
+    assert len(cache) == 1
+    assert cache.numBytes == entrySizes(cache)
+    with pytest.raises(KeyError):
+        cache[X, W, ()]
+    with pytest.raises(Exception):
+        CICache(maxBytes=0)
+
+
+def testLeastRecentlyUsedEviction():
+    keys = [(X, Y, ()), (X, Z, ()), (X, W, ()), (Y, Z, ())]
+    maxBytes = 3 * _entryBytes((0, 1), True)
+    cache = CICache(maxBytes=maxBytes)
+    for key in keys[:3]:
+        cache[key] = True
+    cache[keys[0]]  # keys[1] is now the least recently used
+    cache[keys[3]] = True
+    assert set(cache) == {keys[0], keys[2], keys[3]}
+    assert cache.stats()['evictions'] == 1
+    assert cache.numBytes == entrySizes(cache) <= maxBytes
+
+
+def testRetiredEntriesAreEvictedFirst():
+    maxBytes = 3 * _entryBytes((0, 1, 2), True)
+    pairCache = CICache(maxBytes=maxBytes)
+    depthCache = CICache(maxBytes=maxBytes)
+    for cache, retiredKey in ((pairCache, (X, Y, ())), (depthCache, (Z, X, ()))):
+        cache[X, Z, (W,)] = True
+        cache[retiredKey] = True
+        cache[Z, W, (Y,)] = True
+    pairCache.retirePair(Y, X)
+    depthCache.retireBelowDepth(1)
+
+    for cache, retiredKey in ((pairCache, (X, Y, ())), (depthCache, (Z, X, ()))):
+        cache[W, Y, (Z,)] = True
+        # the retired entry goes, although the entry for X and Z is less recently used
+        assert set(cache) == {(X, Z, (W,)), (Z, W, (Y,)), (W, Y, (Z,))}
+        assert cache.stats()['retiredEvictions'] == 1
+        assert cache.numBytes == entrySizes(cache) <= maxBytes
+
+
+def testCopyIsIndependent():
+    cache = CICache()
+    cache[X, Y, ()] = True
+    copied = cache.copy()
+    copied[X, Z, ()] = False
+    assert (X, Z, ()) not in cache
+    assert copied[X, Y, ()] is True and copied.numBytes == entrySizes(copied)
+
+
+def testBoundedCacheDoesNotChangeResults():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('A', 'W')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'Z')
+    model = Model(schema, ['[B, AB, A].X -> [B].Y', '[A, AB, B].Y -> [A].W', '[B].Z -> [B].Y'])
+
+    results = []
+    for ciCache in (CICache(), CICache(maxBytes=5 * _entryBytes((0, 1, 2), True), scanWindow=4)):
+        rcdl = RCDLight(schema, Oracle(model, 4), 2, rng=0, ci_cache=ciCache)
+        rcdl.identifyUndirectedDependencies()
+        rcdl.orientDependencies()
+        results.append((rcdl.undirectedDependencies, rcdl.orientedDependencies))
+        assert ciCache.numBytes == entrySizes(ciCache)
+    assert results[0] == results[1]
+    assert ciCache.stats()['evictions'] > 0
@@ -0,0 +1,27 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from causality.citest.CITest import CITestResult
+
+
+def testDecidingUnderThresholds():
+    result = CITestResult(0.03, 0.2)
+    assert result.isIndependent(0.01)
+    assert not result.isIndependent(0.05)
+    assert not result.isIndependent(0.05, 0.1)
+    # a significant but weak dependence is taken for an independence
+    assert result.isIndependent(0.05, 0.3)
+    # a test without an effect size is decided on its p-value alone
+    assert not CITestResult(0.03).isIndependent(0.05, 0.3)
@@ -0,0 +1,113 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from causality.citest import CITestRegistry
+from causality.citest.CITest import CITest
+from causality.citest.CITest import Oracle
+from causality.citest.KernelCITest import KernelCITest
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.model.Aggregator import AverageAggregator
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+
+
+@pytest.fixture(autouse=True)
+def restoreRegistry():
+    registry = dict(CITestRegistry._registry)
+    yield
+    CITestRegistry._registry.clear()
+    CITestRegistry._registry.update(registry)
+
+
+class AlwaysIndependent(CITest):
+
+    def isConditionallyIndependent(self, relVar1Str, relVar2Str, condRelVarStrs):
+        return True
+
+
+def testBuiltInTesters():
+    assert {'oracle', 'linear', 'kernel', 'permutation', 'categorical'} <= set(CITestRegistry.getCITestNames())
+    assert CITestRegistry.getCITestClass('oracle') is Oracle
+    assert CITestRegistry.getCITestClass('kernel') is KernelCITest
+
+
+def testRegister():
+    CITestRegistry.register('always', AlwaysIndependent)
+    assert CITestRegistry.createCITest('always').isConditionallyIndependent('[A].X', '[A].Y', [])
+    CITestRegistry.register('lazyAlways', '{}:AlwaysIndependent'.format(__name__))
+    assert CITestRegistry._registry['lazyAlways'] == '{}:AlwaysIndependent'.format(__name__)
+    assert CITestRegistry.getCITestClass('lazyAlways') is AlwaysIndependent
+    # the imported class replaces the string
+    assert CITestRegistry._registry['lazyAlways'] is AlwaysIndependent
+    assert 'always' in CITestRegistry.getCITestNames()
+
+
+def testErrors():
+    with pytest.raises(Exception):
+        CITestRegistry.getCITestClass('unknown')
+    with pytest.raises(Exception):
+        CITestRegistry.register('bad', 'causality.citest.CITest.Oracle')
+    with pytest.raises(Exception):
+        CITestRegistry.register('bad', AlwaysIndependent())
+    assert 'bad' not in CITestRegistry.getCITestNames()
+
+
+def testOracleRunImportsNoOtherTester():
+    script = '\n'.join([
+        'import sys',
+        'from causality.citest import CITestRegistry',
+        'from causality.model.Model import Model',
+        'from causality.model.Schema import Schema',
+        'schema = Schema()',
+        'schema.addEntity("A")',
+        'schema.addAttribute("A", "X")',
+        'schema.addAttribute("A", "Y")',
+        'oracle = CITestRegistry.createCITest("oracle", Model(schema, ["[A].X -> [A].Y"]), 2)',
+        'assert not oracle.isConditionallyIndependent("[A].X", "[A].Y", ())',
+        'CITestRegistry.createCITest("linear", schema, None)',
+        'print(sorted(name for name in sys.modules if name.startswith("rpy2") or name.endswith("CITest")))'])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    # neither R nor the modules of the other testers are loaded
+    assert subprocess.check_output([sys.executable, '-c', script], env=env).decode().strip() == \
+        "['causality.citest.CITest']"
+
+
+def testLinearTester():
+    pytest.importorskip('rpy2')
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'W')
+    randomState = np.random.RandomState(0)
+    dataStore = sampleSkeleton(schema, {'A': 300, 'B': 300, 'AB': 600}, randomState)
+    dataStore.setAttribute('A', 'X', randomState.randn(300))
+    averages = dataStore.aggregate(RelationalVariable(['B', 'AB', 'A'], 'X'), AverageAggregator)
+    averages[np.isnan(averages)] = 0
+    dataStore.setAttribute('B', 'Y', averages + 0.5 * randomState.randn(300))
+    dataStore.setAttribute('B', 'W', randomState.randn(300))
+
+    ciTest = CITestRegistry.createCITest('linear', schema, dataStore, alpha=0.01)
+    assert not ciTest.isConditionallyIndependent('[B, AB, A].X', '[B].Y', [])
+    assert ciTest.isConditionallyIndependent('[B, AB, A].X', '[B].W', [])
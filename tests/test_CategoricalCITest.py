@@ -0,0 +1,97 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pytest
+
+from causality.citest.CategoricalCITest import CategoricalCITest
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.learning.RCD import RCD
+from causality.model.ModeAggregator import ModeAggregator
+from causality.model.RelationalDependency import RelationalDependency
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+from shlee.RCDLight import RCDLight
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'W')
+    return schema
+
+
+def categoricalData(schema, seed=0, numItems=1500):
+    """
+    X and W are uniform over 3 categories; B.Y copies the mode of X over the related A instances with probability
+    0.8 and is uniform otherwise, i.e., [B, AB, A].X -> [B].Y.
+    """
+    randomState = np.random.RandomState(seed)
+    dataStore = sampleSkeleton(schema, {'A': numItems, 'B': numItems, 'AB': 2 * numItems}, randomState)
+    dataStore.setAttribute('A', 'X', randomState.randint(3, size=numItems))
+    dataStore.setAttribute('B', 'W', randomState.randint(3, size=numItems))
+    modes = dataStore.aggregate(RelationalVariable(['B', 'AB', 'A'], 'X'), ModeAggregator)
+    noise = randomState.randint(3, size=numItems)
+    copied = (randomState.rand(numItems) < 0.8) & ~np.isnan(modes)
+    dataStore.setAttribute('B', 'Y', np.where(copied, modes, noise))
+    return dataStore
+
+
+def relVar(path, attrName):
+    return RelationalVariable(path.split(), attrName)
+
+
+def testDefaultAggregatorIsMode():
+    schema = twoEntitySchema()
+    ciTest = CategoricalCITest(schema, categoricalData(schema))
+    assert ciTest.aggregatorClass is ModeAggregator
+
+
+def testDependenceThroughRelationship():
+    schema = twoEntitySchema()
+    ciTest = CategoricalCITest(schema, categoricalData(schema), alpha=0.01)
+    assert not ciTest.isConditionallyIndependent(relVar('B AB A', 'X'), relVar('B', 'Y'), [])
+    assert not ciTest.isConditionallyIndependent(relVar('A AB B', 'Y'), relVar('A', 'X'), [])
+    assert ciTest.isConditionallyIndependent(relVar('B AB A', 'X'), relVar('B', 'W'), [])
+    assert ciTest.isConditionallyIndependent(relVar('B', 'Y'), relVar('B', 'W'), [relVar('B AB A', 'X')])
+
+
+def testCalibrationUnderIndependence():
+    schema = twoEntitySchema()
+    pvals = []
+    for seed in range(100):
+        ciTest = CategoricalCITest(schema, categoricalData(schema, seed, numItems=300))
+        pvals.append(ciTest.testConditionalIndependence(relVar('B AB A', 'X'), relVar('B', 'W'), []).pval)
+    # the G-test is asymptotically calibrated: about 5% rejections at alpha = 0.05
+    assert np.mean(np.array(pvals) < 0.05) <= 0.12
+    assert 0.3 < np.mean(pvals) < 0.7
+
+
+@pytest.mark.parametrize('learner', ['RCDLight', 'RCD'])
+def testPhaseIOnTwoEntitySchema(learner):
+    schema = twoEntitySchema()
+    ciTest = CategoricalCITest(schema, categoricalData(schema), alpha=0.01)
+    if learner == 'RCDLight':
+        rcd = RCDLight(schema, ciTest, 2)
+    else:
+        rcd = RCD(schema, ciTest, 2, depth=2)
+    rcd.identifyUndirectedDependencies()
+
+    dependency = RelationalDependency(relVar('B AB A', 'X'), relVar('B', 'Y'))
+    assert set(rcd.undirectedDependencies) == {dependency, dependency.reverse()}
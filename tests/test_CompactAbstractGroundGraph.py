@@ -0,0 +1,101 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from causality.dseparation.AbstractGroundGraph import AbstractGroundGraph
+from causality.dseparation.CompactAbstractGroundGraph import CompactAbstractGroundGraph
+from causality.model.Distribution import ConstantDistribution
+from causality.modelspace import ModelGenerator
+from causality.modelspace import SchemaGenerator
+
+
+def randomModel(seed, hopThreshold=2):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, hopThreshold, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+def edgesWithData(agg):
+    return {(node1, node2): frozenset(data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES])
+            for node1, node2, data in agg.edges(data=True)}
+
+
+def assertSameGraph(compactAgg, agg):
+    assert set(compactAgg.nodes()) == set(agg.nodes())
+    assert compactAgg.number_of_nodes() == len(agg.nodes())
+    assert edgesWithData(compactAgg) == edgesWithData(agg)
+    assert compactAgg.number_of_edges() == len(agg.edges())
+    for node in agg.nodes():
+        assert set(compactAgg.predecessors(node)) == set(agg.predecessors(node))
+        assert set(compactAgg.successors(node)) == set(agg.successors(node))
+        assert {successor: set(data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES])
+                for successor, data in compactAgg[node].items()} == \
+            {successor: set(data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES]) for successor, data in agg[node].items()}
+
+
+def aggsOf(model, hopThreshold=4):
+    for item in sorted(model.schema.getSchemaItems(), key=lambda item: item.name):
+        yield item.name, AbstractGroundGraph(model, item.name, hopThreshold)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def testBuildMatchesAbstractGroundGraph(seed):
+    model = randomModel(seed)
+    for perspective, agg in aggsOf(model):
+        assertSameGraph(CompactAbstractGroundGraph.build(model, perspective, 4), agg)
+        assertSameGraph(CompactAbstractGroundGraph.fromAgg(agg), agg)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def testRemoveEdgesForDependency(seed):
+    model = randomModel(seed)
+    dependencies = list(model.dependencies)
+    random.Random(seed).shuffle(dependencies)
+    for perspective, agg in aggsOf(model):
+        compactAgg = CompactAbstractGroundGraph.build(model, perspective, 4)
+        dependencyEdges = {dependency: set(compactAgg.getDependencyEdges(dependency)) for dependency in dependencies}
+        for dependency in dependencies:
+            assert compactAgg.removeEdgesForDependency(dependency) == agg.removeEdgesForDependency(dependency)
+            assertSameGraph(compactAgg, agg)
+            assert not any(dependency in edgeDependencies for edgeDependencies in edgesWithData(compactAgg).values())
+        assert compactAgg.number_of_edges() == 0
+        # the edges of a dependency are still listed after their removal
+        assert {dependency: set(compactAgg.getDependencyEdges(dependency)) for dependency in dependencies} == \
+            dependencyEdges
+        assert compactAgg.removeEdgesForDependency(dependencies[0]) == set()
+
+
+def testInvalidEdges():
+    model = randomModel(0)
+    agg = next(agg for _, agg in aggsOf(model) if agg.edges())
+    node1, node2, data = list(agg.edges(data=True))[0]
+    dependencies = data[AbstractGroundGraph.UNDERLYING_DEPENDENCIES]
+    with pytest.raises(Exception):
+        CompactAbstractGroundGraph(agg.nodes(), [(node1, node2, set())])
+    with pytest.raises(Exception):
+        CompactAbstractGroundGraph(agg.nodes(), [(node1, node2, dependencies), (node1, node2, dependencies)])
+    with pytest.raises(KeyError):
+        CompactAbstractGroundGraph(agg.nodes(), [])['no such node']
@@ -0,0 +1,89 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.dseparation.DSeparation import DSeparation
+from causality.model.Distribution import ConstantDistribution
+from causality.modelspace import ModelGenerator
+from causality.modelspace import RelationalSpace
+from causality.modelspace import SchemaGenerator
+
+
+def randomModel(seed, hopThreshold=2):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, hopThreshold, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+def randomQueries(model, hopThreshold, numQueries, rng):
+    relVars = RelationalSpace.getRelationalVariables(model.schema, hopThreshold)
+    perspectiveToRelVars = {}
+    for relVar in relVars:
+        perspectiveToRelVars.setdefault(relVar.getBaseItemName(), []).append(relVar)
+    perspectives = sorted(perspective for perspective, relVars in perspectiveToRelVars.items() if len(relVars) >= 2)
+    for _ in range(numQueries):
+        perspectiveRelVars = perspectiveToRelVars[rng.choice(perspectives)]
+        relVar1, relVar2 = rng.sample(perspectiveRelVars, 2)
+        condRelVars = rng.sample(perspectiveRelVars, min(rng.randint(0, 2), len(perspectiveRelVars)))
+        yield relVar1, relVar2, condRelVars
+
+
+@pytest.mark.parametrize('seed', range(6))
+def testRelVarQueriesMatchStringQueries(seed):
+    model = randomModel(seed)
+    stringDSep = DSeparation(model)
+    relVarDSep = DSeparation(model)
+    for relVar1, relVar2, condRelVars in randomQueries(model, 4, 100, random.Random(seed)):
+        condRelVarStrs = [str(condRelVar) for condRelVar in condRelVars]
+        expected = stringDSep.dSeparated(4, [str(relVar1)], [str(relVar2)], condRelVarStrs)
+        assert relVarDSep.dSeparatedRelVars(4, [relVar1], [relVar2], condRelVars) == expected
+
+
+@pytest.mark.parametrize('seed', range(3))
+def testOracleRoutesRelVarQueries(seed):
+    model = randomModel(seed)
+    oracle = Oracle(model, 4)
+    for relVar1, relVar2, condRelVars in randomQueries(model, 4, 50, random.Random(seed)):
+        assert oracle.isConditionallyIndependent(relVar1, relVar2, tuple(condRelVars)) == \
+            oracle.isConditionallyIndependent(str(relVar1), str(relVar2),
+                                              tuple(str(condRelVar) for condRelVar in condRelVars))
+
+
+def testInvalidRelVarQueries():
+    model = randomModel(0)
+    dsep = DSeparation(model)
+    relVars = RelationalSpace.getRelationalVariables(model.schema, 4)
+    relVar = relVars[0]
+    otherPerspectiveRelVar = next(other for other in relVars if other.getBaseItemName() != relVar.getBaseItemName())
+    with pytest.raises(Exception):
+        dsep.dSeparatedRelVars(4, [], [relVar], [])
+    with pytest.raises(Exception):
+        dsep.dSeparatedRelVars(4, [relVar], [otherPerspectiveRelVar], [])
+    # variables longer than the hop threshold are rejected
+    longRelVar = next(other for other in relVars if len(other.path) > 1)
+    with pytest.raises(Exception):
+        dsep.dSeparatedRelVars(0, [relVar], [longRelVar], [])
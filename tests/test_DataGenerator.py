@@ -0,0 +1,121 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import random
+
+import numpy as np
+import pytest
+
+from causality.datastore.DataGenerator import generateData
+from causality.datastore.DataGenerator import getAttributeOrder
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.model.Distribution import ConstantDistribution
+from causality.model import ParserUtil
+from causality.model.Model import Model
+from causality.model.Schema import Schema
+from causality.modelspace import ModelGenerator
+from causality.modelspace import SchemaGenerator
+
+
+def randomModel(seed, hopThreshold=2):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, hopThreshold, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.ONE), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'Z')
+    return schema
+
+
+def sizesOf(schema, size):
+    return {item.name: size for item in schema.getSchemaItems()}
+
+
+def values(dataStore, itemName, attrName):
+    return np.array(dataStore.attributes[itemName][attrName], dtype=float)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def testAttributeOrderIsTopological(seed):
+    model = randomModel(seed)
+    order = getAttributeOrder(model)
+    positions = {attributeClass: i for i, attributeClass in enumerate(order)}
+    assert len(positions) == len(order)
+    for dependency in model.dependencies:
+        parent = dependency.relVar1.getTerminalItemName(), dependency.relVar1.attrName
+        child = dependency.relVar2.getTerminalItemName(), dependency.relVar2.attrName
+        assert positions[parent] < positions[child]
+
+
+def testCyclicModelIsRejected():
+    # only the schema and the dependencies of a model are read, so no Model (which would reject the cycle) is needed
+    dependencies = [ParserUtil.parseRelDep(dependencyStr)
+                    for dependencyStr in ('[B, AB, A].X -> [B].Y', '[B].Y -> [B].Z', '[A, AB, B].Z -> [A].X')]
+    with pytest.raises(Exception):
+        getAttributeOrder(collections.namedtuple('CyclicModel', 'schema dependencies')(twoEntitySchema(),
+                                                                                      dependencies))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def testReproducibleFromSeed(seed):
+    model = randomModel(seed)
+    sizes = sizesOf(model.schema, 100)
+    dataStores = [generateData(model, sizes, seed=dataSeed) for dataSeed in (seed, seed, seed + 1)]
+    for itemName, attrName in getAttributeOrder(model):
+        assert np.array_equal(values(dataStores[0], itemName, attrName), values(dataStores[1], itemName, attrName))
+        assert not np.array_equal(values(dataStores[0], itemName, attrName),
+                                  values(dataStores[2], itemName, attrName))
+
+
+def testCoefficients():
+    schema = twoEntitySchema()
+    model = Model(schema, ['[B, AB, A].X -> [B].Y', '[B].Y -> [B].Z'])
+    coefficients = {dependency: coefficient for dependency, coefficient in zip(model.dependencies, (2.0, -0.5))}
+    dataStore = generateData(model, {'A': 2000, 'B': 3000, 'AB': 1500}, coefficients, noiseStd=0.5, seed=0)
+
+    for dependency, coefficient in coefficients.items():
+        parent = np.nan_to_num(dataStore.aggregate(dependency.relVar1))
+        child = values(dataStore, dependency.relVar2.getTerminalItemName(), dependency.relVar2.attrName)
+        noise = child - coefficient * parent
+        assert abs(noise.mean()) < 0.05 and noise.std() == pytest.approx(0.5, rel=0.1)
+        assert np.polyfit(parent, child, 1)[0] == pytest.approx(coefficient, abs=0.1)
+
+
+def testSkeletonCardinalities():
+    schema = twoEntitySchema()
+    dataStore = sampleSkeleton(schema, {'A': 50, 'B': 80, 'AB': 50}, np.random.RandomState(0))
+    aPositions, bPositions = dataStore.endpoints['AB']
+    assert len(set(aPositions)) == len(aPositions) == 50
+    assert all(0 <= position < 80 for position in bPositions)
+    with pytest.raises(Exception):
+        sampleSkeleton(schema, {'A': 50, 'B': 80, 'AB': 51}, np.random.RandomState(0))
+    with pytest.raises(Exception):
+        sampleSkeleton(schema, {'A': 50, 'B': 80}, np.random.RandomState(0))
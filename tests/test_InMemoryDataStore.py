@@ -0,0 +1,167 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+
+import numpy as np
+import pytest
+
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.datastore.InMemoryDataStore import InMemoryDataStore
+from causality.model.Aggregator import AverageAggregator
+from causality.model.Aggregator import IdentityAggregator
+from causality.model.ModeAggregator import ModeAggregator
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    return schema
+
+
+def naiveMode(values):
+    values = [value for value in values if not np.isnan(value)]
+    if not values:
+        return np.nan
+    counts = collections.Counter(values)
+    return min(value for value in counts if counts[value] == max(counts.values()))
+
+
+def testModeAggregation():
+    schema = twoEntitySchema()
+    randomState = np.random.RandomState(0)
+    dataStore = sampleSkeleton(schema, {'A': 200, 'B': 100, 'AB': 300}, randomState)
+    xs = randomState.randint(4, size=200).astype(float)
+    xs[randomState.rand(200) < 0.1] = np.nan
+    dataStore.setAttribute('A', 'X', xs)
+
+    relVar = RelationalVariable(['B', 'AB', 'A'], 'X')
+    reach = dataStore.getReach(relVar.path)
+    modes = dataStore.aggregate(relVar, ModeAggregator)
+    for row in range(reach.shape[0]):
+        expected = naiveMode(xs[reach[row].indices])
+        assert (np.isnan(expected) and np.isnan(modes[row])) or expected == modes[row]
+
+
+def selfRelationshipSchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addRelationship('AA', ('A', Schema.MANY), ('A', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    return schema
+
+
+def naiveTerminalSets(dataStore, path):
+    """
+    Terminal sets of path for every base item, item by item: each step moves to the related items of the next
+    schema item, dropping those reached by an earlier prefix ending at the same schema item (bridge burning).
+    """
+    neighbors = collections.defaultdict(set)
+    for relationship in dataStore.schema.getRelationships():
+        entity1Positions, entity2Positions = dataStore.endpoints[relationship.name]
+        for i, (position1, position2) in enumerate(zip(entity1Positions, entity2Positions)):
+            for entityName, position in ((relationship.entity1Name, position1), (relationship.entity2Name, position2)):
+                neighbors[relationship.name, i, entityName].add(position)
+                neighbors[entityName, position, relationship.name].add(i)
+
+    terminalSets = []
+    for item in range(dataStore.getNumItems(path[0])):
+        reached = [{item}]
+        for k in range(1, len(path)):
+            terminalSet = {other for previous in reached[-1] for other in neighbors[path[k - 1], previous, path[k]]}
+            for j in range(k):
+                if path[j] == path[k]:
+                    terminalSet -= reached[j]
+            reached.append(terminalSet)
+        terminalSets.append(reached[-1])
+    return terminalSets
+
+
+PATHS = [['A', 'AB', 'B'], ['B', 'AB', 'A'], ['A', 'AB', 'B', 'AB', 'A'], ['B', 'AB', 'A', 'AB', 'B'],
+         ['A', 'AA', 'A'], ['A', 'AA', 'A', 'AA', 'A'], ['B', 'AB', 'A', 'AA', 'A'], ['AB', 'A', 'AA', 'A', 'AB']]
+
+
+@pytest.mark.parametrize('path', PATHS)
+def testReachMatchesNaiveTerminalSets(path):
+    schema = selfRelationshipSchema()
+    dataStore = sampleSkeleton(schema, {'A': 40, 'B': 30, 'AB': 60, 'AA': 50}, np.random.RandomState(0))
+    reach = dataStore.getReach(path)
+    assert [set(reach[i].indices) for i in range(reach.shape[0])] == naiveTerminalSets(dataStore, path)
+
+    positions = [5, 0, 17]
+    subsetReach = dataStore.getReach(path, positions)
+    assert (subsetReach != reach[positions]).nnz == 0
+
+
+def testAverageAggregationSkipsMissingValues():
+    schema = selfRelationshipSchema()
+    randomState = np.random.RandomState(1)
+    dataStore = sampleSkeleton(schema, {'A': 40, 'B': 30, 'AB': 60, 'AA': 50}, randomState)
+    xs = randomState.randn(40)
+    xs[randomState.rand(40) < 0.3] = np.nan
+    dataStore.setAttribute('A', 'X', xs)
+
+    path = ['B', 'AB', 'A']
+    averages = dataStore.aggregate(RelationalVariable(path, 'X'))
+    for terminalSet, average in zip(naiveTerminalSets(dataStore, path), averages):
+        values = [xs[item] for item in terminalSet if not np.isnan(xs[item])]
+        assert (not values and np.isnan(average)) or average == pytest.approx(np.mean(values))
+
+
+def testValuesForRelVarAggrs():
+    schema = selfRelationshipSchema()
+    randomState = np.random.RandomState(2)
+    dataStore = InMemoryDataStore(schema)
+    dataStore.addEntities('A', 3, {'X': [1.0, None, 3.0]}, ids=['a1', 'a2', 'a3'])
+    dataStore.addEntities('B', 2, {'Y': [10.0, 20.0]}, ids=['b1', 'b2'])
+    dataStore.addRelationships('AB', [0, 1, 2], [0, 0, 1])
+    dataStore.addRelationships('AA', [], [])
+
+    relVarAggrs = [IdentityAggregator('[B].Y'), AverageAggregator('[B, AB, A].X')]
+    assert list(dataStore.getValuesForRelVarAggrs(schema, 'B', relVarAggrs)) == [('b1', [10.0, 1.0]),
+                                                                                 ('b2', [20.0, 3.0])]
+    assert list(dataStore.getValuesForRelVarAggrs(schema, 'B', relVarAggrs, itemIds=['b2'])) == [('b2', [20.0, 3.0])]
+    assert list(dataStore.getValuesForRelVarAggrs(schema, 'A', [AverageAggregator('[A].X')])) == \
+        [('a1', [1.0]), ('a2', [None]), ('a3', [3.0])]
+    with pytest.raises(Exception):
+        list(dataStore.getValuesForRelVarAggrs(schema, 'B', relVarAggrs, itemIds=['b3']))
+    with pytest.raises(Exception):
+        dataStore.aggregate(RelationalVariable(['B', 'AB', 'A'], 'X'), IdentityAggregator)
+
+
+def testInvalidSkeletons():
+    schema = selfRelationshipSchema()
+    dataStore = InMemoryDataStore(schema)
+    with pytest.raises(Exception):
+        dataStore.addEntities('AB', 2)
+    with pytest.raises(Exception):
+        dataStore.addRelationships('AB', [0], [0])
+    dataStore.addEntities('A', 2)
+    dataStore.addEntities('B', 2)
+    with pytest.raises(Exception):
+        dataStore.addEntities('A', 2)
+    with pytest.raises(Exception):
+        dataStore.addRelationships('AB', [0, 2], [0, 1])
+    with pytest.raises(Exception):
+        dataStore.setAttribute('A', 'X', [1.0])
@@ -0,0 +1,106 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.dseparation.CompactAbstractGroundGraph import CompactAbstractGroundGraph
+from causality.learning.IncrementalEdgeOrientation import compareWithFullRescan
+from causality.learning.RCD import RCD
+from causality.model.Distribution import ConstantDistribution
+from causality.model.RelationalDependency import RelationalVariable
+from causality.modelspace import ModelGenerator
+from causality.modelspace import RelationalSpace
+from causality.modelspace import SchemaGenerator
+
+
+def randomRcdBeforeSepsetFreeRules(seed, aggBackend):
+    """
+    Generates a random schema and model, and runs RCD with an oracle up to collider detection and RBO.
+    """
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        hopThreshold = rng.randint(2, 4)
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(2, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        if len(RelationalSpace.getRelationalDependencies(schema, hopThreshold)) > 100:
+            continue
+        try:
+            model = ModelGenerator.generateModel(schema, hopThreshold, rng.randint(5, 10), maxNumParents=4)
+        except Exception:
+            continue
+        rcd = RCD(schema, Oracle(model, 2 * hopThreshold), hopThreshold, depth=4)
+        rcd.aggBackend = aggBackend
+        rcd.identifyUndirectedDependencies()
+        rcd.applyColliderDetection()
+        rcd.applyRBO()
+        return rcd
+
+
+@pytest.mark.parametrize('aggBackend', ['networkx', 'compact'])
+@pytest.mark.parametrize('seed', range(10))
+def testIncrementalMatchesRescan(seed, aggBackend):
+    rcd = randomRcdBeforeSepsetFreeRules(seed, aggBackend)
+    edges = {perspective: set(agg.edges()) for perspective, agg in rcd.perspectiveToAgg.items()}
+
+    incrementalEdges, rescanEdges = compareWithFullRescan(rcd)
+    assert incrementalEdges == rescanEdges
+    # rcd itself is left unchanged
+    assert {perspective: set(agg.edges()) for perspective, agg in rcd.perspectiveToAgg.items()} == edges
+
+
+def patternRcd(directed, undirected):
+    """
+    An RCD with a single, hand-built AGG over relational variables [A].name, where every edge is underlain by its own
+    dependency 'name1->name2'.
+    """
+    edges = [(name1, name2) for name1, name2 in directed]
+    edges.extend(edge for name1, name2 in undirected for edge in ((name1, name2), (name2, name1)))
+    names = sorted({name for edge in edges for name in edge})
+    relVars = {name: RelationalVariable(['A'], name) for name in names}
+    rcd = RCD(None, None, 0)
+    rcd.perspectiveToAgg = {'A': CompactAbstractGroundGraph(
+        [relVars[name] for name in names],
+        [(relVars[name1], relVars[name2], {'{}->{}'.format(name1, name2)}) for name1, name2 in edges])}
+    return rcd
+
+
+def orientedEdges(edges):
+    return {(relVar1.attrName, relVar2.attrName) for relVar1, relVar2 in edges
+            if (relVar2, relVar1) not in edges}
+
+
+@pytest.mark.parametrize('directed, undirected, expected, rule', [
+    # KNC, twice in a chain: W -> X -- Y -- Z
+    ([('W', 'X')], [('X', 'Y'), ('Y', 'Z')], {('W', 'X'), ('X', 'Y'), ('Y', 'Z')}, 'KNC'),
+    # CA: X -> Y -> Z and X -- Z
+    ([('X', 'Y'), ('Y', 'Z')], [('X', 'Z')], {('X', 'Y'), ('Y', 'Z'), ('X', 'Z')}, 'CA'),
+    # MR3: X -- Y -> Z, X -- W -> Z, and X -- Z
+    ([('Y', 'Z'), ('W', 'Z')], [('X', 'Y'), ('X', 'W'), ('X', 'Z')], {('Y', 'Z'), ('W', 'Z'), ('X', 'Z')}, 'MR3'),
+])
+def testRulePatterns(directed, undirected, expected, rule):
+    rcd = patternRcd(directed, undirected)
+    incrementalEdges, rescanEdges = compareWithFullRescan(rcd)
+    assert incrementalEdges == rescanEdges
+    assert orientedEdges(incrementalEdges['A']) == expected
+
+    rcd.incrementalOrientationRules = True
+    rcd.applySepsetFreeOrientationRules()
+    assert rcd.edgeOrientationRuleFrequency[rule] == len(expected) - len(directed)
@@ -0,0 +1,127 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pytest
+import scipy.stats
+
+from causality.citest.IncrementalLinearCITest import IncrementalLinearCITest
+from causality.datastore.InMemoryDataStore import InMemoryDataStore
+from causality.model.Schema import Schema
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'Z')
+    return schema
+
+
+def randomSkeleton(seed, numItems=200):
+    """
+    Returns (A positions, B positions, {(item name, attribute name): values}) of a random skeleton where
+    B.Z = B.Y + 0.5 * average of [B, AB, A].X + noise.
+    """
+    randomState = np.random.RandomState(seed)
+    aPositions = randomState.randint(numItems, size=2 * numItems)
+    bPositions = randomState.randint(numItems, size=2 * numItems)
+    xs = randomState.randn(numItems)
+    ys = randomState.randn(numItems)
+    averages = np.array([xs[aPositions[bPositions == b]].mean() if (bPositions == b).any() else 0.0
+                         for b in range(numItems)])
+    zs = ys + 0.5 * averages + randomState.randn(numItems)
+    return aPositions, bPositions, {('A', 'X'): xs, ('B', 'Y'): ys, ('B', 'Z'): zs}
+
+
+def dataStoreOf(schema, *skeletons):
+    """
+    The disjoint union of the given skeletons as one InMemoryDataStore.
+    """
+    dataStore = InMemoryDataStore(schema)
+    numA = [len(skeleton[2]['A', 'X']) for skeleton in skeletons]
+    numB = [len(skeleton[2]['B', 'Y']) for skeleton in skeletons]
+    dataStore.addEntities('A', sum(numA), {'X': np.concatenate([skeleton[2]['A', 'X'] for skeleton in skeletons])})
+    dataStore.addEntities('B', sum(numB), {attrName: np.concatenate([skeleton[2]['B', attrName]
+                                                                     for skeleton in skeletons])
+                                           for attrName in ('Y', 'Z')})
+    dataStore.addRelationships('AB',
+                               np.concatenate([skeleton[0] + sum(numA[:i]) for i, skeleton in enumerate(skeletons)]),
+                               np.concatenate([skeleton[1] + sum(numB[:i]) for i, skeleton in enumerate(skeletons)]))
+    return dataStore
+
+
+TESTS = [('[B].Y', '[B].Z', []),
+         ('[B, AB, A].X', '[B].Z', []),
+         ('[B, AB, A].X', '[B].Z', ['[B].Y'])]
+
+
+def testMarginalMatchesLinearRegression():
+    schema = twoEntitySchema()
+    skeleton = randomSkeleton(0)
+    result = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton)).testConditionalIndependence(
+        '[B].Y', '[B].Z', [])
+    regression = scipy.stats.linregress(skeleton[2]['B', 'Y'], skeleton[2]['B', 'Z'])
+    assert result.pval == pytest.approx(regression.pvalue)
+    assert result.effectSize == pytest.approx(regression.rvalue ** 2)
+
+
+def testCalibrationUnderIndependence():
+    schema = twoEntitySchema()
+    pvals = []
+    for seed in range(200):
+        randomState = np.random.RandomState(seed)
+        skeleton = randomSkeleton(seed, numItems=50)
+        skeleton[2]['B', 'Z'] = randomState.randn(50)
+        ciTest = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton))
+        pvals.append(ciTest.testConditionalIndependence('[B, AB, A].X', '[B].Z', ['[B].Y']).pval)
+    assert np.mean(np.array(pvals) < 0.05) <= 0.1
+    assert scipy.stats.kstest(pvals, 'uniform').pvalue > 0.01
+
+
+@pytest.mark.parametrize('relVar1, relVar2, condRelVars', TESTS)
+def testDisjointAppendMatchesUnion(relVar1, relVar2, condRelVars):
+    schema = twoEntitySchema()
+    skeleton1, skeleton2 = randomSkeleton(1), randomSkeleton(2)
+    ciTest = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton1))
+    ciTest.testConditionalIndependence(relVar1, relVar2, condRelVars)
+    ciTest.appendData(dataStoreOf(schema, skeleton2), disjoint=True)
+
+    union = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton1, skeleton2))
+    appended = ciTest.testConditionalIndependence(relVar1, relVar2, condRelVars)
+    expected = union.testConditionalIndependence(relVar1, relVar2, condRelVars)
+    assert appended.pval == pytest.approx(expected.pval)
+    assert appended.effectSize == pytest.approx(expected.effectSize)
+
+
+def testAppendLimitedToBaseItemVariables():
+    schema = twoEntitySchema()
+    skeleton1, skeleton2 = randomSkeleton(1), randomSkeleton(2)
+    ciTest = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton1))
+    ciTest.testConditionalIndependence('[B, AB, A].X', '[B].Z', [])
+    with pytest.raises(Exception):
+        ciTest.appendData(dataStoreOf(schema, skeleton2))
+
+    ciTest = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton1))
+    ciTest.testConditionalIndependence('[B].Y', '[B].Z', [])
+    ciTest.appendData(dataStoreOf(schema, skeleton2))
+    union = IncrementalLinearCITest(schema, dataStoreOf(schema, skeleton1, skeleton2))
+    assert ciTest.testConditionalIndependence('[B].Y', '[B].Z', []).pval == \
+        pytest.approx(union.testConditionalIndependence('[B].Y', '[B].Z', []).pval)
+    with pytest.raises(Exception):
+        ciTest.testConditionalIndependence('[B, AB, A].X', '[B].Z', [])
@@ -0,0 +1,92 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+
+from causality.citest.KernelCITest import KernelCITest
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.model.Aggregator import AverageAggregator
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'Z')
+    schema.addAttribute('B', 'W')
+    return schema
+
+
+def nonlinearData(schema, seed=0, numItems=500, leak=0.0):
+    """
+    B.Y is the square of the average X over the related A instances plus noise, which a linear test cannot see.
+    B.Z causes both B.W and B.Y nonlinearly, so that W and Y are dependent, but independent given Z unless leak is
+    non-zero, when Y also gets a share of the noise of W.
+    """
+    randomState = np.random.RandomState(seed)
+    dataStore = sampleSkeleton(schema, {'A': numItems, 'B': numItems, 'AB': 2 * numItems}, randomState)
+    dataStore.setAttribute('A', 'X', randomState.randn(numItems))
+    averages = dataStore.aggregate(RelationalVariable(['B', 'AB', 'A'], 'X'), AverageAggregator)
+    averages[np.isnan(averages)] = 0
+    z = randomState.randn(numItems)
+    dataStore.setAttribute('B', 'Z', z)
+    noiseW = 0.3 * randomState.randn(numItems)
+    dataStore.setAttribute('B', 'W', np.cos(2 * z) + noiseW)
+    dataStore.setAttribute('B', 'Y', averages ** 2 + np.cos(2 * z) + 0.3 * randomState.randn(numItems) + leak * noiseW)
+    return dataStore
+
+
+def relVar(path, attrName):
+    return RelationalVariable(path.split(), attrName)
+
+
+def testNonlinearDependence():
+    schema = twoEntitySchema()
+    ciTest = KernelCITest(schema, nonlinearData(schema), alpha=0.01)
+    assert not ciTest.isConditionallyIndependent(relVar('B AB A', 'X'), relVar('B', 'Y'), [])
+    assert not ciTest.isConditionallyIndependent(relVar('B', 'W'), relVar('B', 'Y'), [])
+    assert ciTest.isConditionallyIndependent(relVar('B AB A', 'X'), relVar('B', 'W'), [])
+
+
+def testCalibrationUnderConditionalIndependence():
+    schema = twoEntitySchema()
+    pvals = []
+    for seed in range(100):
+        ciTest = KernelCITest(schema, nonlinearData(schema, seed, numItems=300))
+        pvals.append(ciTest.testConditionalIndependence(relVar('B', 'W'), relVar('B', 'Y'), [relVar('B', 'Z')]).pval)
+    assert np.mean(np.array(pvals) < 0.05) <= 0.12
+    assert 0.3 < np.mean(pvals) < 0.7
+
+
+def testPowerUnderConditionalDependence():
+    schema = twoEntitySchema()
+    rejected = []
+    for seed in range(20):
+        ciTest = KernelCITest(schema, nonlinearData(schema, seed, numItems=300, leak=0.5))
+        rejected.append(not ciTest.isConditionallyIndependent(relVar('B', 'W'), relVar('B', 'Y'), [relVar('B', 'Z')]))
+    assert np.mean(rejected) >= 0.8
+
+
+def testReproducibleWithSeed():
+    schema = twoEntitySchema()
+    dataStore = nonlinearData(schema)
+    test = relVar('B', 'W'), relVar('B', 'Y'), [relVar('B', 'Z')]
+    assert KernelCITest(schema, dataStore, seed=3).testConditionalIndependence(*test).pval == \
+        KernelCITest(schema, dataStore, seed=3).testConditionalIndependence(*test).pval
@@ -0,0 +1,104 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pytest
+
+from causality.citest.PermutationCITest import PermutationCITest
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.model.Aggregator import AverageAggregator
+from causality.model.RelationalDependency import RelationalVariable
+from causality.model.Schema import Schema
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    schema.addAttribute('B', 'Z')
+    schema.addAttribute('B', 'W')
+    return schema
+
+
+def linearData(schema, seed=0, numItems=60, strength=0.0):
+    """
+    B.Z causes both B.W and B.Y, so that W and Y are independent given Z. B.Y also depends on the average X over
+    the related A instances with the given strength.
+    """
+    randomState = np.random.RandomState(seed)
+    dataStore = sampleSkeleton(schema, {'A': numItems, 'B': numItems, 'AB': 2 * numItems}, randomState)
+    dataStore.setAttribute('A', 'X', randomState.randn(numItems))
+    averages = dataStore.aggregate(RelationalVariable(['B', 'AB', 'A'], 'X'), AverageAggregator)
+    averages[np.isnan(averages)] = 0
+    z = randomState.randn(numItems)
+    dataStore.setAttribute('B', 'Z', z)
+    dataStore.setAttribute('B', 'W', z + 0.5 * randomState.randn(numItems))
+    dataStore.setAttribute('B', 'Y', z + strength * averages + 0.5 * randomState.randn(numItems))
+    return dataStore
+
+
+def relVar(path, attrName):
+    return RelationalVariable(path.split(), attrName)
+
+
+@pytest.mark.parametrize('conditional', [False, True])
+def testCalibrationUnderIndependence(conditional):
+    schema = twoEntitySchema()
+    pvals = []
+    for seed in range(100):
+        ciTest = PermutationCITest(schema, linearData(schema, seed), numPermutations=200, seed=seed)
+        if conditional:
+            result = ciTest.testConditionalIndependence(relVar('B', 'W'), relVar('B', 'Y'), [relVar('B', 'Z')])
+        else:
+            result = ciTest.testConditionalIndependence(relVar('B AB A', 'X'), relVar('B', 'W'), [])
+        pvals.append(result.pval)
+    assert np.mean(np.array(pvals) < 0.05) <= 0.12
+    assert 0.3 < np.mean(pvals) < 0.7
+
+
+def testPowerOnSmallSamples():
+    schema = twoEntitySchema()
+    rejected = []
+    for seed in range(20):
+        ciTest = PermutationCITest(schema, linearData(schema, seed, strength=1.0), soeThreshold=None, seed=seed)
+        rejected.append(not ciTest.isConditionallyIndependent(relVar('B AB A', 'X'), relVar('B', 'Y'),
+                                                              [relVar('B', 'Z')]))
+    assert np.mean(rejected) >= 0.8
+
+
+def testEffectSizeIsSquaredPartialCorrelation():
+    schema = twoEntitySchema()
+    dataStore = linearData(schema, strength=1.0)
+    result = PermutationCITest(schema, dataStore).testConditionalIndependence(relVar('B', 'W'), relVar('B', 'Y'),
+                                                                              [relVar('B', 'Z')])
+    w, y, z = (np.array(dataStore.aggregate(relVar('B', attrName)), dtype=float) for attrName in 'WYZ')
+    residuals = [values - np.polyval(np.polyfit(z, values, 1), z) for values in (w, y)]
+    assert result.effectSize == pytest.approx(np.corrcoef(*residuals)[0, 1] ** 2)
+
+
+def testEarlyStoppingAndReproducibility():
+    schema = twoEntitySchema()
+    dataStore = linearData(schema, strength=1.0)
+    test = relVar('B AB A', 'X'), relVar('B', 'Y'), [relVar('B', 'Z')]
+    result = PermutationCITest(schema, dataStore, numPermutations=1000, batchSize=50, seed=1) \
+        .testConditionalIndependence(*test)
+    # no permuted statistic exceeds that of a clear dependence, and sampling stops after a few batches
+    numPermuted = int(round(1.0 / result.pval)) - 1
+    assert numPermuted < 1000 and numPermuted % 50 == 0
+    assert PermutationCITest(schema, dataStore, seed=1).testConditionalIndependence(*test).pval == \
+        PermutationCITest(schema, dataStore, seed=1).testConditionalIndependence(*test).pval
@@ -0,0 +1,75 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.learning.RCD import RCD
+from causality.model.Distribution import ConstantDistribution
+from causality.modelspace import ModelGenerator
+from causality.modelspace import SchemaGenerator
+
+
+def randomModel(seed, hopThreshold=2):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, hopThreshold, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+class UncachedNeighborsRCD(RCD):
+    """
+    Computes the neighbors of a relational variable from its AGG on every call.
+    """
+
+    def getNeighbors(self, relVar2, phaseI=True):
+        self.getDependencyEdges()
+        self.neighborCache[relVar2.getBaseItemName()].clear()
+        return super(UncachedNeighborsRCD, self).getNeighbors(relVar2, phaseI)
+
+
+def runRcd(rcdClass, model, aggBackend, orderIndependentSkeleton):
+    rcd = rcdClass(model.schema, Oracle(model, 4), 2, depth=3)
+    rcd.aggBackend = aggBackend
+    rcd.identifyUndirectedDependencies(orderIndependentSkeleton=orderIndependentSkeleton)
+    rcd.orientDependencies()
+    return rcd
+
+
+@pytest.mark.parametrize('orderIndependentSkeleton', [False, True])
+@pytest.mark.parametrize('aggBackend', ['networkx', 'compact'])
+@pytest.mark.parametrize('seed', range(6))
+def testNeighborCacheDoesNotChangeResults(seed, aggBackend, orderIndependentSkeleton):
+    model = randomModel(seed)
+    cached = runRcd(RCD, model, aggBackend, orderIndependentSkeleton)
+    uncached = runRcd(UncachedNeighborsRCD, model, aggBackend, orderIndependentSkeleton)
+    assert set(cached.undirectedDependencies) == set(uncached.undirectedDependencies)
+    assert set(cached.orientedDependencies) == set(uncached.orientedDependencies)
+    assert cached.sepsets == uncached.sepsets
+    assert cached.ciRecord == uncached.ciRecord
+
+    # every neighbor set still cached at the end is that of the final AGGs
+    for cache in cached.neighborCache.values():
+        for (relVar, phaseI), neighbors in cache.items():
+            assert neighbors == uncached.getNeighbors(relVar, phaseI)
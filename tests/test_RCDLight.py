@@ -0,0 +1,440 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import itertools
+import os
+import pickle
+import random
+import subprocess
+import sys
+
+import pytest
+
+from causality.citest.CITest import Oracle
+from causality.citest.IncrementalLinearCITest import IncrementalLinearCITest
+from causality.datastore.DataGenerator import generateData
+from causality.datastore.DataGenerator import getAttributeOrder
+from causality.learning import ModelEvaluation
+from causality.learning.RCD import RCD
+from causality.model.Distribution import ConstantDistribution
+from causality.model.Model import Model
+from causality.model.RelationalDependency import RelationalDependency
+from causality.model.Schema import Schema
+from causality.modelspace import ModelGenerator
+from causality.modelspace import RelationalSpace
+from causality.modelspace import SchemaGenerator
+from shlee.RCDLight import BackgroundKnowledge
+from shlee.RCDLight import Budget
+from shlee.RCDLight import RCDLight
+from shlee.RCDLight import sweepRCDLight
+
+
+class CountingOracle(Oracle):
+    '''
+    An oracle that counts the CI outcomes looked at, whether tested or found in a cache.
+    '''
+
+    def __init__(self, model, hop_threshold):
+        super(CountingOracle, self).__init__(model, hop_threshold)
+        self.num_decided = 0
+
+    def decide(self, result):
+        self.num_decided += 1
+        return result
+
+
+def random_model(seed, hop_threshold=2):
+    rng = random.Random(seed)
+    while True:
+        random.seed(rng.random())
+        schema = SchemaGenerator.generateSchema(rng.randint(2, 3), rng.randint(1, 3),
+                                                entityAttrDistribution=ConstantDistribution(2),
+                                                relationshipAttrDistribution=ConstantDistribution(1),
+                                                allowCycles=True, oneRelationshipPerPair=False)
+        try:
+            return ModelGenerator.generateModel(schema, hop_threshold, rng.randint(3, 8), maxNumParents=3)
+        except Exception:
+            continue
+
+
+@pytest.mark.parametrize('order_independent', [False, True])
+@pytest.mark.parametrize('seed', range(8))
+def test_warm_start_matches_cold_run(seed, order_independent):
+    model = random_model(seed)
+    oracle = CountingOracle(model, 4)
+    previous = RCDLight(model.schema, oracle, 1)
+    previous.identifyUndirectedDependencies(order_independent=order_independent)
+
+    oracle.num_decided = 0
+    warm = RCDLight.warm_start(model.schema, oracle, pickle.loads(pickle.dumps(previous.get_state())), 2)
+    warm_decided = oracle.num_decided
+
+    oracle.num_decided = 0
+    cold = RCDLight(model.schema, oracle, 2, ci_cache=previous.get_state()['ci_cache'].copy())
+    cold.identifyUndirectedDependencies(order_independent=order_independent)
+    assert warm.undirectedDependencies == cold.undirectedDependencies
+    # conditioning sets already tested by the previous run are not looked at again
+    assert warm_decided < oracle.num_decided
+
+
+def test_warm_start_passes_budget_and_callback():
+    model = random_model(0)
+    oracle = Oracle(model, 4)
+    previous = RCDLight(model.schema, oracle, 1)
+    previous.identifyUndirectedDependencies()
+
+    steps = []
+    warm = RCDLight.warm_start(model.schema, oracle, previous, 2, budget=Budget(max_tests=0),
+                               progress_callback=lambda phase, step, rcdl: steps.append((phase, step)))
+    assert warm.budgetExhausted
+    assert warm.ciRecord['total'] == 0
+
+    warm = RCDLight.warm_start(model.schema, oracle, previous, 2,
+                               progress_callback=lambda phase, step, rcdl: steps.append((phase, step)))
+    assert not warm.budgetExhausted
+    assert steps and all(phase == 'Phase I' for phase, _ in steps)
+
+
+def test_warm_start_after_exhausted_budget():
+    model = random_model(1)
+    oracle = Oracle(model, 4)
+    previous = RCDLight(model.schema, oracle, 1, budget=Budget(max_tests=3))
+    previous.identifyUndirectedDependencies()
+    assert previous.budgetExhausted
+
+    warm = RCDLight.warm_start(model.schema, oracle, previous, 2)
+    cold = RCDLight(model.schema, oracle, 2)
+    cold.identifyUndirectedDependencies()
+    assert warm.undirectedDependencies == cold.undirectedDependencies
+
+
+def test_warm_start_rejects_smaller_hop_threshold():
+    model = random_model(0)
+    previous = RCDLight(model.schema, Oracle(model, 4), 2)
+    previous.identifyUndirectedDependencies()
+    with pytest.raises(Exception):
+        RCDLight.warm_start(model.schema, Oracle(model, 4), previous, 1)
+
+
+def seeded_run(model_seed, rng_seed):
+    '''
+    Learns a random model from finite data, where the order of the CI tests can affect the outcome, and returns
+    the oriented dependencies and the CI tests issued, in order, as strings.
+    '''
+    model = random_model(model_seed)
+    sizes = {item.name: 150 for item in model.schema.getSchemaItems()}
+    ci_tester = IncrementalLinearCITest(model.schema, generateData(model, sizes, seed=model_seed), alpha=0.1)
+    rcdl = RCDLight(model.schema, ci_tester, 2, rng=rng_seed)
+    rcdl.identifyUndirectedDependencies()
+    rcdl.orientDependencies()
+    return sorted(map(str, rcdl.orientedDependencies)), [str(ci_key) for ci_key in rcdl._ci_cache]
+
+
+@pytest.mark.parametrize('model_seed', range(4))
+def test_same_seed_same_orientations(model_seed):
+    assert seeded_run(model_seed, 7) == seeded_run(model_seed, 7)
+
+
+def test_same_seed_same_orientations_across_hash_seeds():
+    # RUTs are ranked once, statically, and ties are broken by the seeded shuffle of a canonical order, so runs in
+    # processes with different hash seeds agree
+    script = 'import test_RCDLight; print(test_RCDLight.seeded_run(0, 7))'
+    outputs = set()
+    for hash_seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=hash_seed, PYTHONPATH=os.pathsep.join(sys.path))
+        outputs.add(subprocess.check_output([sys.executable, '-c', script], env=env,
+                                            cwd=os.path.dirname(os.path.abspath(__file__))))
+    assert len(outputs) == 1
+    assert outputs.pop().decode().strip() == str(seeded_run(0, 7))
+
+
+class ExhaustiveRCDLight(RCDLight):
+    '''
+    Tests every RUT of a group, as if no orientation were ever implied.
+    '''
+
+    @staticmethod
+    def _is_resolved(cdg, non_colliders, x, y, z):
+        return False
+
+
+def learn(model, ci_tester, hop_threshold=2, order_independent=False, processes=None, **kwargs):
+    rcdl = kwargs.pop('learner', RCDLight)(model.schema, ci_tester, hop_threshold, **kwargs)
+    rcdl.identifyUndirectedDependencies(order_independent=order_independent)
+    rcdl.orientDependencies(processes=processes)
+    return rcdl
+
+
+def finite_data_tester(model, seed, size=150):
+    sizes = {item.name: size for item in model.schema.getSchemaItems()}
+    return IncrementalLinearCITest(model.schema, generateData(model, sizes, seed=seed), alpha=0.1)
+
+
+def naive_pc_stable_skeleton(schema, ci_tester, hop_threshold):
+    '''
+    Phase I as in PC-stable, written out plainly: at each depth, every remaining dependency is tested against the
+    neighbor sets frozen at the start of the depth, and the separated pairs are removed at its end.
+    '''
+    potential_deps = RelationalSpace.getRelationalDependencies(schema, hop_threshold)
+    causes = {}
+    for dep in potential_deps:
+        causes.setdefault(dep.relVar2, set()).add(dep.relVar1)
+    to_be_tested = set(potential_deps)
+    for d in itertools.count():
+        frozen_causes = {effect: set(effect_causes) for effect, effect_causes in causes.items()}
+        to_be_tested = {dep for dep in to_be_tested if d <= len(frozen_causes[dep.relVar2]) - 1}
+        separated = {dep for dep in to_be_tested
+                     if any(ci_tester.decide(ci_tester.testConditionalIndependence(dep.relVar1, dep.relVar2, condition))
+                            for condition in itertools.combinations(sorted(frozen_causes[dep.relVar2] - {dep.relVar1}),
+                                                                    d))}
+        for dep in separated | {dep.reverse() for dep in separated}:
+            causes[dep.relVar2].discard(dep.relVar1)
+            to_be_tested.discard(dep)
+        if not to_be_tested:
+            return {RelationalDependency(c, e) for e, cs in causes.items() for c in cs}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pc_stable_matches_sequential_with_oracle(seed):
+    model = random_model(seed)
+    oracle = Oracle(model, 4)
+    sequential = learn(model, oracle)
+    stable = learn(model, oracle, order_independent=True)
+    assert ModelEvaluation.skeletonPrecision(model, stable.undirectedDependencies) == 1.0
+    assert ModelEvaluation.skeletonRecall(model, stable.undirectedDependencies) == 1.0
+    assert stable.undirectedDependencies == sequential.undirectedDependencies
+    assert stable.orientedDependencies == sequential.orientedDependencies
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_pc_stable_matches_naive_pc_stable_on_data(seed):
+    model = random_model(seed)
+    ci_tester = finite_data_tester(model, seed)
+    stable = RCDLight(model.schema, ci_tester, 2)
+    stable.identifyUndirectedDependencies(order_independent=True)
+    assert stable.undirectedDependencies == naive_pc_stable_skeleton(model.schema, ci_tester, 2)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_resolved_rut_groups_lose_no_orientation(seed):
+    model = random_model(seed)
+    oracle = Oracle(model, 4)
+    rcdl = learn(model, oracle)
+    assert ModelEvaluation.orientedPrecision(model, rcdl.orientedDependencies) == 1.0
+    assert rcdl.orientedDependencies == learn(model, oracle, learner=ExhaustiveRCDLight).orientedDependencies
+
+    rcd = RCD(model.schema, oracle, 2, depth=4)
+    rcd.identifyUndirectedDependencies()
+    rcd.orientDependencies()
+    assert ModelEvaluation.orientedRecall(model, rcdl.orientedDependencies) >= \
+        ModelEvaluation.orientedRecall(model, rcd.orientedDependencies)
+
+
+class CountingLinearCITest(IncrementalLinearCITest):
+    '''
+    A linear tester that counts the tests it runs.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(CountingLinearCITest, self).__init__(*args, **kwargs)
+        self.num_tested = 0
+
+    def testConditionalIndependence(self, *args):
+        self.num_tested += 1
+        return super(CountingLinearCITest, self).testConditionalIndependence(*args)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_sweep_matches_separate_runs(seed):
+    model = random_model(seed)
+    sizes = {item.name: 150 for item in model.schema.getSchemaItems()}
+    data = generateData(model, sizes, seed=seed)
+    thresholds = [(0.01, 0.0), (0.05, 0.01), (0.2, 0.05)]
+
+    ci_tester = CountingLinearCITest(model.schema, data, alpha=0.1, soeThreshold=0.02)
+    swept = sweepRCDLight(model.schema, ci_tester, 2, thresholds, rng=seed)
+    assert (ci_tester.alpha, ci_tester.soeThreshold) == (0.1, 0.02)
+
+    num_tested = 0
+    for alpha, soe_threshold in thresholds:
+        separate_tester = CountingLinearCITest(model.schema, data, alpha=alpha, soeThreshold=soe_threshold)
+        rcdl = learn(model, separate_tester, rng=seed)
+        assert swept[alpha, soe_threshold] == rcdl.orientedDependencies
+        num_tested += separate_tester.num_tested
+    # later runs reuse the p-values and effect sizes of the tests earlier ones issued
+    assert ci_tester.num_tested < num_tested
+
+
+class RecordingOracle(Oracle):
+    '''
+    An oracle that records the sizes of the conditioning sets it is asked about.
+    '''
+
+    def __init__(self, model, hop_threshold):
+        super(RecordingOracle, self).__init__(model, hop_threshold)
+        self.condition_sizes = []
+
+    def testConditionalIndependence(self, rv1, rv2, condition):
+        self.condition_sizes.append(len(condition))
+        return super(RecordingOracle, self).testConditionalIndependence(rv1, rv2, condition)
+
+
+@pytest.mark.parametrize('order_independent', [False, True])
+@pytest.mark.parametrize('max_tests', [0, 5, 20])
+def test_test_budget_returns_a_superset_skeleton(max_tests, order_independent):
+    model = random_model(4)
+    complete = learn(model, Oracle(model, 4), order_independent=order_independent)
+    oracle = RecordingOracle(model, 4)
+    limited = learn(model, oracle, order_independent=order_independent, budget=Budget(max_tests=max_tests))
+    assert limited.budgetExhausted
+    assert limited.ciRecord['total'] == len(oracle.condition_sizes) <= max_tests
+    assert limited.undirectedDependencies >= complete.undirectedDependencies
+
+
+def test_depth_budget_limits_conditioning_sets():
+    model = random_model(5)
+    oracle = RecordingOracle(model, 4)
+    limited = learn(model, oracle, budget=Budget(max_depth=0))
+    assert set(oracle.condition_sizes) == {0}
+    assert limited.undirectedDependencies >= learn(model, Oracle(model, 4)).undirectedDependencies
+
+
+def test_time_budget():
+    model = random_model(4)
+    limited = learn(model, Oracle(model, 4), budget=Budget(max_time=0))
+    assert limited.budgetExhausted
+    assert limited.ciRecord['total'] == 0
+    assert not learn(model, Oracle(model, 4), budget=Budget(max_time=60)).budgetExhausted
+
+
+@pytest.mark.parametrize('order_independent', [False, True])
+def test_progress_callback(order_independent):
+    model = random_model(5)
+    steps = []
+
+    def record(phase, step, rcdl):
+        steps.append((phase, step, set(rcdl.undirectedDependencies), rcdl.orientedDependencies))
+
+    rcdl = learn(model, Oracle(model, 4), order_independent=order_independent, progress_callback=record)
+    phase_one = [step for phase, step, _, _ in steps if phase == 'Phase I']
+    phase_two = [step for phase, step, _, _ in steps if phase == 'Phase II']
+    assert phase_one == list(range(len(phase_one))) and phase_one
+    assert phase_two == list(range(len(phase_two))) and phase_two
+    assert [phase for phase, _, _, _ in steps] == ['Phase I'] * len(phase_one) + ['Phase II'] * len(phase_two)
+    # skeletons only shrink, down to the final one, and Phase II reports the final orientations last
+    skeletons = [skeleton for phase, _, skeleton, _ in steps if phase == 'Phase I']
+    assert all(larger >= smaller for larger, smaller in zip(skeletons, skeletons[1:]))
+    assert skeletons[-1] == set(rcdl.undirectedDependencies)
+    assert steps[-1][3] == rcdl.orientedDependencies
+
+
+def test_background_knowledge_constraints():
+    knowledge = BackgroundKnowledge(forbidden=[('X', 'Y')], required=[('Z', 'W')], tiers=[['X'], ['Y', 'Z']])
+    assert not knowledge.can_cause('X', 'Y') and knowledge.can_cause('Y', 'X') is False
+    assert knowledge.can_be_adjacent('X', 'Z') and not knowledge.can_cause('Z', 'X')
+    assert not knowledge.can_cause('W', 'Z') and knowledge.can_cause('V', 'X')
+    with pytest.raises(Exception):
+        BackgroundKnowledge(required=[('Y', 'X')], tiers=[['X'], ['Y']])
+    with pytest.raises(Exception):
+        BackgroundKnowledge(tiers=[['X'], ['X', 'Y']])
+
+
+def attribute_classes_of(model):
+    return {(dep.relVar1.attrName, dep.relVar2.attrName) for dep in model.dependencies}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_true_tiers_keep_the_true_model(seed):
+    model = random_model(seed)
+    tiers = [[attr_name] for _, attr_name in getAttributeOrder(model)]
+    plain = learn(model, CountingOracle(model, 4))
+    oracle = CountingOracle(model, 4)
+    informed = learn(model, oracle, background_knowledge=BackgroundKnowledge(tiers=tiers))
+    assert ModelEvaluation.skeletonPrecision(model, informed.undirectedDependencies) == 1.0
+    assert ModelEvaluation.skeletonRecall(model, informed.undirectedDependencies) == 1.0
+    assert ModelEvaluation.orientedPrecision(model, informed.orientedDependencies) == 1.0
+    # a total order of the attribute classes orients every dependency
+    assert ModelEvaluation.orientedRecall(model, informed.orientedDependencies) == 1.0
+    assert informed.ciRecord['total'] <= plain.ciRecord['total']
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_forbidden_edges_are_never_learned(seed):
+    model = random_model(seed)
+    attr_names = sorted({attr_name for _, attr_name in getAttributeOrder(model)})
+    true_pairs = attribute_classes_of(model)
+    # forbid a true dependency in the direction it does not take, and a pair with no dependency altogether
+    forbidden = [(y, x) for x, y in sorted(true_pairs)[:1]]
+    forbidden += [(x, y) for x, y in itertools.permutations(attr_names, 2)
+                  if (x, y) not in true_pairs and (y, x) not in true_pairs][:2]
+    knowledge = BackgroundKnowledge(forbidden=forbidden)
+    rcdl = learn(model, Oracle(model, 4), background_knowledge=knowledge)
+    assert ModelEvaluation.skeletonRecall(model, rcdl.undirectedDependencies) == 1.0
+    assert all(knowledge.can_cause(dep.relVar1.attrName, dep.relVar2.attrName)
+               for dep in rcdl.orientedDependencies)
+
+
+class ComponentCountingRCDLight(RCDLight):
+    '''
+    Records the number of components oriented in parallel (0 for a sequential Phase II).
+    '''
+    num_components = 0
+
+    def _orient_components_in_parallel(self, cdg, components, processes):
+        self.num_components = len(components)
+        return super(ComponentCountingRCDLight, self)._orient_components_in_parallel(cdg, components, processes)
+
+
+def two_component_model():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    for attr_name in ('X1', 'X2', 'X3'):
+        schema.addAttribute('A', attr_name)
+    for attr_name in ('Y1', 'Y2', 'Y3'):
+        schema.addAttribute('B', attr_name)
+    return Model(schema, ['[B, AB, A].X1 -> [B].Y1', '[B].Y2 -> [B].Y1',
+                          '[A, AB, B].Y3 -> [A].X2', '[A].X3 -> [A].X2'])
+
+
+def assert_same_run(sequential, parallel):
+    assert parallel.undirectedDependencies == sequential.undirectedDependencies
+    assert parallel.orientedDependencies == sequential.orientedDependencies
+    assert parallel._sepsets == sequential._sepsets
+    assert parallel.ciRecord == sequential.ciRecord
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_parallel_orientation_matches_sequential(seed):
+    model = random_model(seed)
+    sequential = learn(model, Oracle(model, 4), rng=seed)
+    assert_same_run(sequential, learn(model, Oracle(model, 4), rng=seed, processes=3))
+
+
+def test_parallel_orientation_of_two_components():
+    model = two_component_model()
+    sequential = learn(model, Oracle(model, 4), rng=0)
+    parallel = learn(model, Oracle(model, 4), rng=0, processes=3, learner=ComponentCountingRCDLight)
+    assert parallel.num_components == 2
+    assert_same_run(sequential, parallel)
+    assert ModelEvaluation.orientedRecall(model, parallel.orientedDependencies) == 1.0
+
+    sizes = {item.name: 200 for item in model.schema.getSchemaItems()}
+    data = generateData(model, sizes, seed=0)
+    sequential = learn(model, IncrementalLinearCITest(model.schema, data), rng=0)
+    parallel = learn(model, IncrementalLinearCITest(model.schema, data), rng=0, processes=3,
+                     learner=ComponentCountingRCDLight)
+    assert_same_run(sequential, parallel)
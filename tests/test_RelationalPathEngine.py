@@ -0,0 +1,101 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import pickle
+import random
+
+import pytest
+
+from causality.model.Distribution import ConstantDistribution
+from causality.model.Schema import Schema
+from causality.modelspace import RelationalPathEngine
+from causality.modelspace import RelationalSpace
+from causality.modelspace import SchemaGenerator
+
+
+def randomSchema(seed):
+    random.seed(seed)
+    return SchemaGenerator.generateSchema(random.randint(2, 3), random.randint(1, 3),
+                                          entityAttrDistribution=ConstantDistribution(2),
+                                          relationshipAttrDistribution=ConstantDistribution(1),
+                                          allowCycles=True, oneRelationshipPerPair=False)
+
+
+def selfLoopSchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addRelationship('AA', ('A', Schema.MANY), ('A', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('A', 'Y')
+    return schema
+
+
+@pytest.mark.parametrize('seed', range(15))
+def testDependenciesMatchRelationalSpace(seed):
+    schema = randomSchema(seed)
+    engine = RelationalPathEngine.RelationalPathEngine(schema)
+    for hopThreshold in range(5):
+        expected = RelationalSpace.getRelationalDependencies(schema, hopThreshold)
+        actual = engine.getRelationalDependencies(hopThreshold)
+        assert len(actual) == len(set(actual))
+        assert set(actual) == set(expected)
+
+
+def testNoFeedbackDependencies():
+    schema = selfLoopSchema()
+    engine = RelationalPathEngine.RelationalPathEngine(schema)
+    dependencies = engine.getRelationalDependencies(4)
+    assert set(dependencies) == set(RelationalSpace.getRelationalDependencies(schema, 4))
+    assert all(dependency.relVar1.path[-1] != dependency.relVar2.path[0] or
+               dependency.relVar1.attrName != dependency.relVar2.attrName for dependency in dependencies)
+
+
+def testCacheRoundTrip(tmp_path):
+    schema = randomSchema(3)
+    cacheDir = str(tmp_path)
+    expected = RelationalPathEngine.RelationalPathEngine(schema, cacheDir).getRelationalDependencies(3)
+    assert os.listdir(cacheDir)
+
+    reloaded = RelationalPathEngine.RelationalPathEngine(schema, cacheDir)
+    assert reloaded._load(3)
+    assert reloaded.getRelationalDependencies(3) == expected
+
+
+def testStaleCacheIsIgnored(tmp_path):
+    schema = randomSchema(3)
+    cacheDir = str(tmp_path)
+    engine = RelationalPathEngine.RelationalPathEngine(schema, cacheDir)
+    expected = engine.getRelationalDependencies(3)
+    cacheFile = engine._cacheFile(3)
+
+    # paths of another schema, an old format without a version, and an unreadable file
+    with open(cacheFile, 'rb') as f:
+        cached = pickle.load(f)
+    for stale in (dict(cached, fingerprint='0' * 40), cached['pathsByHop'], dict(cached, formatVersion=0)):
+        with open(cacheFile, 'wb') as f:
+            pickle.dump(stale, f)
+        reloaded = RelationalPathEngine.RelationalPathEngine(schema, cacheDir)
+        assert not reloaded._load(3)
+        assert reloaded.getRelationalDependencies(3) == expected
+    with open(cacheFile, 'wb') as f:
+        f.write(b'not a pickle')
+    assert RelationalPathEngine.RelationalPathEngine(schema, cacheDir).getRelationalDependencies(3) == expected
+
+
+def testEnginesAreSharedBySchemaFingerprint():
+    assert RelationalPathEngine.getEngine(randomSchema(5)) is RelationalPathEngine.getEngine(randomSchema(5))
+    assert RelationalPathEngine.schemaFingerprint(randomSchema(5)) != \
+        RelationalPathEngine.schemaFingerprint(selfLoopSchema())
@@ -0,0 +1,144 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+import pytest
+
+from causality.citest.CategoricalCITest import CategoricalCITest
+from causality.citest.CITest import CITest
+from causality.citest.CITest import CITestResult
+from causality.citest.CITest import ScreenedCITestResult
+from causality.citest.CITest import ScreeningCITest
+from causality.citest.CITest import getAggregatedData
+from causality.datastore.DataGenerator import sampleSkeleton
+from causality.model.Schema import Schema
+
+
+class SubsamplingCITest(CITest):
+    """
+    Returns screenPval on subsamples and fullPval on the full population, counting the tests of each kind.
+    """
+
+    def __init__(self, screenPval, fullPval, alpha=0.05):
+        self.screenPval = screenPval
+        self.fullPval = fullPval
+        self.alpha = alpha
+        self.soeThreshold = 0.01
+        self.record = {'screen': 0, 'full': 0}
+
+
+    def testConditionalIndependence(self, relVar1Str, relVar2Str, condRelVarStrs, sampleRate=1.0, sampleSeed=0):
+        if sampleRate < 1:
+            self.record['screen'] += 1
+            return CITestResult(self.screenPval, 0.5)
+        self.record['full'] += 1
+        return CITestResult(self.fullPval, 0.5)
+
+
+    def decide(self, result):
+        return result.isIndependent(self.alpha, self.soeThreshold)
+
+
+def twoEntitySchema():
+    schema = Schema()
+    schema.addEntity('A')
+    schema.addEntity('B')
+    schema.addRelationship('AB', ('A', Schema.MANY), ('B', Schema.MANY))
+    schema.addAttribute('A', 'X')
+    schema.addAttribute('B', 'Y')
+    return schema
+
+
+def testRejectsTestersWithoutSubsampling():
+    schema = twoEntitySchema()
+    with pytest.raises(Exception):
+        ScreeningCITest(CategoricalCITest(schema, sampleSkeleton(schema, {'A': 10, 'B': 10, 'AB': 10},
+                                                                 np.random.RandomState(0))))
+
+
+@pytest.mark.parametrize('screenPval, independent', [(1e-6, False), (0.5, True)])
+def testDecisiveScreenSkipsFullTest(screenPval, independent):
+    ciTest = SubsamplingCITest(screenPval, fullPval=0.04)
+    screening = ScreeningCITest(ciTest)
+    result = screening.testConditionalIndependence('[A].X', '[A].X', [])
+    assert isinstance(result, ScreenedCITestResult)
+    assert screening.decide(result) == independent
+    assert ciTest.record == {'screen': 1, 'full': 0}
+    assert screening.screenRecord == {'screened': 1, 'full': 0}
+
+
+def testIndecisiveScreenRunsFullTest():
+    ciTest = SubsamplingCITest(0.01, fullPval=0.2)
+    screening = ScreeningCITest(ciTest)
+    result = screening.testConditionalIndependence('[A].X', '[A].X', [])
+    assert not isinstance(result, ScreenedCITestResult)
+    assert result.pval == 0.2
+    assert screening.decide(result)
+    assert ciTest.record == {'screen': 1, 'full': 1}
+
+
+def testCachedScreenIsDecidedAgainUnderOtherThresholds():
+    # decisive at alpha = 0.05 (pval >= 0.22), but not at alpha = 0.5 (pval >= 0.71)
+    ciTest = SubsamplingCITest(0.3, fullPval=0.4)
+    screening = ScreeningCITest(ciTest)
+    result = screening.testConditionalIndependence('[A].X', '[A].X', [])
+    assert screening.decide(result)
+
+    # a plain decision on the screen p-value would say independent; the full test says dependent
+    screening.alpha = 0.5
+    assert not screening.decide(result)
+    assert not screening.decide(result)
+    assert ciTest.record == {'screen': 1, 'full': 1}
+    assert result.fullResult.pval == 0.4
+
+    screening.alpha = 0.05
+    assert screening.decide(result)
+
+
+def testCachedScreenStaysDecisive():
+    ciTest = SubsamplingCITest(1e-9, fullPval=0.5)
+    screening = ScreeningCITest(ciTest)
+    result = screening.testConditionalIndependence('[A].X', '[A].X', [])
+    screening.alpha = 0.01
+    assert not screening.decide(result)
+    assert ciTest.record == {'screen': 1, 'full': 0}
+
+
+class UnindexedDataStore(object):
+    """
+    A data store without getItemIds, which getAggregatedData can only filter after aggregating.
+    """
+
+    def __init__(self, dataStore):
+        self.dataStore = dataStore
+
+
+    def getValuesForRelVarAggrs(self, schema, baseItemName, relVarAggrs):
+        return self.dataStore.getValuesForRelVarAggrs(schema, baseItemName, relVarAggrs)
+
+
+def testPreJoinSamplingMatchesFiltering():
+    schema = twoEntitySchema()
+    randomState = np.random.RandomState(0)
+    dataStore = sampleSkeleton(schema, {'A': 500, 'B': 500, 'AB': 1000}, randomState)
+    dataStore.setAttribute('A', 'X', randomState.randn(500))
+    dataStore.setAttribute('B', 'Y', randomState.randn(500))
+
+    for sampleRate in (0.1, 0.5, 1.0):
+        sampled = getAggregatedData(schema, dataStore, '[B, AB, A].X', '[B].Y', [], sampleRate, sampleSeed=3)
+        filtered = getAggregatedData(schema, UnindexedDataStore(dataStore), '[B, AB, A].X', '[B].Y', [],
+                                     sampleRate, sampleSeed=3)
+        assert sampled == filtered
+    assert 25 < len(getAggregatedData(schema, dataStore, '[B, AB, A].X', '[B].Y', [], 0.1)[0]) < 75
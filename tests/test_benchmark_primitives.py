@@ -0,0 +1,40 @@
+# Copyright 2015 Sanghack Lee
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from shlee import benchmark_primitives
+from shlee.RCDLight import PDAG
+
+
+def test_graphs_use_attribute_name_vertices():
+    graphs = benchmark_primitives.Graphs(20, 0.2, seed=0)
+    assert all(isinstance(v, str) for v in graphs.vertices)
+    assert isinstance(graphs.pdag, PDAG)
+    assert graphs.edges
+
+
+def test_run_and_compare(tmp_path):
+    results = benchmark_primitives.run_benchmarks([10], 0.2, repeat=1, min_time=0.001, selected=['PDAG.pa'])
+    assert set(results) == {'PDAG.pa n=10'}
+    assert set(results['PDAG.pa n=10']) == {'ops_per_sec', 'peak_traced_bytes_per_op',
+                                            'retained_traced_bytes_per_op', 'retained_blocks_per_op'}
+
+    faster = {key: dict(result, ops_per_sec=2 * result['ops_per_sec']) for key, result in results.items()}
+    assert benchmark_primitives.compare(results, faster, 0.2) == ['PDAG.pa n=10']
+    assert benchmark_primitives.compare(faster, results, 0.2) == []
+
+    baseline = str(tmp_path / 'baseline.json')
+    args = ['--sizes', '10', '--repeat', '1', '--min-time', '0.001', '--only', 'Ancestral']
+    assert benchmark_primitives.main(args + ['--save', baseline]) == 0
+    assert benchmark_primitives.main(args + ['--compare', baseline, '--tolerance', '0.99']) == 0